@@ -0,0 +1,85 @@
+"""
+Per-chunk CPU time of the VoiceInput buffering during one long utterance:
+the previous Python list buffers versus RingBuffer + GrowableBuffer.
+
+Only the buffering is measured, the VAD model is left out. Run from the backend directory:
+
+    python benchmarks/audio_buffers.py --seconds 60 --block-size 1024
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from services.Input.AudioBuffers import RingBuffer, GrowableBuffer
+
+SAMPLING_RATE = 16000
+CHUNK_SIZE = 512
+
+
+def run_lists(blocks):
+    """The buffering VoiceInput._process_audio used to do"""
+    tmp_audio_buffer = []
+    sentence_audio_buffer = []
+    chunk_times = []
+    for block in blocks:
+        tmp_audio_buffer.extend(block)
+        while len(tmp_audio_buffer) >= CHUNK_SIZE:
+            start = time.perf_counter()
+            chunk = np.array(tmp_audio_buffer[:CHUNK_SIZE])
+            tmp_audio_buffer = tmp_audio_buffer[CHUNK_SIZE:]
+            sentence_audio_buffer.extend(chunk)
+            chunk_times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    utterance = np.array(sentence_audio_buffer)
+    return chunk_times, time.perf_counter() - start, len(utterance)
+
+
+def run_ring(blocks):
+    ring = RingBuffer(CHUNK_SIZE * 250)
+    sentence_audio_buffer = GrowableBuffer(SAMPLING_RATE * 10)
+    chunk_times = []
+    for block in blocks:
+        ring.write(block)
+        while ring.available >= CHUNK_SIZE:
+            start = time.perf_counter()
+            chunk = ring.read(CHUNK_SIZE)
+            sentence_audio_buffer.append(chunk)
+            chunk_times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    utterance = sentence_audio_buffer.view()
+    return chunk_times, time.perf_counter() - start, len(utterance)
+
+
+def report(name, chunk_times, finalize_time):
+    times = np.array(chunk_times) * 1e6
+    print(f"{name:>6}: mean {times.mean():8.1f} us/chunk, p95 {np.percentile(times, 95):8.1f} us, "
+          f"max {times.max():8.1f} us, last second {times[-SAMPLING_RATE // CHUNK_SIZE:].mean():8.1f} us/chunk, "
+          f"utterance array {finalize_time * 1e3:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=60, help="Length of the utterance")
+    parser.add_argument("--block-size", type=int, default=1024, help="Samples per sounddevice callback")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal(int(args.seconds * SAMPLING_RATE)) * 0.1).astype(np.float32)
+    blocks = [audio[i:i + args.block_size] for i in range(0, len(audio), args.block_size)]
+
+    print(f"{args.seconds:.0f} s utterance, {len(blocks)} blocks of {args.block_size} samples")
+    list_times, list_finalize, _ = run_lists(blocks)
+    report("list", list_times, list_finalize)
+    ring_times, ring_finalize, _ = run_ring(blocks)
+    report("ring", ring_times, ring_finalize)
+    print(f"speedup: {np.mean(list_times) / np.mean(ring_times):.1f}x per chunk")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Latency and text recall of VisionInput.perform_ocr across OCR settings, over a folder of saved screenshots.
+
+Recall is the share of reference words found by a setting. The reference is <name>.txt next to a
+screenshot when present, otherwise the words found by the slowest, most thorough setting
+(beamsearch, full resolution, no tiling). Run from the backend directory:
+
+    python benchmarks/ocr.py screenshots/ --scales 0.5 1.0 --tiles 0 960 --decoders greedy beamsearch
+"""
+import argparse
+import itertools
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+from PIL import Image
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from services.Input.VisionInput import VisionInput
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+
+def words(text):
+    return Counter(re.findall(r"\w+", text.lower()))
+
+
+def recall(reference, found):
+    total = sum(reference.values())
+    if total == 0:
+        return 1.0
+    return sum((reference & found).values()) / total
+
+
+def run_setting(vision_input, images, decoder, scale, tile_size, repeats):
+    latencies, texts = [], []
+    for image in images:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            results = vision_input.perform_ocr(image, scale_factor=scale, decoder=decoder, tile_size=tile_size,
+                                               static_regions=[])
+            latencies.append(time.perf_counter() - start)
+        texts.append(vision_input.get_detected_text(results))
+    return np.array(latencies), texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", help="Folder of screenshots")
+    parser.add_argument("--decoders", nargs="+", default=["greedy", "beamsearch"])
+    parser.add_argument("--scales", nargs="+", type=float, default=[0.5, 1.0])
+    parser.add_argument("--tiles", nargs="+", type=int, default=[0, 960], help="Tile sizes, 0 disables tiling")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs per image and setting")
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.folder, f) for f in os.listdir(args.folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if not paths:
+        parser.error(f"No screenshots in {args.folder}")
+    images = [Image.open(path).convert("RGB") for path in paths]
+
+    vision_input = VisionInput(device=args.device)
+    if vision_input.load_ocr_reader() is None:
+        sys.exit("Failed to load the OCR reader")
+    vision_input.perform_ocr(images[0], scale_factor=min(args.scales))  # Warm-up
+
+    references = []
+    for path in paths:
+        truth = os.path.splitext(path)[0] + ".txt"
+        references.append(words(open(truth, encoding="utf-8").read()) if os.path.exists(truth) else None)
+    if any(reference is None for reference in references):
+        print("Computing reference text with beamsearch at full resolution...")
+        _, reference_texts = run_setting(vision_input, images, "beamsearch", 1.0, 0, 1)
+        references = [r if r is not None else words(t) for r, t in zip(references, reference_texts)]
+
+    print(f"{len(images)} screenshots\n")
+    print(f"{'decoder':>12} {'scale':>6} {'tile':>6} | {'mean ms':>9} {'p95 ms':>9} | {'recall':>7}")
+    for decoder, scale, tile_size in itertools.product(args.decoders, args.scales, args.tiles):
+        latencies, texts = run_setting(vision_input, images, decoder, scale, tile_size, args.repeats)
+        mean_recall = np.mean([recall(reference, words(text)) for reference, text in zip(references, texts)])
+        latencies *= 1000
+        print(f"{decoder:>12} {scale:>6.2f} {tile_size:>6} | {latencies.mean():>9.0f} "
+              f"{np.percentile(latencies, 95):>9.0f} | {mean_recall:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
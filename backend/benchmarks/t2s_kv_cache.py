@@ -0,0 +1,93 @@
+"""
+Tokens/sec of the T2S decode loop with the growing (torch.cat) KV cache versus the static,
+preallocated KV cache.
+
+Uses a randomly initialized decoder with the GPT-SoVITS shape, no weights are needed.
+Run from the backend directory:
+
+    python benchmarks/t2s_kv_cache.py --steps 500 --batch-size 1
+"""
+import argparse
+import os
+import sys
+import time
+
+import torch
+from torch.nn import functional as F
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+sys.path.insert(0, os.path.join(backend_dir, "services", "TTS", "GPTsovits", "GPT_SoVITS"))
+
+from AR.models.t2s_model import Text2SemanticDecoder
+
+config = {
+    "model": {
+        "hidden_dim": 512,
+        "embedding_dim": 512,
+        "head": 16,
+        "n_layer": 24,
+        "vocab_size": 1025,
+        "phoneme_vocab_size": 732,
+        "dropout": 0,
+        "EOS": 1024,
+    }
+}
+
+
+def decode(model, xy_pos, steps, static_kv_cache):
+    """Run the prompt plus a fixed number of decode steps, returns the decode time in seconds"""
+    bsz, src_len, _ = xy_pos.shape
+    attn_mask = torch.zeros(bsz, model.num_head, src_len, src_len, dtype=torch.bool)
+    xy_dec, k_cache, v_cache = model.t2s_transformer.process_prompt(xy_pos, attn_mask, None)
+    x = xy_dec[:, -1:]
+
+    if static_kv_cache:
+        k_cache, v_cache = model.init_static_kv_cache(k_cache, v_cache, src_len + steps)
+        attn_mask = torch.zeros(bsz, 1, 1, src_len + steps, dtype=torch.bool)
+    else:
+        attn_mask = torch.zeros(bsz, 1, 1, src_len, dtype=torch.bool)
+
+    start = time.perf_counter()
+    for idx in range(steps):
+        if static_kv_cache:
+            x = model.t2s_transformer.decode_next_token_static(x, k_cache, v_cache, src_len + idx, attn_mask)
+        else:
+            # Same per step work as infer_panel_batch_infer: grow the mask and the caches
+            attn_mask = F.pad(attn_mask, (0, 1), value=False)
+            x, k_cache, v_cache = model.t2s_transformer.decode_next_token(x, k_cache, v_cache, attn_mask)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=500, help="Decode steps per run")
+    parser.add_argument("--prompt-len", type=int, default=200, help="Text + reference audio tokens")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+
+    model = Text2SemanticDecoder(config).eval()
+    xy_pos = torch.randn(args.batch_size, args.prompt_len, config["model"]["hidden_dim"])
+
+    with torch.inference_mode():
+        # Warm-up so the first measured run doesn't pay for allocator / kernel setup
+        decode(model, xy_pos, min(args.steps, 20), static_kv_cache=False)
+        decode(model, xy_pos, min(args.steps, 20), static_kv_cache=True)
+
+        results = {}
+        for name, static_kv_cache in (("concat", False), ("static", True)):
+            best = min(decode(model, xy_pos, args.steps, static_kv_cache) for _ in range(args.runs))
+            results[name] = args.steps * args.batch_size / best
+            print(f"{name:>6}: {results[name]:8.1f} tokens/sec ({best:.2f}s for {args.steps} steps, batch {args.batch_size})")
+
+    print(f"speedup: {results['static'] / results['concat']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
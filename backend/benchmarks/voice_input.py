@@ -0,0 +1,113 @@
+"""
+VAD + ASR latency of VoiceInput on recorded audio, no microphone needed.
+
+For every detected utterance it reports the end-of-speech detection delay and the Whisper
+transcription latency, plus the VAD time per 512-sample window over the whole run.
+Files are replayed as fast as possible unless --realtime is given, which paces them like
+a microphone so the wall clock detection delay is meaningful too. Run from the backend directory:
+
+    python benchmarks/voice_input.py recordings/*.wav --model small --threshold 0.4 --silence-wait 0.3
+    ffmpeg -i talk.mp3 -f s16le -ac 1 -ar 16000 - | python benchmarks/voice_input.py --pipe
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from services.Input.Input import VoiceInput
+from services.Input.AudioSource import FileSource, PipeSource
+
+
+class RecordingClient:
+    """Stands in for a WebSocket and keeps the messages VoiceInput sends"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def send_json(self, message):
+        self.messages.append((time.perf_counter(), message))
+
+
+async def run_source(voice_input, source):
+    client = RecordingClient()
+    voice_input.utterances.clear()
+    started = time.perf_counter()
+    await voice_input.start_streaming([client], source)
+    streamed = time.perf_counter() - started
+
+    # The Whisper executor has a single worker, an empty job finishes after every queued transcription
+    await asyncio.get_running_loop().run_in_executor(voice_input.transcriber.executor, lambda: None)
+    await asyncio.sleep(0.1)
+    return streamed, list(voice_input.utterances), client.messages
+
+
+def report(name, streamed, utterances, metrics, realtime):
+    print(f"\n{name}: streamed in {streamed:.2f} s, VAD {metrics['vad_ms_per_window']:.3f} ms/window, "
+          f"{metrics['blocks_dropped']} blocks dropped, max queue lag {metrics['max_queue_lag_ms']:.1f} ms")
+    for record in utterances:
+        wall = f", wall {record['detection_delay_wall'] * 1000:6.0f} ms" if realtime else ""
+        latency = record["transcription_latency"]
+        latency = f"{latency * 1000:6.0f} ms" if latency is not None else "failed"
+        print(f"  #{record['utterance_id']:<3} ends {record['speech_end']:7.2f} s, {record['duration']:5.2f} s long | "
+              f"end-of-speech {record['end_of_speech_delay'] * 1000:5.0f} ms{wall} | "
+              f"transcription {latency} | {record['text']!r}")
+
+
+def summarize(all_utterances, realtime):
+    if not all_utterances:
+        print("\nNo utterances detected")
+        return
+    detection = np.array([u["end_of_speech_delay"] for u in all_utterances]) * 1000
+    latencies = np.array([u["transcription_latency"] for u in all_utterances if u["transcription_latency"] is not None]) * 1000
+    print(f"\n{len(all_utterances)} utterances")
+    print(f"  end-of-speech delay: mean {detection.mean():.0f} ms, p95 {np.percentile(detection, 95):.0f} ms")
+    if realtime:
+        wall = np.array([u["detection_delay_wall"] for u in all_utterances]) * 1000
+        print(f"  wall clock delay:    mean {wall.mean():.0f} ms, p95 {np.percentile(wall, 95):.0f} ms")
+    if len(latencies):
+        print(f"  transcription:       mean {latencies.mean():.0f} ms, p95 {np.percentile(latencies, 95):.0f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="Audio files to replay")
+    parser.add_argument("--pipe", action="store_true", help="Read raw 16 kHz mono s16le PCM from stdin")
+    parser.add_argument("--realtime", action="store_true", help="Pace the audio like a microphone")
+    parser.add_argument("--model", default="medium", help="Whisper model size")
+    parser.add_argument("--compute-type", default=None, help="CTranslate2 compute type")
+    parser.add_argument("--threshold", type=float, default=VoiceInput.SPEECH_THRESHOLD, help="SPEECH_THRESHOLD")
+    parser.add_argument("--silence-wait", type=float, default=VoiceInput.SILENCE_WAIT_TIME / VoiceInput.SAMPLING_RATE,
+                        help="SILENCE_WAIT_TIME in seconds")
+    parser.add_argument("--vad-onnx", action="store_true", help="Use the ONNX Silero VAD")
+    parser.add_argument("--partials", action="store_true", help="Also run partial transcripts during speech")
+    parser.add_argument("--block-size", type=int, default=1024, help="Samples per source block")
+    args = parser.parse_args()
+    if not args.files and not args.pipe:
+        parser.error("give audio files or --pipe")
+
+    voice_input = VoiceInput(whisper_model_size=args.model, whisper_compute_type=args.compute_type, vad_onnx=args.vad_onnx)
+    voice_input.SPEECH_THRESHOLD = args.threshold
+    voice_input.SILENCE_WAIT_TIME = args.silence_wait * voice_input.SAMPLING_RATE
+    voice_input.partial_transcripts = args.partials
+    print(f"model {args.model}, threshold {args.threshold}, silence wait {args.silence_wait:.2f} s, "
+          f"{'realtime' if args.realtime else 'as fast as possible'}")
+
+    sources = [("stdin", PipeSource(realtime=args.realtime, block_size=args.block_size))] if args.pipe else [
+        (path, FileSource(path, realtime=args.realtime, block_size=args.block_size)) for path in args.files
+    ]
+    all_utterances = []
+    for name, source in sources:
+        streamed, utterances, _ = await run_source(voice_input, source)
+        report(name, streamed, utterances, voice_input.get_metrics(), args.realtime)
+        all_utterances.extend(utterances)
+    summarize(all_utterances, args.realtime)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
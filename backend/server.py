@@ -10,19 +10,27 @@ import traceback
 from services.ChatFetch.Chatfetch import ChatFetch
 from services.Input.Input import VoiceInput
 from services.Input.VisionInput import VisionInput
+from services.Input.VisionWatcher import VisionWatcher
+from services.Input.OCREngine import OCREngine
 from services.TTS.TTS import TTS
+from services.TTS.TTSWorker import TTSWorker, TTSQueueFullError, TTSJobCancelledError, PRIORITY_NORMAL, PRIORITY_LOW
 from services.Memory.Memory import Memory
 from services.Memory.HistoryStore import HistoryStore
+from services.Memory.MemoryIndexer import MemoryIndexer
+from services.Memory.AsyncMemory import AsyncMemory
 from services.lib.LAV_logger import logger
+from services.lib.LazyService import LazyService
 import os
 import requests
 import aiofiles
 import aiohttp
-from fastapi import FastAPI, Query, Request, Response, WebSocket, HTTPException
+from fastapi import FastAPI, Query, Request, Response, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 from services.LLM.LLM import LLM
+from services.Pipeline.SpeechPipeline import SpeechPipeline
 from pydantic import BaseModel
 from datetime import datetime
 import json
@@ -45,15 +53,33 @@ app.mount("/resource", StaticFiles(directory="../frontend/dist/resource"), name=
 # Initialize Services
 start_time = time.time()
 startup_progress.show_step("Loading AI Services")
-voice_input:VoiceInput = VoiceInput()
+# Heavy models load in the background once the server is up (see warm_up_services) or on first use
+voice_input:LazyService = LazyService("voice_input", lambda: VoiceInput(
+    whisper_model_size=settings_manager.settings.get("input.whisper_model", "medium"),
+    whisper_compute_type=settings_manager.settings.get("input.whisper_compute_type")
+))
 llm:LLM = LLM()
-memory:Memory = Memory()
+memory:LazyService = LazyService("memory", Memory)
+async_memory:AsyncMemory = AsyncMemory(memory)  # Request handlers go through this, never block on embedding
 history_store:HistoryStore = HistoryStore()
-tts:TTS = TTS()
-vision_input:VisionInput = VisionInput()
+memory_indexer:MemoryIndexer = MemoryIndexer(memory, history_store)
+tts:LazyService = LazyService(
+    "tts",
+    lambda: TTS(max_concurrent_requests=tts_worker.concurrency),
+    # Queued on the worker like every synthesis, the pipeline must not run on two threads at once.
+    # A cache hit wouldn't warm up anything
+    warmup=lambda service: tts_worker.submit(lambda: service.syntheize("Hi", use_cache=False), priority=PRIORITY_LOW)
+)
+tts_worker:TTSWorker = TTSWorker(max_queue_size=8)  # Concurrency comes from the tts.concurrency setting
+tts_worker.start()
+speech_pipeline:SpeechPipeline = SpeechPipeline(llm, tts, tts_worker)
+vision_input:VisionInput = VisionInput()  # OCR and captioning models load on first use
+vision_watcher:VisionWatcher = VisionWatcher(vision_input)
+llm.screenshot_provider = vision_watcher.get_latest_image  # Vision LLM prompts reuse the watcher's latest frame
 startup_progress.complete_step(f"AI Services loaded in {time.time() - start_time:.2f}s")
 
 clients = set()
+vision_clients = set()
 
 # Initialize ChatFetch service
 chat_fetch = ChatFetch()
@@ -67,20 +93,50 @@ chat_clients = set()
 async def serve_webui():
     return FileResponse("../frontend/dist/index.html")
 
+# *******************************
+# Health
+# *******************************
+
+@app.get("/api/health")
+async def get_health():
+    components = {
+        "tts": tts.status(),
+        "voice_input": voice_input.status(),
+        "memory": memory.status(),
+        "vision": vision_input.get_status(),
+        "llm": {"state": "ready" if llm.llm is not None else "not_loaded"},
+    }
+    return JSONResponse(content={
+        "status": "ok",
+        "ready": all(service.status()["ready"] for service in WARM_UP_SERVICES),
+        "components": components
+    })
+
 # *******************************
 # Input
 # *******************************
 
 @app.post("/api/record/start")
 async def start_recording():
+    try:
+        await voice_input.ready()
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"error": f"Voice input failed to load: {e}"})
     asyncio.create_task(voice_input.start_streaming(clients))
     return Response(status_code=200)
 
 @app.post("/api/record/stop")
 async def stop_recording():
-    voice_input.stop_streaming()
+    if voice_input.loaded:
+        voice_input.stop_streaming()
     return Response(status_code=200)
 
+@app.get("/api/record/metrics")
+async def get_record_metrics():
+    if not voice_input.loaded:
+        return JSONResponse(content={"running": False, "status": voice_input.status()})
+    return JSONResponse(content=voice_input.get_metrics())
+
 @app.websocket("/ws/audio")
 async def websocket_audio(websocket: WebSocket):
     await websocket.accept()
@@ -136,7 +192,8 @@ async def get_monitor_info():
             content={"error": f"Failed to get monitor info: {str(e)}"}
         )
 
-async def process_screenshot_async(monitor_index: int, ocr_scale_factor: float, skip_ocr: bool = False):
+async def process_screenshot_async(monitor_index: int, ocr_scale_factor: float, skip_ocr: bool = False,
+                                   reuse_unchanged: bool = True):
     """
     Async wrapper for screenshot processing to avoid blocking the event loop.
     """
@@ -151,14 +208,27 @@ async def process_screenshot_async(monitor_index: int, ocr_scale_factor: float,
             save_screenshot=False,
             confidence_threshold=0.5,
             ocr_scale_factor=ocr_scale_factor,
-            skip_ocr=skip_ocr
+            skip_ocr=skip_ocr,
+            reuse_unchanged=reuse_unchanged
         )
     )
     
     return result
 
+def validate_image_options(image_format: str, quality: int, max_dimension: int):
+    """Returns an error message for invalid image encoding options, None if they are valid"""
+    if image_format.lower() not in list(VisionInput.IMAGE_FORMATS) + ["jpg"]:
+        return f"Image format must be one of {list(VisionInput.IMAGE_FORMATS)}"
+    if quality < 1 or quality > 100:
+        return "Image quality must be between 1 and 100"
+    if max_dimension < 0:
+        return "Max dimension must be 0 (full resolution) or positive"
+    return None
+
 @app.get("/api/screenshot")
-async def get_screenshot(monitor_index: int = 1, ocr_scale_factor: float = 0.5, skip_ocr: bool = False):
+async def get_screenshot(monitor_index: int = 1, ocr_scale_factor: float = 0.5, skip_ocr: bool = False,
+                         reuse_unchanged: bool = True, use_latest: bool = True, include_image: bool = True,
+                         image_format: str = "jpeg", quality: int = 80, max_dimension: int = 1920):
     """
     Capture a screenshot and return the image, caption, and extracted text.
     
@@ -166,6 +236,12 @@ async def get_screenshot(monitor_index: int = 1, ocr_scale_factor: float = 0.5,
         monitor_index: Index of the monitor to capture
         ocr_scale_factor: Factor to scale down image for OCR processing (0.1 to 1.0)
         skip_ocr: Whether to skip OCR processing and only generate caption
+        reuse_unchanged: Whether to reuse OCR and caption of the previous frame where the screen did not change
+        use_latest: Whether to answer with the vision watcher's latest result when it watches this monitor
+        include_image: Whether to embed the base64 image, /api/screenshot/image serves it as binary instead
+        image_format: "jpeg", "webp" or "png"
+        quality: JPEG / WebP quality (1-100)
+        max_dimension: Downscale the returned image so neither side exceeds this, 0 for full resolution
     """
     try:
         logger.info(f"Screenshot request for monitor index: {monitor_index}, scale factor: {ocr_scale_factor}, skip OCR: {skip_ocr}")
@@ -176,10 +252,17 @@ async def get_screenshot(monitor_index: int = 1, ocr_scale_factor: float = 0.5,
                 status_code=400,
                 content={"error": "OCR scale factor must be between 0.1 and 1.0"}
             )
+        image_error = validate_image_options(image_format, quality, max_dimension)
+        if image_error:
+            return JSONResponse(status_code=400, content={"error": image_error})
         
-        # Process screen asynchronously using asyncio.create_task
-        task = asyncio.create_task(process_screenshot_async(monitor_index, ocr_scale_factor, skip_ocr))
-        result = await task
+        result = None
+        if use_latest and vision_watcher.running and (skip_ocr or not vision_watcher.skip_ocr):
+            result = vision_watcher.get_latest(monitor_index, max_age=vision_watcher.interval * 3)
+        if result is None:
+            # Process screen asynchronously using asyncio.create_task
+            task = asyncio.create_task(process_screenshot_async(monitor_index, ocr_scale_factor, skip_ocr, reuse_unchanged))
+            result = await task
         
         if not result['success']:
             return JSONResponse(
@@ -187,29 +270,21 @@ async def get_screenshot(monitor_index: int = 1, ocr_scale_factor: float = 0.5,
                 content={"error": "Failed to capture screenshot"}
             )
         
-        # Convert screenshot to base64 for JSON response
-        import io
-        import base64
-        img_byte_arr = io.BytesIO()
-        result['screenshot'].save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        image_base64 = base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
+        # Encode the (downscaled) screenshot off the event loop for the JSON response
+        image_base64 = None
+        mime_type = None
+        if include_image:
+            import base64
+            image_bytes, mime_type = await run_in_threadpool(
+                vision_input.encode_image, result['screenshot'], image_format, quality, max_dimension
+            )
+            image_base64 = base64.b64encode(image_bytes).decode('utf-8')
         
         # Extract all detected text
         detected_text = vision_input.get_detected_text(result['ocr_results'])
         
-        # Convert numpy types to native Python types for JSON serialization
-        def convert_numpy_types(obj):
-            if hasattr(obj, 'item'):  # numpy scalar
-                return obj.item()
-            elif isinstance(obj, (list, tuple)):
-                return [convert_numpy_types(item) for item in obj]
-            elif isinstance(obj, dict):
-                return {key: convert_numpy_types(value) for key, value in obj.items()}
-            return obj
-        
         # Convert OCR results to ensure JSON serialization
-        converted_ocr_results = convert_numpy_types(result['ocr_results'])
+        converted_ocr_results = vision_input.serialize_ocr_results(result['ocr_results'])
         
         # Return JSON response with all data
         return JSONResponse(
@@ -217,11 +292,14 @@ async def get_screenshot(monitor_index: int = 1, ocr_scale_factor: float = 0.5,
             content={
                 "success": True,
                 "image": image_base64,
+                "mime_type": mime_type,
                 "caption": result['caption'] or "",
                 "extracted_text": detected_text,
                 "ocr_count": len(result['ocr_results']),
                 "ocr_results": converted_ocr_results,  # Converted OCR data
-                "ocr_scale_factor": ocr_scale_factor
+                "ocr_scale_factor": ocr_scale_factor,
+                "changed": result['changed'],
+                "cached": result['cached']
             }
         )
         
@@ -232,6 +310,100 @@ async def get_screenshot(monitor_index: int = 1, ocr_scale_factor: float = 0.5,
             content={"error": f"Failed to capture screenshot: {str(e)}"}
         )
 
+@app.get("/api/screenshot/image")
+async def get_screenshot_image(monitor_index: int = 1, use_latest: bool = True, image_format: str = "jpeg",
+                               quality: int = 80, max_dimension: int = 1920):
+    """
+    Capture a screenshot and return only the encoded image as binary, without OCR or captioning.
+    
+    Args:
+        monitor_index: Index of the monitor to capture
+        use_latest: Whether to return the vision watcher's latest frame when it watches this monitor
+        image_format: "jpeg", "webp" or "png"
+        quality: JPEG / WebP quality (1-100)
+        max_dimension: Downscale so neither side exceeds this, 0 for full resolution
+    """
+    image_error = validate_image_options(image_format, quality, max_dimension)
+    if image_error:
+        return JSONResponse(status_code=400, content={"error": image_error})
+    try:
+        latest = vision_watcher.get_latest(monitor_index, max_age=vision_watcher.interval * 3) \
+            if use_latest and vision_watcher.running else None
+        screenshot = latest['screenshot'] if latest else await run_in_threadpool(vision_input.capture_screenshot, monitor_index)
+        if screenshot is None:
+            return JSONResponse(status_code=500, content={"error": "Failed to capture screenshot"})
+        image_bytes, mime_type = await run_in_threadpool(
+            vision_input.encode_image, screenshot, image_format, quality, max_dimension
+        )
+        return Response(content=image_bytes, media_type=mime_type, headers={"Cache-Control": "no-store"})
+    except Exception as e:
+        logger.error(f"Error capturing screenshot image: {e}", exc_info=True)
+        return JSONResponse(status_code=500, content={"error": f"Failed to capture screenshot: {str(e)}"})
+
+class VisionWatchRequest(BaseModel):
+    interval: float | None = None
+    monitor_index: int | None = None
+    ocr_scale_factor: float | None = None
+    skip_ocr: bool | None = None
+
+@app.post("/api/vision/watch/start")
+async def start_vision_watch(request: VisionWatchRequest):
+    if request.ocr_scale_factor is not None and not 0.1 <= request.ocr_scale_factor <= 1.0:
+        return JSONResponse(status_code=400, content={"error": "OCR scale factor must be between 0.1 and 1.0"})
+    vision_watcher.configure(request.interval, request.monitor_index, request.ocr_scale_factor, request.skip_ocr)
+    vision_watcher.start(vision_clients)
+    return JSONResponse(content=vision_watcher.get_status())
+
+@app.post("/api/vision/watch/stop")
+async def stop_vision_watch():
+    vision_watcher.stop()
+    return JSONResponse(content=vision_watcher.get_status())
+
+@app.get("/api/vision/latest")
+async def get_latest_vision():
+    """The watcher's most recent caption and OCR results, without the image."""
+    result = vision_watcher.get_latest()
+    if result is None:
+        return JSONResponse(status_code=404, content={"error": "No vision result yet, start the vision watcher first"})
+    return JSONResponse(content={
+        "timestamp": vision_watcher.latest_timestamp,
+        "monitor_index": vision_watcher.monitor_index,
+        "caption": result['caption'] or "",
+        "extracted_text": vision_input.get_detected_text(result['ocr_results']),
+        "ocr_results": vision_input.serialize_ocr_results(result['ocr_results']),
+        "changed": result['changed'],
+        "status": vision_watcher.get_status()
+    })
+
+@app.websocket("/ws/vision")
+async def websocket_vision(websocket: WebSocket):
+    await websocket.accept()
+    vision_clients.add(websocket)
+    try:
+        while True:
+            await websocket.receive_text()
+    except Exception:
+        pass
+    finally:
+        vision_clients.discard(websocket)
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass  # Already closed
+
+@app.on_event("startup")
+async def start_vision_watch_on_startup():
+    settings = settings_manager.settings
+    if settings.get("vision.watch.enabled"):
+        try:
+            vision_watcher.configure(
+                float(settings.get("vision.watch.interval", vision_watcher.interval)),
+                int(settings.get("vision.watch.monitor_index", vision_watcher.monitor_index))
+            )
+        except (ValueError, TypeError):
+            logger.warning("Invalid vision watcher settings, using defaults")
+        vision_watcher.start(vision_clients)
+
 # *******************************
 # StreamChat
 # *******************************
@@ -569,6 +741,15 @@ async def delete_model(request: DeleteModelRequest):
 
 class TTSRequest(BaseModel):
     text: str
+    priority: int = PRIORITY_NORMAL
+    channel: str | None = None
+    replace: bool = False  # Cancel queued/running requests of the same channel first
+
+class CancelTTSRequest(BaseModel):
+    channel: str
+
+def tts_queue_full_response(error: TTSQueueFullError):
+    return JSONResponse(status_code=503, content={"error": str(error)}, headers={"Retry-After": "1"})
 
 class ChangeVoiceRequest(BaseModel):
     voice_name: str
@@ -576,18 +757,34 @@ class ChangeVoiceRequest(BaseModel):
 @app.get("/api/tts/voices")
 async def get_available_voices():
     try:
+        await tts.ready()
         voices = tts.get_available_voices()
         return JSONResponse(content={
             "voices": voices,
+            "voice_details": tts.get_voice_details(),
             "current_voice": tts.current_voice
         })
     except Exception as e:
         logger.error(f"Error getting voices: {e}", exc_info=True)
         return JSONResponse(status_code=500, content={"error": "Failed to get available voices"})
 
+@app.post("/api/tts/voices/rescan")
+async def rescan_voices():
+    try:
+        await tts.ready()
+        voice_details = await run_in_threadpool(tts.rescan_voices)
+        return JSONResponse(content={
+            "voice_details": voice_details,
+            "current_voice": tts.current_voice
+        })
+    except Exception as e:
+        logger.error(f"Error rescanning voices: {e}", exc_info=True)
+        return JSONResponse(status_code=500, content={"error": "Failed to rescan voices"})
+
 @app.post("/api/tts/voice")
 async def change_voice(request: ChangeVoiceRequest):
     try:
+        await tts.ready()
         result = tts.change_voice(request.voice_name)
         settings_manager.update_settings({"tts.voice": request.voice_name})
         return JSONResponse(content=result)
@@ -599,9 +796,164 @@ async def change_voice(request: ChangeVoiceRequest):
 
 @app.post("/api/tts")
 async def get_audio(request: TTSRequest):
-    response = tts.syntheize(request.text)
-    return Response(response, media_type="audio/wav")
-    
+    try:
+        response = await tts_worker.synthesize(tts, request.text, request.priority, request.channel, request.replace)
+        return Response(response, media_type="audio/wav")
+    except TTSQueueFullError as e:
+        return tts_queue_full_response(e)
+    except TTSJobCancelledError as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+
+@app.post("/api/tts/stream")
+async def stream_audio(request: TTSRequest):
+    """Stream a WAV header followed by raw PCM, one chunk per synthesized sentence."""
+    try:
+        generator = tts_worker.stream(tts, request.text, request.priority, request.channel, request.replace)
+    except TTSQueueFullError as e:
+        return tts_queue_full_response(e)
+
+    async def audio_stream():
+        try:
+            async for chunk in generator:
+                yield chunk
+        except TTSJobCancelledError:
+            logger.info("Streaming TTS request was cancelled")
+        except Exception as e:
+            logger.error(f"Error during streaming TTS: {e}", exc_info=True)
+
+    return StreamingResponse(audio_stream(), media_type="audio/wav")
+
+@app.websocket("/ws/tts")
+async def websocket_tts(websocket: WebSocket):
+    """
+    Receives {"text": "..."} messages and answers each one with a
+    {"type": "start"} message, one binary int16 PCM frame per sentence and a {"type": "end"} message.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive_json()
+            text = message.get("text", "")
+            if not text:
+                await websocket.send_json({"type": "error", "error": "text is required"})
+                continue
+
+            try:
+                generator = tts_worker.stream_fragments(
+                    tts, text,
+                    message.get("priority", PRIORITY_NORMAL),
+                    message.get("channel"),
+                    message.get("replace", False)
+                )
+                first_chunk = True
+                async for sr, chunk in generator:
+                    if first_chunk:
+                        await websocket.send_json({"type": "start", "sample_rate": sr, "format": "pcm_s16le", "channels": 1})
+                        first_chunk = False
+                    await websocket.send_bytes(chunk.tobytes())
+                await websocket.send_json({"type": "end"})
+            except (ValueError, TTSQueueFullError, TTSJobCancelledError) as e:
+                await websocket.send_json({"type": "error", "error": str(e)})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                # One failed synthesis shouldn't end the session for the messages after it
+                logger.error(f"TTS websocket request failed: {e}", exc_info=True)
+                await websocket.send_json({"type": "error", "error": f"TTS failed: {e}"})
+    except Exception:
+        pass
+    finally:
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass  # Already closed
+
+class PrewarmTTSRequest(BaseModel):
+    phrases: List[str] | None = None  # Defaults to the "tts.prewarm_phrases" setting
+
+async def prewarm_tts(phrases: List[str]):
+    """Synthesize phrases into the audio cache at low priority, so they never delay live requests."""
+    try:
+        service = await tts.ready()
+    except Exception as e:
+        logger.warning(f"TTS prewarm skipped, TTS failed to load: {e}")
+        return
+    if service.seed == -1:
+        logger.warning("TTS prewarm skipped, the audio cache is only used with a fixed tts.seed")
+        return
+    synthesized = 0
+    for phrase in phrases:
+        try:
+            if not phrase or await run_in_threadpool(tts.is_cached, phrase):
+                continue
+            while True:
+                try:
+                    await tts_worker.synthesize(tts, phrase, PRIORITY_LOW)
+                    synthesized += 1
+                    break
+                except TTSQueueFullError:
+                    await asyncio.sleep(1)
+        except Exception as e:
+            logger.warning(f"TTS prewarm failed for '{phrase}': {e}")
+    logger.info(f"TTS prewarm finished, {synthesized} new phrase(s) cached")
+
+@app.post("/api/tts/prewarm")
+async def prewarm_tts_cache(request: PrewarmTTSRequest):
+    phrases = request.phrases if request.phrases is not None else settings_manager.settings.get("tts.prewarm_phrases", [])
+    if tts.loaded and tts.seed == -1:
+        return JSONResponse(status_code=400, content={"error": "The audio cache is only used with a fixed tts.seed"})
+    asyncio.create_task(prewarm_tts(phrases))
+    return JSONResponse(content={"queued": len(phrases)})
+
+@app.on_event("startup")
+async def prewarm_tts_on_startup():
+    phrases = settings_manager.settings.get("tts.prewarm_phrases", [])
+    if phrases:
+        asyncio.create_task(prewarm_tts(phrases))
+
+@app.post("/api/tts/cancel")
+async def cancel_tts(request: CancelTTSRequest):
+    cancelled = tts_worker.cancel_channel(request.channel)
+    return JSONResponse(content={"cancelled": cancelled})
+
+@app.get("/api/tts/metrics")
+async def get_tts_metrics():
+    metrics = tts_worker.get_metrics()
+    if tts.loaded:
+        metrics.update(tts.get_cache_stats())
+        metrics.update(tts.get_scheduler_stats())
+    return JSONResponse(content=metrics)
+
+# *******************************
+# LLM -> TTS Pipeline
+# *******************************
+
+class PipelineRequest(BaseModel):
+    text: str
+    history: list | None = None
+    systemPrompt: str = ""
+    screenshot: bool = False
+    text_split_method: str = "cut5"
+
+@app.post("/api/pipeline/completion")
+async def pipeline_completion(request: PipelineRequest, fastapi_request: Request):
+    """
+    Run a completion and synthesize it sentence by sentence while the LLM keeps generating.
+    Returns newline-delimited JSON events (text deltas, sentences and base64 wav audio).
+    """
+    async def event_stream():
+        events = speech_pipeline.run(request.text, request.history, request.systemPrompt,
+                                     request.screenshot, request.text_split_method)
+        try:
+            async for event in events:
+                if await fastapi_request.is_disconnected():
+                    logger.info("Client disconnected, stopping pipeline stream.")
+                    break
+                yield json.dumps(event) + "\n"
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
 
 # *******************************
 # Settings
@@ -635,14 +987,73 @@ class SettingsManager:
                 llm.set_keep_model_loaded(value)
             if key == "stream.yt.videoid":
                 chat_fetch.video_id = value
-            if key == "tts.voice":
+            # Lazily loaded services get their settings once they are built
+            if key == "input.whisper_model":
+                voice_input.when_loaded(lambda service, value=value: service.set_whisper_model(value, self.settings.get("input.whisper_compute_type")))
+            if key == "input.probability_rate":
+                try:
+                    probability_rate = max(1.0, float(value))
+                    voice_input.when_loaded(lambda service, rate=probability_rate: setattr(service, "probability_rate", rate))
+                except (ValueError, TypeError):
+                    logger.warning(f"Invalid value for {key}: {value}, using default")
+            if key == "vision.ocr_decoder":
+                if value in OCREngine.DECODERS:
+                    vision_input.ocr_decoder = value
+                else:
+                    logger.warning(f"Invalid value for {key}: {value}, expected one of {OCREngine.DECODERS}")
+            if key == "vision.ocr_tile_size":
+                try:
+                    vision_input.ocr_tile_size = max(0, int(value))
+                except (ValueError, TypeError):
+                    logger.warning(f"Invalid value for {key}: {value}, using default")
+            if key == "vision.ocr_static_regions":
+                try:
+                    vision_input.ocr_static_regions = [tuple(int(v) for v in region) for region in value]
+                except (ValueError, TypeError):
+                    logger.warning(f"Invalid value for {key}: {value}, expected [[left, top, right, bottom], ...]")
+            if key == "memory.query_timeout":
+                try:
+                    async_memory.query_timeout = float(value) if value is not None else None
+                except (ValueError, TypeError):
+                    logger.warning(f"Invalid value for {key}: {value}, using default")
+            if key == "memory.recency_half_life_days":
+                try:
+                    half_life = max(0.01, float(value))
+                    memory.when_loaded(lambda service, half_life=half_life: setattr(service.retrieval, "half_life_days", half_life))
+                except (ValueError, TypeError):
+                    logger.warning(f"Invalid value for {key}: {value}, using default")
+            if key == "memory.session_weight":
+                try:
+                    session_weight = max(0.0, float(value))
+                    memory.when_loaded(lambda service, weight=session_weight: setattr(service.retrieval, "session_weight", weight))
+                except (ValueError, TypeError):
+                    logger.warning(f"Invalid value for {key}: {value}, using default")
+            if key == "memory.auto_index":
+                memory_indexer.configure_queue(auto_index=bool(value))
+            if key == "memory.index_batch_size":
+                try:
+                    memory_indexer.configure_queue(batch_size=int(value))
+                except (ValueError, TypeError):
+                    logger.warning(f"Invalid value for {key}: {value}, using default")
+            if key == "memory.index_flush_interval":
+                try:
+                    memory_indexer.configure_queue(flush_interval=float(value))
+                except (ValueError, TypeError):
+                    logger.warning(f"Invalid value for {key}: {value}, using default")
+            if key == "tts.seed":
                 try:
-                    tts.change_voice(value)
-                except ValueError:
-                    # If saved voice is not available, remove it from settings
-                    logger.warning(f"Saved voice '{value}' not found, removing from settings")
-                    self.settings.pop("tts.voice")
-                    self.save_settings(self.settings)
+                    seed = int(value)
+                    tts.when_loaded(lambda service, seed=seed: setattr(service, "seed", seed))
+                except (ValueError, TypeError):
+                    logger.warning(f"Invalid value for {key}: {value}, using default")
+            if key == "tts.concurrency":
+                try:
+                    tts_worker.set_concurrency(int(value))
+                    tts.when_loaded(lambda service, concurrency=tts_worker.concurrency: service.set_max_concurrent_requests(concurrency))
+                except (ValueError, TypeError):
+                    logger.warning(f"Invalid value for {key}: {value}, using default")
+            if key == "tts.voice":
+                tts.when_loaded(lambda service, value=value: self.apply_voice(service, value))
         
         # Apply LLM sampling parameters
         llm_sampling_params = {}
@@ -663,6 +1074,15 @@ class SettingsManager:
         if llm_sampling_params:
             llm.update_sampling_params(llm_sampling_params)
 
+    def apply_voice(self, tts_service: TTS, voice_name: str):
+        try:
+            tts_service.change_voice(voice_name)
+        except ValueError:
+            # If saved voice is not available, remove it from settings
+            logger.warning(f"Saved voice '{voice_name}' not found, removing from settings")
+            self.settings.pop("tts.voice", None)
+            self.save_settings(self.settings)
+
     def update_settings(self, updated_settings: Dict[str, Any]):
         self.settings.update(updated_settings)
         self.save_settings(self.settings)
@@ -678,15 +1098,15 @@ startup_progress.show_step("Applying Settings")
 settings_manager.apply_settings()
 startup_progress.complete_step(f"Settings applied in {time.time() - start_time:.2f}s")
 
-# Warm up TTS to reduce first request latency
-start_time = time.time()
-startup_progress.show_step("Warming up TTS")
-try:
-    tts.syntheize("Hi")
-    startup_progress.complete_step(f"TTS warmed up successfully in {time.time() - start_time:.2f}s")
-except Exception as e:
-    startup_progress.complete_step(f"TTS warm-up failed (non-critical) in {time.time() - start_time:.2f}s")
-    logger.warning(f"TTS warm-up failed (non-critical): {e}")
+# Services warmed up in the background after startup, vision models only load on demand
+WARM_UP_SERVICES = [tts, voice_input, memory]
+
+@app.on_event("startup")
+async def warm_up_services():
+    async def warm_up():
+        for service in WARM_UP_SERVICES:
+            await service.warm_up()
+    asyncio.create_task(warm_up())
 
 # Log startup time
 startup_time = time.time() - total_start_time
@@ -742,6 +1162,8 @@ async def update_chat_session(request: UpdateSessionRequest):
     try:
         success = history_store.update_session(request.session_id, request.history)
         if success:
+            # Embedding happens on the indexer's queue, the new turns are searchable a moment later
+            memory_indexer.enqueue_session(request.session_id)
             return JSONResponse(status_code=200, content={"message": "Session updated successfully"})
         return JSONResponse(status_code=404, content={"error": "Session not found"})
     except Exception as e:
@@ -805,7 +1227,8 @@ class IndexSessionRequest(BaseModel):
     format_style: str = "simple"
 
 @app.post("/api/chat/session/{session_id}/index")
-async def index_chat_session(session_id: str, request: IndexSessionRequest):
+async def index_chat_session(session_id: str, request: IndexSessionRequest, force: bool = False):
+    """Index the messages of the session that are not in memory yet, force re-embeds the whole session."""
     try:
         # Get the session history
         session = history_store.get_session_history(session_id)
@@ -816,24 +1239,24 @@ async def index_chat_session(session_id: str, request: IndexSessionRequest):
         if not history:
             return JSONResponse(status_code=400, content={"error": "Session has no history to index"})
         
-        # Insert the history into memory using the new chunking functionality
-        response = memory.insert_history(
-            history=history,
-            session_id=session_id,
+        # Embed only the windows added since the last run, off the event loop
+        await memory.ready()
+        result = await run_in_threadpool(
+            memory_indexer.index_session,
+            session_id,
             window_size=request.window_size,
             stride=request.stride,
-            format_style=request.format_style
+            format_style=request.format_style,
+            force=force
         )
-        
-        if response is None:
-            return JSONResponse(status_code=500, content={"error": "Failed to index session"})
-        
-        # Mark the session as indexed
-        history_store.mark_session_indexed(session_id, True)
+        if result is None:
+            return JSONResponse(status_code=404, content={"error": "Session not found"})
         
         return JSONResponse(status_code=200, content={
             "message": "Session indexed successfully",
-            "chunks_created": len(history) // request.window_size + 1 if len(history) > 0 else 0
+            "chunks_created": result["chunks_written"],
+            "start_message": result["start_message"],
+            "message_count": result["message_count"]
         })
         
     except Exception as e:
@@ -848,15 +1271,13 @@ async def remove_session_index(session_id: str):
         if not session:
             return JSONResponse(status_code=404, content={"error": "Session not found"})
         
-        # Remove all messages for this session from memory
-        success = memory.delete_session_messages(session_id)
+        # Remove all messages for this session from memory and keep auto-indexing from adding them back
+        await memory.ready()
+        success = await run_in_threadpool(memory_indexer.remove_session, session_id)
         
         if not success:
             return JSONResponse(status_code=500, content={"error": "Failed to remove session from memory"})
         
-        # Mark the session as not indexed
-        history_store.mark_session_indexed(session_id, False)
-        
         return JSONResponse(status_code=200, content={"message": "Session index removed successfully"})
         
     except Exception as e:
@@ -874,7 +1295,9 @@ async def get_session_index_status(session_id: str):
             "session_id": session_id,
             "indexed": session.get("indexed", False),
             "indexed_at": session.get("indexed_at"),
-            "message_count": len(session.get("history", []))
+            "message_count": len(session.get("history", [])),
+            "indexed_message_count": session.get("indexed_message_count", 0),
+            "index_disabled": session.get("index_disabled", False)
         })
         
     except Exception as e:
@@ -885,69 +1308,43 @@ async def get_session_index_status(session_id: str):
 async def get_indexed_chunks(session_id: str):
     try:
         # Fetch all indexed chunks for the session
-        chunks = memory.query_by_session(session_id, limit=1000)
+        chunks = await async_memory.query_by_session(session_id, limit=None)
         return JSONResponse(status_code=200, content={"chunks": chunks})
     except Exception as e:
         logger.error(f"Error getting indexed chunks for session {session_id}: {e}", exc_info=True)
         return JSONResponse(status_code=500, content={"error": "Failed to get indexed chunks"})
 
 @app.post("/api/chat/reindex-all")
-async def reindex_all_sessions():
+async def reindex_all_sessions(rebuild: bool = False):
+    """
+    Start bringing every session's index up to date in the background.
+
+    Args:
+        rebuild: Drop the whole collection and re-embed every session from scratch
+
+    Returns:
+        202 with the initial progress, poll /api/chat/reindex-all/progress until running is false
+    """
     try:
-        # Get all sessions
-        sessions = history_store.get_session_list()
-        if not sessions:
-            return JSONResponse(status_code=200, content={"message": "No sessions to reindex"})
-        
-        # Delete all existing indexes
-        success = memory.delete_all_messages()
-        if not success:
-            return JSONResponse(status_code=500, content={"error": "Failed to delete existing indexes"})
-        
-        # Mark all sessions as not indexed
-        for session in sessions:
-            history_store.mark_session_indexed(session["id"], False)
-        
-        # Reindex all sessions with history
-        reindexed_count = 0
-        failed_sessions = []
-        
-        for session in sessions:
-            try:
-                session_data = history_store.get_session_history(session["id"])
-                if session_data and session_data.get("history"):
-                    # Insert the history into memory
-                    response = memory.insert_history(
-                        history=session_data["history"],
-                        session_id=session["id"],
-                        window_size=3,
-                        stride=1,
-                        format_style="simple"
-                    )
-                    
-                    if response is not None:
-                        # Mark the session as indexed
-                        history_store.mark_session_indexed(session["id"], True)
-                        reindexed_count += 1
-                    else:
-                        failed_sessions.append(session["id"])
-                else:
-                    failed_sessions.append(session["id"])
-            except Exception as e:
-                logger.error(f"Error reindexing session {session['id']}: {e}")
-                failed_sessions.append(session["id"])
-        
-        return JSONResponse(status_code=200, content={
-            "message": "Reindexing completed",
-            "reindexed_count": reindexed_count,
-            "failed_sessions": failed_sessions,
-            "total_sessions": len(sessions)
+        await memory.ready()
+        if not memory_indexer.start_reindex_all(rebuild=rebuild):
+            return JSONResponse(status_code=409, content={"error": "A reindex is already running"})
+        return JSONResponse(status_code=202, content={
+            "message": "Reindexing started",
+            **memory_indexer.get_progress()
         })
-        
     except Exception as e:
         logger.error(f"Error reindexing all sessions: {e}", exc_info=True)
         return JSONResponse(status_code=500, content={"error": "Failed to reindex all sessions"})
 
+@app.get("/api/chat/reindex-all/progress")
+async def get_reindex_progress():
+    return JSONResponse(status_code=200, content=memory_indexer.get_progress())
+
+@app.get("/api/chat/index-queue")
+async def get_index_queue_status():
+    return JSONResponse(status_code=200, content=memory_indexer.get_queue_status())
+
 # *******************************
 # Memory - Context Query API
 # *******************************
@@ -955,15 +1352,21 @@ async def reindex_all_sessions():
 class QueryContextRequest(BaseModel):
     text: str
     limit: int = 3
+    session_id: str | None = None
 
 @app.post("/api/memory/context")
 async def query_memory_context(request: QueryContextRequest):
     try:
-        response = memory.query(text=request.text, limit=request.limit)
+        # Empty context if the lookup is slow, the completion shouldn't wait on memory
+        response = await async_memory.query(request.text, request.limit, request.session_id)
         return JSONResponse(status_code=200, content={"context": response})
     except Exception as e:
         logger.error(f"Error querying memory context: {e}", exc_info=True)
         return JSONResponse(status_code=500, content={"error": "Failed to query memory context"})
 
+@app.get("/api/memory/stats")
+async def get_memory_stats():
+    return JSONResponse(status_code=200, content=async_memory.get_stats())
+
 if __name__ == "__main__":
     uvicorn.run(app, host="localhost", port=8000)
@@ -0,0 +1,95 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Preallocated ring buffer for a mono sample stream.
+
+    Samples are written as they arrive from the device and read back in fixed size windows.
+    With a capacity that is a multiple of the window size, windows never wrap around the end
+    of the buffer, so read() returns views into the buffer instead of copies.
+    Already read samples stay available through history() until they are overwritten.
+    """
+
+    def __init__(self, capacity: int, dtype=np.float32):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=dtype)
+        self.written = 0  # Total samples ever written
+        self.read_position = 0  # Total samples ever read
+        self.overruns = 0  # Unread samples dropped because the reader fell behind
+
+    @property
+    def available(self) -> int:
+        return self.written - self.read_position
+
+    def write(self, samples: np.ndarray):
+        samples = samples[-self.capacity:]
+        n = len(samples)
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        if first < n:
+            self.buffer[:n - first] = samples[first:]
+        self.written += n
+
+        if self.available > self.capacity:
+            self.overruns += self.available - self.capacity
+            self.read_position = self.written - self.capacity
+
+    def _slice(self, position: int, n: int) -> np.ndarray:
+        start = position % self.capacity
+        if start + n <= self.capacity:
+            return self.buffer[start:start + n]
+        return np.concatenate((self.buffer[start:], self.buffer[:start + n - self.capacity]))
+
+    def peek(self, n: int) -> np.ndarray:
+        """Up to n unread samples without consuming them."""
+        return self._slice(self.read_position, min(n, self.available))
+
+    def read(self, n: int) -> np.ndarray:
+        """
+        Consume n unread samples.
+
+        The returned array may be a view into the buffer, it is only valid until the
+        buffer wraps around and overwrites it.
+        """
+        n = min(n, self.available)
+        window = self._slice(self.read_position, n)
+        self.read_position += n
+        return window
+
+    def history(self, n: int) -> np.ndarray:
+        """Up to n samples that were read most recently, oldest first."""
+        n = min(n, self.read_position, self.capacity - self.available)
+        return self._slice(self.read_position - n, n)
+
+    def clear(self):
+        self.read_position = self.written
+
+
+class GrowableBuffer:
+    """Contiguous buffer that grows by doubling, for audio of unknown length such as an utterance."""
+
+    def __init__(self, initial_capacity: int, dtype=np.float32):
+        self.buffer = np.zeros(initial_capacity, dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, samples: np.ndarray):
+        n = len(samples)
+        if self.size + n > len(self.buffer):
+            capacity = max(len(self.buffer) * 2, self.size + n)
+            grown = np.zeros(capacity, dtype=self.buffer.dtype)
+            grown[:self.size] = self.buffer[:self.size]
+            self.buffer = grown
+        self.buffer[self.size:self.size + n] = samples
+        self.size += n
+
+    def view(self) -> np.ndarray:
+        """The buffered samples, without copying. Only valid until the next append / clear."""
+        return self.buffer[:self.size]
+
+    def clear(self):
+        self.size = 0
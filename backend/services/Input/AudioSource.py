@@ -0,0 +1,173 @@
+import sys
+import threading
+import time
+from typing import BinaryIO, Callable, Iterator, Optional, Union
+import numpy as np
+import sounddevice as sd
+import soundfile as sf
+from ..lib.LAV_logger import logger
+
+
+class AudioSource:
+    """
+    Producer of 16 kHz mono int16 blocks for VoiceInput.
+
+    start() hands every block to on_block from the source's own thread (the PortAudio thread
+    for the microphone). Realtime sources deliver audio as it happens, so VoiceInput drops
+    blocks it cannot keep up with. Other sources replay as fast as the consumer allows.
+    """
+    realtime = True
+
+    def __init__(self, sample_rate: int = 16000, block_size: int = 1024):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.finished = threading.Event()  # Set once the source has no more audio
+        self.overflows = 0  # Audio lost before it reached on_block, e.g. PortAudio input overflows
+
+    def start(self, on_block: Callable[[np.ndarray], None]):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+
+class MicrophoneSource(AudioSource):
+    """The default input device through sounddevice."""
+
+    def __init__(self, sample_rate: int = 16000, block_size: int = 0, device=None):
+        """
+        Args:
+            block_size: Samples per callback, 0 lets PortAudio pick
+            device: sounddevice device index or name, None for the default input
+        """
+        super().__init__(sample_rate, block_size)
+        self.device = device
+        self.stream = None
+
+    def start(self, on_block):
+        self.finished.clear()
+
+        def audio_callback(indata, frames, time_info, status):
+            if status.input_overflow:
+                self.overflows += 1
+            on_block(indata[:, 0].copy())
+
+        self.stream = sd.InputStream(samplerate=self.sample_rate, channels=1, dtype='int16',
+                                     blocksize=self.block_size, device=self.device, callback=audio_callback)
+        self.stream.start()
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+        self.finished.set()
+
+
+class _ReplaySource(AudioSource):
+    """Feeds blocks from _read_blocks() on a background thread, paced like a device when realtime."""
+
+    def __init__(self, realtime: bool, sample_rate: int, block_size: int):
+        super().__init__(sample_rate, block_size)
+        self.realtime = realtime
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def _read_blocks(self) -> Iterator[np.ndarray]:
+        raise NotImplementedError
+
+    def start(self, on_block):
+        self.finished.clear()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, args=(on_block,), daemon=True)
+        self.thread.start()
+
+    def _run(self, on_block):
+        started = time.perf_counter()
+        samples_sent = 0
+        try:
+            for block in self._read_blocks():
+                if self.stop_event.is_set():
+                    break
+                samples_sent += len(block)
+                if self.realtime:
+                    # A device hands over a block once all of its samples were captured
+                    delay = started + samples_sent / self.sample_rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                on_block(block)
+        except Exception as e:
+            logger.error(f"Audio source failed: {e}", exc_info=True)
+        finally:
+            self.finished.set()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)
+
+
+class FileSource(_ReplaySource):
+    """WAV / FLAC / any soundfile format, downmixed to mono and resampled to sample_rate."""
+
+    def __init__(self, path: str, realtime: bool = False, sample_rate: int = 16000, block_size: int = 1024,
+                 pad_seconds: float = 1.0):
+        """
+        Args:
+            path: Audio file to replay
+            realtime: Pace the blocks like a microphone instead of replaying as fast as possible
+            pad_seconds: Silence appended so speech at the very end of the file still ends an utterance
+        """
+        super().__init__(realtime, sample_rate, block_size)
+        self.path = path
+        self.pad_seconds = pad_seconds
+
+    def load(self) -> np.ndarray:
+        audio, file_rate = sf.read(self.path, dtype='float32', always_2d=True)
+        audio = audio.mean(axis=1)
+        if file_rate != self.sample_rate:
+            # Linear interpolation is plenty for VAD and Whisper benchmarking
+            duration = len(audio) / file_rate
+            target = np.arange(int(duration * self.sample_rate)) / self.sample_rate
+            audio = np.interp(target, np.arange(len(audio)) / file_rate, audio)
+        audio = np.concatenate((audio, np.zeros(int(self.pad_seconds * self.sample_rate))))
+        return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+
+    def _read_blocks(self):
+        audio = self.load()
+        for start in range(0, len(audio), self.block_size):
+            yield audio[start:start + self.block_size]
+
+
+class PipeSource(_ReplaySource):
+    """Raw 16-bit little endian mono PCM at sample_rate, e.g. piped from ffmpeg or arecord."""
+
+    def __init__(self, stream: Optional[Union[BinaryIO, str]] = None, realtime: bool = False,
+                 sample_rate: int = 16000, block_size: int = 1024):
+        """
+        Args:
+            stream: Binary file object or path to read from, defaults to stdin
+            realtime: Pace the blocks like a microphone, only needed when the writer is not already paced
+        """
+        super().__init__(realtime, sample_rate, block_size)
+        self.stream = stream
+
+    def _read_blocks(self):
+        stream = self.stream if self.stream is not None else sys.stdin.buffer
+        close = isinstance(stream, str)
+        if close:
+            stream = open(stream, "rb")
+        try:
+            remainder = b""
+            while not self.stop_event.is_set():
+                data = stream.read(self.block_size * 2)
+                if not data:
+                    break
+                data = remainder + data
+                usable = len(data) - len(data) % 2
+                remainder = data[usable:]
+                if usable:
+                    yield np.frombuffer(data[:usable], dtype='<i2').astype(np.int16)
+        finally:
+            if close:
+                stream.close()
@@ -0,0 +1,123 @@
+from typing import List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+
+class FrameChangeDetector:
+    """
+    Cheap screen change detection on a downscaled grayscale copy of each frame.
+
+    The difference to the reference frame is averaged per grid cell, and a frame counts as
+    changed when any cell exceeds cell_threshold or the whole frame exceeds threshold. Cells
+    cover 48x36 pixels of a 1080p frame, so a single changed line of text moves its
+    cells well past cell_threshold while it would vanish in the mean over the whole frame.
+    The reference only moves on when a change is reported, so slow drift (a ticking clock,
+    a fading animation) still adds up to a change eventually.
+    """
+
+    def __init__(self, thumbnail_size: Tuple[int, int] = (320, 180), grid: Tuple[int, int] = (40, 30),
+                 threshold: float = 0.01, cell_threshold: float = 0.02):
+        """
+        Args:
+            thumbnail_size: (width, height) frames are reduced to before comparing
+            grid: (columns, rows) of cells used to detect and locate changes, must divide thumbnail_size
+            threshold: Mean absolute difference (0-1) of the whole frame above which it counts as changed
+            cell_threshold: Mean absolute difference (0-1) above which a grid cell counts as changed
+        """
+        self.thumbnail_size = thumbnail_size
+        self.grid = grid
+        self.threshold = threshold
+        self.cell_threshold = cell_threshold
+        self.reference: Optional[np.ndarray] = None
+        self.reference_size: Optional[Tuple[int, int]] = None
+
+    def thumbnail(self, image: Image.Image) -> np.ndarray:
+        # reduce() box-filters by an integer factor first, far cheaper than resizing a 4K frame directly
+        factor = max(1, min(image.width // self.thumbnail_size[0], image.height // self.thumbnail_size[1]))
+        small = image.reduce(factor) if factor > 1 else image
+        small = small.convert("L").resize(self.thumbnail_size, Image.Resampling.BILINEAR)
+        return np.asarray(small, dtype=np.float32) / 255.0
+
+    def reset(self):
+        self.reference = None
+        self.reference_size = None
+
+    def compare(self, image: Image.Image) -> Tuple[bool, float, Optional[Tuple[int, int, int, int]]]:
+        """
+        Compare a frame with the reference frame.
+
+        Args:
+            image: Full resolution frame
+
+        Returns:
+            Tuple of (changed, change score, changed region). The region is a (left, top, right, bottom)
+            box in full resolution pixels around all changed cells, None when the whole frame has to be
+            treated as new (first frame, resolution change).
+        """
+        thumbnail = self.thumbnail(image)
+        if self.reference is None or self.reference_size != image.size:
+            self.reference = thumbnail
+            self.reference_size = image.size
+            return True, 1.0, None
+
+        columns, rows = self.grid
+        height, width = thumbnail.shape
+        cells = np.abs(thumbnail - self.reference).reshape(rows, height // rows, columns, width // columns).mean(axis=(1, 3))
+        changed_cells = cells > self.cell_threshold
+        score = float(cells.mean())
+        if score <= self.threshold and not changed_cells.any():
+            return False, score, None
+
+        self.reference = thumbnail
+        return True, score, self._changed_region(changed_cells, image.size)
+
+    def _changed_region(self, changed_cells: np.ndarray, image_size: Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]:
+        changed_rows, changed_columns = np.nonzero(changed_cells)
+        if len(changed_rows) == 0:
+            return None  # Small changes spread over the whole frame
+
+        # One cell of margin, so text crossing a cell border is not cut off for OCR
+        rows, columns = changed_cells.shape
+        cell_width = image_size[0] / columns
+        cell_height = image_size[1] / rows
+        return (
+            int(max(0, changed_columns.min() - 1) * cell_width),
+            int(max(0, changed_rows.min() - 1) * cell_height),
+            int(np.ceil(min(columns, changed_columns.max() + 2) * cell_width)),
+            int(np.ceil(min(rows, changed_rows.max() + 2) * cell_height)),
+        )
+
+    @staticmethod
+    def region_fraction(region: Tuple[int, int, int, int], image_size: Tuple[int, int]) -> float:
+        left, top, right, bottom = region
+        return (right - left) * (bottom - top) / (image_size[0] * image_size[1])
+
+    @staticmethod
+    def boxes_in_region(bboxes: List, region: Tuple[int, int, int, int]) -> np.ndarray:
+        """Mask of the OCR bounding boxes whose center lies inside region."""
+        if not bboxes:
+            return np.zeros(0, dtype=bool)
+        centers = np.asarray(bboxes, dtype=np.float32).reshape(len(bboxes), -1, 2).mean(axis=1)
+        left, top, right, bottom = region
+        return ((centers[:, 0] >= left) & (centers[:, 0] < right) &
+                (centers[:, 1] >= top) & (centers[:, 1] < bottom))
+
+
+if __name__ == "__main__":
+    # Check that a single changed line of text on a 1080p frame is detected and located
+    def text_line(seed: int) -> np.ndarray:
+        # 700x16 px line of dark glyph strokes covering about a quarter of the line
+        return np.where(np.random.default_rng(seed).random((16, 700)) < 0.25, 20, 255).astype(np.uint8)
+
+    frame = np.full((1080, 1920), 255, dtype=np.uint8)
+    frame[500:516, 600:1300] = text_line(0)
+    detector = FrameChangeDetector()
+    assert detector.compare(Image.fromarray(frame).convert("RGB"))[0]
+    assert not detector.compare(Image.fromarray(frame).convert("RGB"))[0], "Unchanged frame reported as changed"
+
+    frame[500:516, 600:1300] = text_line(1)
+    changed, score, region = detector.compare(Image.fromarray(frame).convert("RGB"))
+    assert changed, f"Text line change not detected, score {score:.5f}"
+    assert region is not None and region[0] <= 600 and region[1] <= 500 and region[2] >= 1300 and region[3] >= 516, region
+    assert FrameChangeDetector.region_fraction(region, (1920, 1080)) < 0.1, region
+    print(f"Text line change detected, score {score:.5f}, region {region}")
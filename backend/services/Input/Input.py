@@ -1,20 +1,23 @@
 import asyncio
-import os
-import wave
+import time
+from collections import deque
+from typing import Optional
 from fastapi import WebSocket
 import sounddevice as sd
 import numpy as np
 import torch
-from faster_whisper import WhisperModel
 from silero_vad import load_silero_vad, VADIterator
 from ..lib.LAV_logger import logger
+from .AudioBuffers import RingBuffer, GrowableBuffer
+from .AudioSource import AudioSource, MicrophoneSource
+from .Transcriber import Transcriber
 
 
 class VoiceInput:
-    current_module_directory = os.path.dirname(__file__)
-    MIC_OUTPUT_PATH = os.path.join(current_module_directory, "voice_recording.wav")
-
     SAMPLING_RATE = 16000
+    CHUNK_SIZE = 512  # Samples per Silero VAD window
+    RING_BUFFER_SAMPLES = CHUNK_SIZE * 250  # 8 s of mic audio, a multiple of CHUNK_SIZE so windows never wrap
+    INGEST_QUEUE_BLOCKS = 64  # Device blocks waiting for the consumer before new ones are dropped
     input_language = "en"
     whisper_filter_list = [
         "you", "thank you.", "thanks for watching.", "thanks for watching!", "Thank you for watching.",
@@ -25,106 +28,348 @@ class VoiceInput:
     PRE_SPEECH_SAMPLES = 0.5 * SAMPLING_RATE
     POST_SPEECH_SAMPLES = 0.5 * SAMPLING_RATE
 
-    vad_model = load_silero_vad()
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    whisper_model = WhisperModel("medium", device=device)
+    # Partial transcripts while the user is still speaking
+    partial_transcripts = True
+    PARTIAL_INTERVAL = 0.5 * SAMPLING_RATE  # Re-transcribe after this much new speech
+    PARTIAL_WINDOW = 15 * SAMPLING_RATE  # Longer utterances only get the final transcript
+    PARTIAL_OPTIONS = {"beam_size": 1, "condition_on_previous_text": False, "without_timestamps": True}
 
-    vad_iterator = VADIterator(vad_model, sampling_rate=SAMPLING_RATE)
     running = False
 
-    def __init__(self):
+    def __init__(self, whisper_model_size="medium", whisper_compute_type=None, vad_onnx=False, probability_rate=20):
+        """
+        Args:
+            whisper_model_size: faster-whisper model size, e.g. "small", "medium", "large-v3"
+            whisper_compute_type: CTranslate2 compute type, defaults to int8 on CPU and float16 on CUDA
+            vad_onnx: Run Silero VAD with onnxruntime instead of TorchScript
+            probability_rate: Maximum speech probability updates per second sent to clients
+        """
+        self.vad_model = self._load_vad(vad_onnx)
+        self.vad_iterator = VADIterator(self.vad_model, sampling_rate=self.SAMPLING_RATE)
+        self.probability_rate = probability_rate
+        self.pending_probability = None
+        self.last_probability_sent = 0.0
+        self.transcriber = Transcriber(whisper_model_size, compute_type=whisper_compute_type, language=self.input_language)
+        self.audio_buffer = RingBuffer(self.RING_BUFFER_SAMPLES)
+        self.sentence_audio_buffer = GrowableBuffer(self.SAMPLING_RATE * 10)
+        self.utterance_id = 0
+        self.partial_pending = False
         self._reset_buffers()
+        # Audio ingest: the device callback appends, the consumer task pops, both are atomic on a deque
+        self.ingest_queue = deque()
+        self.ingest_event = None
+        self.source: Optional[AudioSource] = None
+        self._reset_ingest_metrics()
+        # Per utterance timings: end-of-speech detection delay and transcription latency
+        self.utterances = deque(maxlen=100)
+        self.stream_started = time.perf_counter()
+        self.stream_start_position = 0
+        self.speech_end_position = 0
         self.last_transcription = None
 
+    @staticmethod
+    def _load_vad(onnx):
+        if onnx:
+            try:
+                return load_silero_vad(onnx=True)
+            except Exception as e:
+                logger.warning(f"Could not load the ONNX Silero VAD, using TorchScript instead: {e}")
+        return load_silero_vad()
+
+    def _vad_probabilities(self, audio):
+        """
+        Speech probabilities of consecutive CHUNK_SIZE windows.
+
+        The windows of one stream can't be batched. Silero is recurrent: every window's output
+        depends on the LSTM state and the 64 sample context left by the window before it. The
+        model's batch dimension stands for independent streams, each with its own state, and its
+        audio_forward() resets the state before looping over the windows, which would cut the
+        stream at every block. So the windows go through the model one call each, in order, but
+        without autograd and with a single sync at the end instead of an .item() per window.
+        """
+        start = time.perf_counter()
+        windows = torch.from_numpy(audio).reshape(-1, self.CHUNK_SIZE)
+        with torch.inference_mode():
+            probabilities = [self.vad_model(window, self.SAMPLING_RATE) for window in windows]
+        probabilities = torch.cat(probabilities).flatten().tolist()
+        self.vad_seconds += time.perf_counter() - start
+        self.vad_windows += len(probabilities)
+        return probabilities
+
     def _reset_buffers(self):
-        self.sentence_audio_buffer = []
-        self.tmp_audio_buffer = []
+        self.sentence_audio_buffer.clear()
         self.silent_samples = 0
         self.started_speaking = False
-
-    async def start_streaming(self, clients):
+        # Partial transcript state of the current utterance
+        self.utterance_id += 1
+        self.samples_since_partial = 0
+        self.previous_hypothesis = []
+        self.committed_words = []
+
+    def _update_speech_state(self, chunk, speech_prob):
+        """
+        Track speech / silence for one VAD window.
+
+        Returns:
+            The finished utterance once enough silence followed speech, otherwise None
+        """
+        if speech_prob < self.SPEECH_THRESHOLD:
+            if self.silent_samples <= self.SILENCE_WAIT_TIME:
+                self.silent_samples += len(chunk)
+        else:
+            self.silent_samples = 0
+            self.speech_end_position = self.audio_buffer.read_position
+            if not self.started_speaking:
+                # Pre-roll: the audio right before the window that triggered the VAD
+                self.sentence_audio_buffer.clear()
+                history = self.audio_buffer.history(int(self.PRE_SPEECH_SAMPLES) + len(chunk))
+                self.sentence_audio_buffer.append(history[:len(history) - len(chunk)])
+            self.started_speaking = True
+
+        if self.started_speaking:
+            self.sentence_audio_buffer.append(chunk)
+
+        if self.started_speaking and self.silent_samples > self.SILENCE_WAIT_TIME:
+            post = self.audio_buffer.read(int(self.POST_SPEECH_SAMPLES))
+            self.sentence_audio_buffer.append(post)
+            return self.sentence_audio_buffer.view()
+        return None
+
+    def _reset_ingest_metrics(self):
+        self.blocks_received = 0
+        self.blocks_dropped = 0
+        self.max_queue_depth = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.blocks_processed = 0
+        self.vad_seconds = 0.0
+        self.vad_windows = 0
+
+    async def start_streaming(self, clients, source: Optional[AudioSource] = None):
+        """
+        Run VAD and transcription on an audio source until stop_streaming() or the source ends.
+
+        Args:
+            clients: WebSockets receiving probability, partial and transcription messages
+            source: Where the audio comes from, defaults to the microphone
+        """
         if self.running:
             return
         self.running = True
-        logger.info("Started recording")
+        self.source = source or MicrophoneSource(self.SAMPLING_RATE)
+        logger.info(f"Started recording from {type(self.source).__name__}")
 
         loop = asyncio.get_event_loop()
-
-        def audio_callback(indata, frames, time, status):
-            audio_np = indata.flatten().astype(np.float32) / 32768.0
-            asyncio.run_coroutine_threadsafe(
-                self._process_audio(audio_np, clients), loop
-            )
-
-        with sd.InputStream(samplerate=self.SAMPLING_RATE, channels=1, dtype='int16', callback=audio_callback):
-            while self.running:
-                await asyncio.sleep(0.1)
+        self.ingest_queue.clear()
+        self.ingest_event = asyncio.Event()
+        self._reset_ingest_metrics()
+        self.stream_started = time.perf_counter()
+        self.stream_start_position = self.audio_buffer.written
+
+        def on_block(block):
+            # Runs on the source thread: queue the block and wake the consumer, nothing else
+            self.blocks_received += 1
+            while len(self.ingest_queue) >= self.INGEST_QUEUE_BLOCKS:
+                if self.source.realtime or not self.running:
+                    self.blocks_dropped += 1
+                    return
+                time.sleep(0.005)  # A replay can wait for the consumer instead of losing audio
+            self.ingest_queue.append((block, time.perf_counter()))
+            loop.call_soon_threadsafe(self.ingest_event.set)
+
+        self.source.start(on_block)
+        try:
+            await self._consume_audio(clients)
+        finally:
+            self.source.stop()
+            self.running = False
 
         logger.info("Stopped recording")
 
+    async def _consume_audio(self, clients):
+        """Process queued device blocks in arrival order, one at a time."""
+        while self.running:
+            if self.source.finished.is_set() and not self.ingest_queue:
+                break
+            try:
+                await asyncio.wait_for(self.ingest_event.wait(), timeout=0.1)
+            except asyncio.TimeoutError:
+                continue
+            self.ingest_event.clear()
+
+            self.max_queue_depth = max(self.max_queue_depth, len(self.ingest_queue))
+            while self.ingest_queue and self.running:
+                block, queued_at = self.ingest_queue.popleft()
+                lag = time.perf_counter() - queued_at
+                self.lag_total += lag
+                self.lag_max = max(self.lag_max, lag)
+                self.blocks_processed += 1
+
+                await self._process_audio(block.astype(np.float32) / 32768.0, clients)
+        self.ingest_queue.clear()
+
+    def get_metrics(self) -> dict:
+        return {
+            "running": self.running,
+            "blocks_received": self.blocks_received,
+            "blocks_processed": self.blocks_processed,
+            "blocks_dropped": self.blocks_dropped,
+            "device_overflows": self.source.overflows if self.source else 0,
+            "queue_depth": len(self.ingest_queue),
+            "max_queue_depth": self.max_queue_depth,
+            "avg_queue_lag_ms": self.lag_total / self.blocks_processed * 1000 if self.blocks_processed else 0.0,
+            "max_queue_lag_ms": self.lag_max * 1000,
+            "ring_buffer_overruns": self.audio_buffer.overruns,
+            "vad_ms_per_window": self.vad_seconds / self.vad_windows * 1000 if self.vad_windows else 0.0,
+            "utterances": list(self.utterances),
+            "transcriber": self.transcriber.get_metrics(),
+        }
+
     def stop_streaming(self):
         self.running = False
 
     async def _process_audio(self, audio_np, clients):
-        self.tmp_audio_buffer.extend(audio_np)
-
-        while len(self.tmp_audio_buffer) >= 512:
-            chunk = np.array(self.tmp_audio_buffer[:512])
-            self.tmp_audio_buffer = self.tmp_audio_buffer[512:]
-
-            speech_prob = self.vad_model(torch.from_numpy(chunk), self.SAMPLING_RATE).item()
-
-            # Broadcast to all connected clients
-            await asyncio.gather(*[
-                client.send_json({"type": "probability", "probability": speech_prob})
-                for client in clients
-            ])
-
-            if speech_prob < self.SPEECH_THRESHOLD:
-                if self.silent_samples <= self.SILENCE_WAIT_TIME:
-                    self.silent_samples += 512
-            else:
-                self.silent_samples = 0
-                if not self.started_speaking:
-                    pre = self.sentence_audio_buffer[-int(self.PRE_SPEECH_SAMPLES):]
-                    self.sentence_audio_buffer = list(pre)
-                self.started_speaking = True
-
-            if self.started_speaking:
-                self.sentence_audio_buffer.extend(chunk)
-
-            if self.started_speaking and self.silent_samples > self.SILENCE_WAIT_TIME:
-                post = self.tmp_audio_buffer[:int(self.POST_SPEECH_SAMPLES)]
-                self.sentence_audio_buffer.extend(post)
-
-                transcribed_text = self.process_speech(np.array(self.sentence_audio_buffer))
-                if transcribed_text and transcribed_text not in self.whisper_filter_list:
-                    if transcribed_text != self.last_transcription:
-                        self.last_transcription = transcribed_text  
-                        await asyncio.gather(*[
-                            client.send_json({"type": "transcription", "text": transcribed_text})
-                            for client in clients
-                        ])
-
-                self.vad_iterator.reset_states()
-                self._reset_buffers()
-
-    def process_speech(self, audio_data):
-        with wave.open(self.MIC_OUTPUT_PATH, "wb") as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)
-            wf.setframerate(16000)
-            wf.writeframes((audio_data * 32768.0).astype(np.int16).tobytes())
-
-        transcribed_text = ''
-        segments, _ = self.whisper_model.transcribe(self.MIC_OUTPUT_PATH, language=self.input_language)
-        for segment in segments:
-            transcribed_text += segment.text
-
+        self.audio_buffer.write(audio_np)
+
+        while self.audio_buffer.available >= self.CHUNK_SIZE:
+            # All complete windows of the block in one VAD pass
+            windows = self.audio_buffer.available // self.CHUNK_SIZE
+            probabilities = self._vad_probabilities(self.audio_buffer.peek(windows * self.CHUNK_SIZE))
+
+            for speech_prob in probabilities:
+                chunk = self.audio_buffer.read(self.CHUNK_SIZE)  # View into the ring buffer, no copy
+                self._track_probability(speech_prob)
+
+                utterance = self._update_speech_state(chunk, speech_prob)
+                if utterance is not None:
+                    # Transcribe in the background, the mic keeps being processed meanwhile
+                    transcription = self.transcriber.transcribe_async(utterance)
+                    record = self._utterance_record(utterance)
+                    asyncio.create_task(self._broadcast_transcription(transcription, clients, record))
+
+                    self.vad_iterator.reset_states()
+                    self._reset_buffers()
+                    # The post-speech audio was consumed, the remaining probabilities no longer line up
+                    break
+                elif self.started_speaking:
+                    self._schedule_partial(len(chunk), clients)
+
+        await self._broadcast_probability(clients)
+
+    def _utterance_record(self, utterance):
+        """Timings of an utterance that was just detected, positions are seconds into the stream."""
+        speech_end = (self.speech_end_position - self.stream_start_position) / self.SAMPLING_RATE
+        detected = (self.audio_buffer.read_position - self.stream_start_position) / self.SAMPLING_RATE
+        finalized_at = time.perf_counter()
+        record = {
+            "utterance_id": self.utterance_id,
+            "duration": len(utterance) / self.SAMPLING_RATE,
+            "speech_end": speech_end,
+            "end_of_speech_delay": detected - speech_end,
+            # Only meaningful for realtime sources, where stream time and wall time run in step
+            "detection_delay_wall": finalized_at - self.stream_started - speech_end,
+            "finalized_at": finalized_at,
+            "transcription_latency": None,
+            "text": None,
+        }
+        self.utterances.append(record)
+        return record
+
+    def _track_probability(self, speech_prob):
+        # Keep the peak between updates so a short burst of speech still reaches the clients
+        if self.pending_probability is None or speech_prob > self.pending_probability:
+            self.pending_probability = speech_prob
+
+    async def _broadcast_probability(self, clients):
+        """Send the peak speech probability, at most probability_rate times per second."""
+        now = time.monotonic()
+        if self.pending_probability is None or now - self.last_probability_sent < 1 / self.probability_rate:
+            return
+        speech_prob = self.pending_probability
+        self.pending_probability = None
+        self.last_probability_sent = now
+
+        # Broadcast to all connected clients
+        await asyncio.gather(*[
+            client.send_json({"type": "probability", "probability": speech_prob})
+            for client in clients
+        ])
+
+    def _schedule_partial(self, new_samples, clients):
+        """Re-transcribe the utterance so far once PARTIAL_INTERVAL of new audio came in."""
+        self.samples_since_partial += new_samples
+        if not self.partial_transcripts or self.partial_pending:
+            return  # At most one partial waits for Whisper, finals never queue behind a backlog
+        if self.samples_since_partial < self.PARTIAL_INTERVAL or len(self.sentence_audio_buffer) > self.PARTIAL_WINDOW:
+            return
+        self.samples_since_partial = 0
+        self.partial_pending = True
+        transcription = self.transcriber.transcribe_async(self.sentence_audio_buffer.view(), **self.PARTIAL_OPTIONS)
+        asyncio.create_task(self._broadcast_partial(transcription, self.utterance_id, clients))
+
+    async def _broadcast_partial(self, transcription, utterance_id, clients):
+        try:
+            text = (await transcription).strip()
+        except Exception as e:
+            logger.error(f"Error during partial transcription: {e}", exc_info=True)
+            return
+        finally:
+            self.partial_pending = False
+        if utterance_id != self.utterance_id or not text:
+            return  # The utterance already ended, its final transcript supersedes this one
+
+        stable = self._stabilize(text)
+        await asyncio.gather(*[
+            client.send_json({"type": "partial", "text": text, "stable": stable})
+            for client in clients
+        ])
+
+    def _stabilize(self, text):
+        """
+        Commit the words two consecutive hypotheses agree on.
+
+        Returns:
+            The committed prefix, which only ever grows during an utterance
+        """
+        words = text.split()
+        agreed = 0
+        for previous, current in zip(self.previous_hypothesis, words):
+            if previous != current:
+                break
+            agreed += 1
+        if agreed > len(self.committed_words):
+            self.committed_words = words[:agreed]
+        self.previous_hypothesis = words
+        return " ".join(self.committed_words)
+
+    async def _broadcast_transcription(self, transcription, clients, record=None):
+        try:
+            transcribed_text = self._filter_transcription(await transcription)
+        except Exception as e:
+            logger.error(f"Error during transcription: {e}", exc_info=True)
+            return
+        if record is not None:
+            record["transcription_latency"] = time.perf_counter() - record["finalized_at"]
+            record["text"] = transcribed_text
+        if transcribed_text and transcribed_text not in self.whisper_filter_list:
+            if transcribed_text != self.last_transcription:
+                self.last_transcription = transcribed_text
+                await asyncio.gather(*[
+                    client.send_json({"type": "transcription", "text": transcribed_text})
+                    for client in clients
+                ])
+
+    def _filter_transcription(self, transcribed_text):
         if not transcribed_text or transcribed_text.strip().lower() in self.whisper_filter_list:
             return
         return transcribed_text
 
+    def process_speech(self, audio_data):
+        return self._filter_transcription(self.transcriber.transcribe(audio_data))
+
+    def set_whisper_model(self, model_size, compute_type=None):
+        self.transcriber.load_model(model_size, compute_type)
+
     def run_cli(self):
         print("🎙️ Running in CLI mode. Press Ctrl+C to stop.")
         loop = asyncio.get_event_loop()
@@ -140,38 +385,25 @@ class VoiceInput:
                 print("🛑 Stopped recording.")
 
     async def _process_audio_cli(self, audio_np):
-        self.tmp_audio_buffer.extend(audio_np)
-
-        while len(self.tmp_audio_buffer) >= 512:
-            chunk = np.array(self.tmp_audio_buffer[:512])
-            self.tmp_audio_buffer = self.tmp_audio_buffer[512:]
-
-            speech_prob = self.vad_model(torch.from_numpy(chunk), self.SAMPLING_RATE).item()
-            print(f"Speech probability: {speech_prob:.2f}")
-
-            if speech_prob < self.SPEECH_THRESHOLD:
-                if self.silent_samples <= self.SILENCE_WAIT_TIME:
-                    self.silent_samples += 512
-            else:
-                self.silent_samples = 0
-                if not self.started_speaking:
-                    pre = self.sentence_audio_buffer[-int(self.PRE_SPEECH_SAMPLES):]
-                    self.sentence_audio_buffer = list(pre)
-                self.started_speaking = True
-
-            if self.started_speaking:
-                self.sentence_audio_buffer.extend(chunk)
-
-            if self.started_speaking and self.silent_samples > self.SILENCE_WAIT_TIME:
-                post = self.tmp_audio_buffer[:int(self.POST_SPEECH_SAMPLES)]
-                self.sentence_audio_buffer.extend(post)
-
-                transcribed_text = self.process_speech(np.array(self.sentence_audio_buffer))
-                if transcribed_text:
-                    print(f"📝 Transcription: {transcribed_text}")
-
-                self.vad_iterator.reset_states()
-                self._reset_buffers()
+        self.audio_buffer.write(audio_np)
+
+        while self.audio_buffer.available >= self.CHUNK_SIZE:
+            windows = self.audio_buffer.available // self.CHUNK_SIZE
+            probabilities = self._vad_probabilities(self.audio_buffer.peek(windows * self.CHUNK_SIZE))
+
+            for speech_prob in probabilities:
+                chunk = self.audio_buffer.read(self.CHUNK_SIZE)
+                print(f"Speech probability: {speech_prob:.2f}")
+
+                utterance = self._update_speech_state(chunk, speech_prob)
+                if utterance is not None:
+                    transcribed_text = self.process_speech(utterance)
+                    if transcribed_text:
+                        print(f"📝 Transcription: {transcribed_text}")
+
+                    self.vad_iterator.reset_states()
+                    self._reset_buffers()
+                    break
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+import hashlib
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+
+class OCREngine:
+    """
+    EasyOCR front end with decoder choice, tiling and a cache for static screen regions.
+
+    Tiling splits large frames into equally sized, overlapping tiles that go through
+    Reader.readtext_batched together, so detection runs as one batch and recognition
+    batches the crops of all tiles. A box found in an overlap is only kept by the tile
+    whose core contains its center. Text lines longer than the overlap can still be split
+    at a tile border, so tiling is off by default.
+
+    Static regions (toolbars, a stream overlay) are recognized once and reused while their
+    pixels stay identical. The rest of the frame is OCRed with those regions blanked out.
+    """
+    DECODERS = ("greedy", "beamsearch", "wordbeamsearch")
+
+    def __init__(self, reader, decoder: str = "beamsearch", tile_size: int = 0, tile_overlap: int = 64,
+                 batch_size: int = 8):
+        """
+        Args:
+            reader: easyocr.Reader
+            decoder: "greedy" (fastest), "beamsearch" or "wordbeamsearch"
+            tile_size: Side length of square tiles in pixels, 0 reads the whole image at once
+            tile_overlap: Pixels neighboring tiles share, should exceed the height of a text line
+            batch_size: Recognizer batch size
+        """
+        self.reader = reader
+        self.decoder = decoder
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.batch_size = batch_size
+        # region -> (pixel hash, boxes, texts, confidences)
+        self.static_cache: Dict[Tuple, Tuple[str, np.ndarray, List[str], np.ndarray]] = {}
+        self.static_hits = 0
+        self.static_misses = 0
+
+    def read(self, image: np.ndarray, static_regions: Optional[Sequence[Tuple[int, int, int, int]]] = None,
+             decoder: Optional[str] = None, tile_size: Optional[int] = None) -> Tuple[np.ndarray, List[str], np.ndarray]:
+        """
+        Recognize text in an RGB or grayscale image array.
+
+        Args:
+            image: Image as a numpy array
+            static_regions: (left, top, right, bottom) boxes in image pixels whose results may be cached
+            decoder: Overrides the engine's decoder for this call
+            tile_size: Overrides the engine's tile size for this call
+
+        Returns:
+            Tuple of (boxes as an (n, 4, 2) float array in image pixels, texts, confidences)
+        """
+        decoder = decoder or self.decoder
+        if decoder not in self.DECODERS:
+            raise ValueError(f"Unknown OCR decoder '{decoder}', use one of {self.DECODERS}")
+        tile_size = self.tile_size if tile_size is None else tile_size
+
+        parts = []
+        if static_regions:
+            image = image.copy()  # Static regions get blanked out below
+            for region in static_regions:
+                left, top, right, bottom = self._clip(region, image.shape)
+                if right <= left or bottom <= top:
+                    continue
+                parts.append(self._read_static((left, top, right, bottom), image[top:bottom, left:right], decoder))
+                image[top:bottom, left:right] = 255
+        parts.append(self._read_tiled(image, decoder, tile_size))
+
+        boxes = np.concatenate([p[0] for p in parts]) if parts else np.zeros((0, 4, 2), dtype=np.float32)
+        texts = [text for p in parts for text in p[1]]
+        confidences = np.concatenate([p[2] for p in parts]) if parts else np.zeros(0, dtype=np.float32)
+        return boxes, texts, confidences
+
+    @staticmethod
+    def _clip(region, shape) -> Tuple[int, int, int, int]:
+        left, top, right, bottom = (int(v) for v in region)
+        return max(0, left), max(0, top), min(shape[1], right), min(shape[0], bottom)
+
+    def _read_static(self, region, crop: np.ndarray, decoder: str):
+        # Every pixel, a one-pixel glyph change (clock, counter) must invalidate the cached text
+        pixel_hash = hashlib.blake2b(np.ascontiguousarray(crop).tobytes(), digest_size=16).hexdigest()
+        key = (region, decoder)
+        cached = self.static_cache.get(key)
+        if cached is not None and cached[0] == pixel_hash:
+            self.static_hits += 1
+            return cached[1], cached[2], cached[3]
+
+        self.static_misses += 1
+        boxes, texts, confidences = self._read_tiled(crop, decoder, 0)
+        boxes = boxes + np.array([region[0], region[1]], dtype=np.float32)
+        self.static_cache[key] = (pixel_hash, boxes, texts, confidences)
+        return boxes, texts, confidences
+
+    def _read_tiled(self, image: np.ndarray, decoder: str, tile_size: int):
+        height, width = image.shape[:2]
+        if not tile_size or (height <= tile_size and width <= tile_size):
+            results = self.reader.readtext(image, decoder=decoder, batch_size=self.batch_size)
+            return self._to_arrays(results)
+
+        step = max(1, tile_size - self.tile_overlap)
+        xs = self._tile_origins(width, tile_size, step)
+        ys = self._tile_origins(height, tile_size, step)
+        tiles, origins = [], []
+        for y in ys:
+            for x in xs:
+                tile = image[y:y + tile_size, x:x + tile_size]
+                if tile.shape[0] != tile_size or tile.shape[1] != tile_size:
+                    # readtext_batched needs equally sized images, pad edge tiles with white
+                    padded = np.full((tile_size, tile_size) + image.shape[2:], 255, dtype=image.dtype)
+                    padded[:tile.shape[0], :tile.shape[1]] = tile
+                    tile = padded
+                tiles.append(tile)
+                origins.append((x, y))
+
+        batched = self.reader.readtext_batched(tiles, decoder=decoder, batch_size=self.batch_size)
+        half = self.tile_overlap / 2
+        parts = []
+        for (x, y), results in zip(origins, batched):
+            boxes, texts, confidences = self._to_arrays(results)
+            if not texts:
+                continue
+            boxes = boxes + np.array([x, y], dtype=np.float32)
+            # Keep boxes whose center lies in this tile's core, the neighbor owns the rest of the overlap
+            centers = boxes.mean(axis=1)
+            core_left = x + half if x > xs[0] else -np.inf
+            core_right = x + tile_size - half if x < xs[-1] else np.inf
+            core_top = y + half if y > ys[0] else -np.inf
+            core_bottom = y + tile_size - half if y < ys[-1] else np.inf
+            keep = ((centers[:, 0] >= core_left) & (centers[:, 0] < core_right) &
+                    (centers[:, 1] >= core_top) & (centers[:, 1] < core_bottom))
+            parts.append((boxes[keep], [t for t, k in zip(texts, keep) if k], confidences[keep]))
+
+        if not parts:
+            return self._to_arrays([])
+        return (np.concatenate([p[0] for p in parts]), [t for p in parts for t in p[1]],
+                np.concatenate([p[2] for p in parts]))
+
+    @staticmethod
+    def _tile_origins(length: int, tile_size: int, step: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        origins = list(range(0, length - tile_size, step))
+        origins.append(length - tile_size)  # Last tile flush with the edge instead of mostly padding
+        return origins
+
+    @staticmethod
+    def _to_arrays(results) -> Tuple[np.ndarray, List[str], np.ndarray]:
+        if not results:
+            return np.zeros((0, 4, 2), dtype=np.float32), [], np.zeros(0, dtype=np.float32)
+        boxes = np.asarray([r[0] for r in results], dtype=np.float32).reshape(len(results), 4, 2)
+        texts = [r[1] for r in results]
+        confidences = np.asarray([r[2] for r in results], dtype=np.float32)
+        return boxes, texts, confidences
+
+    def clear_cache(self):
+        self.static_cache.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "decoder": self.decoder,
+            "tile_size": self.tile_size,
+            "static_regions_cached": len(self.static_cache),
+            "static_hits": self.static_hits,
+            "static_misses": self.static_misses,
+        }
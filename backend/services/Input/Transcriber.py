@@ -0,0 +1,79 @@
+import asyncio
+import functools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import numpy as np
+import torch
+from faster_whisper import WhisperModel
+from ..lib.LAV_logger import logger
+
+
+class Transcriber:
+    """
+    faster-whisper transcription of in-memory float32 audio.
+
+    Audio is passed to WhisperModel.transcribe as a numpy array, no WAV file in between, and
+    transcribe_async runs it on a dedicated executor thread (CTranslate2 releases the GIL),
+    so the event loop and the mic path keep running while Whisper works.
+    """
+
+    def __init__(self, model_size: str = "medium", device: Optional[str] = None,
+                 compute_type: Optional[str] = None, language: str = "en", metrics_window: int = 50):
+        """
+        Args:
+            model_size: Whisper model size or path, e.g. "small", "medium", "large-v3"
+            device: "cuda" or "cpu", defaults to cuda when available
+            compute_type: CTranslate2 compute type, defaults to int8 on CPU and float16 on CUDA
+            language: Language code passed to Whisper
+        """
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.language = language
+        self.model_size = None
+        self.compute_type = None
+        self.model: Optional[WhisperModel] = None
+        # One worker keeps transcriptions in utterance order
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Whisper")
+        self._latencies = deque(maxlen=metrics_window)
+        self.load_model(model_size, compute_type)
+
+    def load_model(self, model_size: str, compute_type: Optional[str] = None):
+        compute_type = compute_type or ("float16" if self.device == "cuda" else "int8")
+        if self.model is not None and model_size == self.model_size and compute_type == self.compute_type:
+            return
+        logger.info(f"Loading Whisper model '{model_size}' ({self.device}, {compute_type})")
+        self.model = WhisperModel(model_size, device=self.device, compute_type=compute_type)
+        self.model_size = model_size
+        self.compute_type = compute_type
+
+    def transcribe(self, audio: np.ndarray, language: Optional[str] = None, **options) -> str:
+        """
+        Transcribe 16 kHz mono float32 audio and return the joined segment text.
+
+        Args:
+            options: Extra WhisperModel.transcribe arguments, e.g. beam_size=1 for quick partial results
+        """
+        start = time.perf_counter()
+        segments, _ = self.model.transcribe(np.asarray(audio, dtype=np.float32), language=language or self.language, **options)
+        text = "".join(segment.text for segment in segments)
+        self._latencies.append(time.perf_counter() - start)
+        return text
+
+    def transcribe_async(self, audio: np.ndarray, language: Optional[str] = None, **options) -> "asyncio.Future[str]":
+        """Queue a transcription on the Whisper thread, await the returned future for the text."""
+        # Copied right away, the caller's buffer is reused for the next utterance while this one is transcribed
+        audio = np.array(audio, dtype=np.float32, copy=True)
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, functools.partial(self.transcribe, audio, language, **options))
+
+    def get_metrics(self) -> dict:
+        latencies = list(self._latencies)
+        return {
+            "model_size": self.model_size,
+            "compute_type": self.compute_type,
+            "device": self.device,
+            "transcriptions": len(latencies),
+            "avg_latency_seconds": sum(latencies) / len(latencies) if latencies else 0.0,
+            "last_latency_seconds": latencies[-1] if latencies else 0.0,
+        }
@@ -1,19 +1,27 @@
+import io
 import mss
 from PIL import Image
-import easyocr
-from transformers import BlipProcessor, BlipForConditionalGeneration
 import torch
 import os
+import threading
 import numpy as np
 from typing import List, Tuple, Dict, Optional
 from ..lib.LAV_logger import logger
+from .FrameChangeDetector import FrameChangeDetector
+from .OCREngine import OCREngine
 import json
 import traceback
 
 class VisionInput:
     """
     Vision Input module for screen capture, OCR, and image captioning.
+
+    The OCR reader and the captioning model are loaded on first use, so screen capture
+    alone never pays for them.
     """
+    # Changed regions larger than this share of the frame get a full OCR pass instead of a partial one
+    PARTIAL_OCR_MAX_FRACTION = 0.5
+    IMAGE_FORMATS = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
     
     def __init__(self, languages: List[str] = ['en'], device: str = 'cpu'):
         """
@@ -24,27 +32,80 @@ class VisionInput:
             device: Device to run models on ('cpu' or 'cuda')
         """
         self.device = device
+        self.languages = languages
         self.logger = logger
-        
-        # Initialize OCR reader
-        try:
-            self.ocr_reader = easyocr.Reader(languages)
-            self.logger.info(f"OCR reader initialized with languages: {languages}")
-        except Exception as e:
-            self.logger.error(f"Failed to initialize OCR reader: {e}")
-            self.ocr_reader = None
-        
-        # Initialize image captioning model
-        try:
-            self.processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-            self.model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
-            if device == 'cuda' and torch.cuda.is_available():
-                self.model = self.model.to('cuda')
-            self.logger.info("Image captioning model initialized")
-        except Exception as e:
-            self.logger.error(f"Failed to initialize image captioning model: {e}")
-            self.processor = None
-            self.model = None
+        self.model_lock = threading.Lock()
+        self.ocr_reader = None
+        self.ocr_engine: Optional[OCREngine] = None
+        # OCR engine settings, see OCREngine
+        self.ocr_decoder = "beamsearch"
+        self.ocr_tile_size = 0
+        self.ocr_static_regions: List[Tuple[int, int, int, int]] = []  # Full resolution pixels
+        self.processor = None
+        self.model = None
+        # None until the first load attempt, then whether it succeeded
+        self.ocr_loaded: Optional[bool] = None
+        self.captioner_loaded: Optional[bool] = None
+        # mss handles are bound to the thread that opened them, so keep one per thread
+        self.capture_sessions = threading.local()
+        # Per monitor change detector and the OCR / caption results of the last processed frame
+        self.screen_cache: Dict[int, Dict] = {}
+        self.screen_lock = threading.Lock()
+
+    def load_ocr_reader(self):
+        """Initialize the OCR reader on first use."""
+        with self.model_lock:
+            if self.ocr_loaded is None:
+                try:
+                    import easyocr
+                    self.ocr_reader = easyocr.Reader(self.languages)
+                    self.ocr_engine = OCREngine(self.ocr_reader)
+                    self.logger.info(f"OCR reader initialized with languages: {self.languages}")
+                except Exception as e:
+                    self.logger.error(f"Failed to initialize OCR reader: {e}")
+                    self.ocr_reader = None
+                self.ocr_loaded = self.ocr_reader is not None
+        return self.ocr_reader
+
+    def load_captioner(self):
+        """Initialize the image captioning model on first use."""
+        with self.model_lock:
+            if self.captioner_loaded is None:
+                try:
+                    from transformers import BlipProcessor, BlipForConditionalGeneration
+                    self.processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
+                    self.model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+                    if self.device == 'cuda' and torch.cuda.is_available():
+                        self.model = self.model.to('cuda')
+                    self.logger.info("Image captioning model initialized")
+                except Exception as e:
+                    self.logger.error(f"Failed to initialize image captioning model: {e}")
+                    self.processor = None
+                    self.model = None
+                self.captioner_loaded = self.model is not None
+        return self.model
+
+    def get_status(self) -> Dict:
+        """
+        Readiness of the lazily loaded models.
+
+        Returns:
+            Dictionary with the state of the OCR reader and the captioning model
+        """
+        def state(loaded):
+            return "not_loaded" if loaded is None else ("ready" if loaded else "failed")
+        status = {"ocr": state(self.ocr_loaded), "captioning": state(self.captioner_loaded)}
+        if self.ocr_engine is not None:
+            status["ocr_engine"] = self.ocr_engine.get_stats()
+        return status
+
+    def get_capture_session(self) -> "mss.base.MSSBase":
+        """The calling thread's persistent mss capture session, opened on first use."""
+        sct = getattr(self.capture_sessions, "sct", None)
+        if sct is None:
+            sct = mss.mss()
+            self.capture_sessions.sct = sct
+        return sct
 
     def get_monitors(self) -> List[Dict]:
         """
@@ -54,9 +115,7 @@ class VisionInput:
             List of monitor dictionaries
         """
         try:
-            with mss.mss() as sct:
-                monitors = sct.monitors
-                return monitors
+            return list(self.get_capture_session().monitors)
         except Exception as e:
             self.logger.error(f"Failed to get monitors: {e}, {traceback.format_exc()}")
             return []
@@ -73,40 +132,43 @@ class VisionInput:
             PIL Image object or None if failed
         """
         try:
-            with mss.mss() as sct:
-                # Get monitor info
-                monitors = sct.monitors
-                self.logger.debug(f"Available monitors: {len(monitors)}")
-                self.logger.debug(f"Requested monitor index: {monitor_index}")
-                
-                # Validate monitor index
-                if monitor_index < 0 or monitor_index >= len(monitors):
-                    self.logger.warning(f"Monitor index {monitor_index} not available. Available monitors: 0-{len(monitors)-1}")
-                    # Try to find a valid monitor (skip monitor 0 which is usually "all monitors")
-                    if len(monitors) > 1:
-                        monitor_index = 1  # Default to first actual monitor
-                    else:
-                        monitor_index = 0
-                
-                self.logger.debug(f"Using monitor index: {monitor_index}")
-                self.logger.debug(f"Monitor info: {monitors[monitor_index]}")
-                
-                # Capture screenshot
-                screenshot = sct.grab(monitors[monitor_index])
-                img = Image.frombytes("RGB", (screenshot.width, screenshot.height), screenshot.rgb)
-                
-                # Save if path provided
-                if save_path:
-                    img.save(save_path)
-                    self.logger.info(f"Screenshot saved to: {save_path}")
-                
-                return img
-                
+            sct = self.get_capture_session()
+            # Get monitor info
+            monitors = sct.monitors
+            self.logger.debug(f"Available monitors: {len(monitors)}")
+            self.logger.debug(f"Requested monitor index: {monitor_index}")
+            
+            # Validate monitor index
+            if monitor_index < 0 or monitor_index >= len(monitors):
+                self.logger.warning(f"Monitor index {monitor_index} not available. Available monitors: 0-{len(monitors)-1}")
+                # Try to find a valid monitor (skip monitor 0 which is usually "all monitors")
+                if len(monitors) > 1:
+                    monitor_index = 1  # Default to first actual monitor
+                else:
+                    monitor_index = 0
+            
+            self.logger.debug(f"Using monitor index: {monitor_index}")
+            self.logger.debug(f"Monitor info: {monitors[monitor_index]}")
+            
+            # Capture screenshot
+            screenshot = sct.grab(monitors[monitor_index])
+            img = Image.frombytes("RGB", (screenshot.width, screenshot.height), screenshot.rgb)
+            
+            # Save if path provided
+            if save_path:
+                img.save(save_path)
+                self.logger.info(f"Screenshot saved to: {save_path}")
+            
+            return img
+            
         except Exception as e:
             self.logger.error(f"Failed to capture screenshot: {e}")
+            self.capture_sessions.sct = None  # Reopen next time, e.g. after a display change
             return None
     
-    def perform_ocr(self, image: Image.Image, confidence_threshold: float = 0.5, scale_factor: float = 0.5, save_scaled_image: bool = False, scaled_image_path: str = None) -> List[Dict]:
+    def perform_ocr(self, image: Image.Image, confidence_threshold: float = 0.5, scale_factor: float = 0.5, save_scaled_image: bool = False, scaled_image_path: str = None,
+                    decoder: Optional[str] = None, tile_size: Optional[int] = None,
+                    static_regions: Optional[List[Tuple[int, int, int, int]]] = None) -> List[Dict]:
         """
         Perform OCR on the given image.
         
@@ -116,11 +178,14 @@ class VisionInput:
             scale_factor: Factor to scale down the image (0.5 = half size) for faster processing
             save_scaled_image: Whether to save the scaled image used for OCR
             scaled_image_path: Path to save the scaled image if save_scaled_image is True
+            decoder: "greedy", "beamsearch" or "wordbeamsearch", defaults to ocr_decoder
+            tile_size: Tile side length in scaled pixels, 0 disables tiling, defaults to ocr_tile_size
+            static_regions: Boxes in image pixels whose results are cached while unchanged, defaults to ocr_static_regions
             
         Returns:
             List of dictionaries containing text, bounding box, and confidence
         """
-        if self.ocr_reader is None:
+        if self.load_ocr_reader() is None:
             self.logger.error("OCR reader not initialized")
             return []
         
@@ -130,7 +195,8 @@ class VisionInput:
             if scale_factor != 1.0:
                 new_width = int(original_size[0] * scale_factor)
                 new_height = int(original_size[1] * scale_factor)
-                scaled_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                # reducing_gap box-filters most of the way first, much faster than a full LANCZOS on 4K frames
+                scaled_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=3.0)
                 self.logger.info(f"Scaled image from {original_size} to {scaled_image.size} for OCR processing")
                 
                 # Save scaled image if requested
@@ -144,25 +210,23 @@ class VisionInput:
             image_array = np.array(scaled_image)
             
             # Perform OCR on the numpy array
-            results = self.ocr_reader.readtext(image_array, decoder='beamsearch')
+            if static_regions is None:
+                static_regions = self.ocr_static_regions
+            scaled_regions = [tuple(int(v * scale_factor) for v in region) for region in static_regions]
+            boxes, texts, confidences = self.ocr_engine.read(
+                image_array,
+                static_regions=scaled_regions,
+                decoder=decoder or self.ocr_decoder,
+                tile_size=self.ocr_tile_size if tile_size is None else tile_size
+            )
             
             # Filter results by confidence threshold and scale bounding boxes back to original size
-            filtered_results = []
-            for bbox, text, conf in results:
-                if conf >= confidence_threshold:
-                    # Scale bounding box coordinates back to original image size
-                    if scale_factor != 1.0:
-                        scaled_bbox = []
-                        for point in bbox:
-                            scaled_point = (int(point[0] / scale_factor), int(point[1] / scale_factor))
-                            scaled_bbox.append(scaled_point)
-                        bbox = scaled_bbox
-                    
-                    filtered_results.append({
-                        'text': text,
-                        'bbox': bbox,
-                        'confidence': conf
-                    })
+            keep = confidences >= confidence_threshold
+            bboxes = (boxes[keep] / scale_factor).astype(np.int64).tolist()
+            filtered_results = [
+                {'text': text, 'bbox': bbox, 'confidence': float(conf)}
+                for text, bbox, conf in zip([t for t, k in zip(texts, keep) if k], bboxes, confidences[keep])
+            ]
             
             self.logger.info(f"OCR completed: {len(filtered_results)} text regions detected")
             return filtered_results
@@ -181,7 +245,7 @@ class VisionInput:
         Returns:
             Generated caption string or None if failed
         """
-        if self.processor is None or self.model is None:
+        if self.load_captioner() is None:
             self.logger.error("Image captioning model not initialized")
             return None
         
@@ -209,9 +273,13 @@ class VisionInput:
     
     def process_screen(self, monitor_index: int = 0, save_screenshot: bool = False, 
                       screenshot_path: str = None, confidence_threshold: float = 0.5, 
-                      ocr_scale_factor: float = 0.5, skip_ocr: bool = False) -> Dict:
+                      ocr_scale_factor: float = 0.5, skip_ocr: bool = False,
+                      reuse_unchanged: bool = True) -> Dict:
         """
         Complete screen processing: capture screenshot, perform OCR, and generate caption.
+
+        With reuse_unchanged, OCR and caption of the previous frame are returned when the screen
+        has not changed, and OCR only runs on the changed region when a small part of it changed.
         
         Args:
             monitor_index: Index of the monitor to capture
@@ -220,14 +288,18 @@ class VisionInput:
             confidence_threshold: Minimum confidence for OCR
             ocr_scale_factor: Factor to scale down image for OCR processing (0.5 = half size)
             skip_ocr: Whether to skip OCR processing and only generate caption
+            reuse_unchanged: Whether to reuse results of the previous frame where the screen did not change
             
         Returns:
-            Dictionary containing screenshot, OCR results, and caption
+            Dictionary containing screenshot, OCR results, caption and whether the screen changed
         """
         result = {
             'screenshot': None,
             'ocr_results': [],
             'caption': None,
+            'changed': True,
+            'change_score': 1.0,
+            'cached': False,
             'success': False
         }
         
@@ -242,34 +314,147 @@ class VisionInput:
             return result
         
         result['screenshot'] = screenshot
-        
-        # Perform OCR unless skipped
-        if not skip_ocr:
-            # Create path for scaled image if screenshot is being saved
-            scaled_image_path = None
-            if save_screenshot and screenshot_path:
-                # Create a scaled version filename
-                base_name, ext = os.path.splitext(screenshot_path)
-                scaled_image_path = f"{base_name}_scaled{ext}"
-            
-            # Perform OCR with scaled image for faster processing
-            ocr_results = self.perform_ocr(screenshot, confidence_threshold, ocr_scale_factor, 
-                                         save_scaled_image=save_screenshot, scaled_image_path=scaled_image_path)
-            result['ocr_results'] = ocr_results
-        else:
-            # Skip OCR processing - return empty results
-            result['ocr_results'] = []
-            self.logger.info("OCR processing skipped")
-        
-        # Generate caption
-        caption = self.generate_caption(screenshot)
-        result['caption'] = caption
-        
+
+        with self.screen_lock:
+            cache = self.screen_cache.setdefault(monitor_index, {
+                'detector': FrameChangeDetector(),
+                'ocr_results': None,
+                'ocr_settings': None,
+                'caption': None
+            })
+            if reuse_unchanged:
+                changed, change_score, region = cache['detector'].compare(screenshot)
+            else:
+                cache['detector'].reset()
+                changed, change_score, region = True, 1.0, None
+            result['changed'] = changed
+            result['change_score'] = change_score
+            ocr_settings = (ocr_scale_factor, confidence_threshold)
+            previous_ocr = cache['ocr_results'] if cache['ocr_settings'] == ocr_settings else None
+            ocr_reused = caption_reused = False
+
+            # Perform OCR unless skipped
+            if not skip_ocr:
+                if not changed and previous_ocr is not None:
+                    ocr_results = previous_ocr
+                    ocr_reused = True
+                elif (region is not None and previous_ocr is not None
+                      and FrameChangeDetector.region_fraction(region, screenshot.size) <= self.PARTIAL_OCR_MAX_FRACTION):
+                    ocr_results = self._update_ocr_region(screenshot, previous_ocr, region,
+                                                          confidence_threshold, ocr_scale_factor)
+                else:
+                    # Create path for scaled image if screenshot is being saved
+                    scaled_image_path = None
+                    if save_screenshot and screenshot_path:
+                        # Create a scaled version filename
+                        base_name, ext = os.path.splitext(screenshot_path)
+                        scaled_image_path = f"{base_name}_scaled{ext}"
+
+                    # Perform OCR with scaled image for faster processing
+                    ocr_results = self.perform_ocr(screenshot, confidence_threshold, ocr_scale_factor,
+                                                 save_scaled_image=save_screenshot, scaled_image_path=scaled_image_path)
+                result['ocr_results'] = ocr_results
+                cache['ocr_results'] = ocr_results
+                cache['ocr_settings'] = ocr_settings
+            else:
+                # Skip OCR processing - return empty results
+                result['ocr_results'] = []
+                if changed:
+                    cache['ocr_results'] = None  # No longer matches the screen
+                self.logger.info("OCR processing skipped")
+
+            # Generate caption
+            if not changed and cache['caption'] is not None:
+                caption = cache['caption']
+                caption_reused = True
+            else:
+                caption = self.generate_caption(screenshot)
+                cache['caption'] = caption
+            result['caption'] = caption
+            result['cached'] = caption_reused and (skip_ocr or ocr_reused)
+
         result['success'] = True
         self.logger.info("Screen processing completed successfully")
         
         return result
     
+    def _update_ocr_region(self, screenshot: Image.Image, previous_ocr: List[Dict], region: Tuple[int, int, int, int],
+                           confidence_threshold: float, scale_factor: float) -> List[Dict]:
+        """
+        OCR only the changed region and merge it into the previous frame's results.
+
+        Args:
+            screenshot: Full resolution frame
+            previous_ocr: OCR results of the previous frame
+            region: (left, top, right, bottom) box that changed
+
+        Returns:
+            Previous results outside the region plus fresh results inside it
+        """
+        left, top, right, bottom = region
+        region_results = self.perform_ocr(screenshot.crop(region), confidence_threshold, scale_factor, static_regions=[])
+        for ocr_result in region_results:
+            ocr_result['bbox'] = [(int(x) + left, int(y) + top) for x, y in ocr_result['bbox']]
+
+        inside = FrameChangeDetector.boxes_in_region([r['bbox'] for r in previous_ocr], region)
+        kept = [ocr_result for ocr_result, replaced in zip(previous_ocr, inside) if not replaced]
+        self.logger.info(f"Partial OCR on region {region}: kept {len(kept)}, found {len(region_results)}")
+        return kept + region_results
+
+    def encode_image(self, image: Image.Image, image_format: str = "jpeg", quality: int = 80,
+                     max_dimension: int = 0) -> Tuple[bytes, str]:
+        """
+        Encode a screenshot for transport.
+        
+        Args:
+            image: PIL Image object
+            image_format: "jpeg", "webp" or "png"
+            quality: JPEG / WebP quality (1-100)
+            max_dimension: Downscale so neither side exceeds this many pixels, 0 keeps the full resolution
+            
+        Returns:
+            Tuple of (encoded bytes, mime type)
+        """
+        image_format = image_format.lower()
+        if image_format == "jpg":
+            image_format = "jpeg"
+        if image_format not in self.IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format '{image_format}', use one of {list(self.IMAGE_FORMATS)}")
+
+        if max_dimension and max(image.size) > max_dimension:
+            image = image.copy()
+            image.thumbnail((max_dimension, max_dimension), Image.Resampling.BILINEAR)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        buffer = io.BytesIO()
+        if image_format == "png":
+            image.save(buffer, format="PNG", compress_level=1)  # Fastest zlib level, PNG is lossless anyway
+        elif image_format == "webp":
+            image.save(buffer, format="WEBP", quality=quality, method=0)
+        else:
+            image.save(buffer, format="JPEG", quality=quality)
+        return buffer.getvalue(), self.IMAGE_FORMATS[image_format]
+
+    def serialize_ocr_results(self, ocr_results: List[Dict]) -> List[Dict]:
+        """
+        Convert OCR results to JSON serializable types in one NumPy pass instead of per value.
+        
+        Args:
+            ocr_results: List of OCR result dictionaries
+            
+        Returns:
+            List of dictionaries with integer bounding box points and float confidences
+        """
+        if not ocr_results:
+            return []
+        bboxes = np.asarray([r['bbox'] for r in ocr_results], dtype=np.float64).round().astype(np.int64).tolist()
+        confidences = np.asarray([r['confidence'] for r in ocr_results], dtype=np.float64).tolist()
+        return [
+            {'text': str(r['text']), 'bbox': bbox, 'confidence': confidence}
+            for r, bbox, confidence in zip(ocr_results, bboxes, confidences)
+        ]
+
     def get_detected_text(self, ocr_results: List[Dict]) -> str:
         """
         Extract all detected text from OCR results.
@@ -0,0 +1,156 @@
+import asyncio
+import time
+from typing import Dict, Optional
+from PIL import Image
+from ..lib.LAV_logger import logger
+from .VisionInput import VisionInput
+
+
+class VisionWatcher:
+    """
+    Samples a monitor in the background and keeps the latest OCR and caption in memory.
+
+    Each sample goes through VisionInput.process_screen, so unchanged frames are cheap and a
+    change confined to a few lines of text only re-runs OCR on that part of the screen.
+    Clients receive a "vision" message whenever the caption or the detected text changes,
+    containing the new caption and the text lines that appeared or disappeared.
+    """
+
+    def __init__(self, vision_input: VisionInput, interval: float = 2.0, monitor_index: int = 1,
+                 ocr_scale_factor: float = 0.5, skip_ocr: bool = False):
+        """
+        Args:
+            vision_input: VisionInput used to capture and analyze the screen
+            interval: Seconds between the start of two samples
+            monitor_index: Index of the monitor to watch
+            ocr_scale_factor: Factor to scale down the frame for OCR
+            skip_ocr: Whether to only caption the frames
+        """
+        self.vision_input = vision_input
+        self.interval = interval
+        self.monitor_index = monitor_index
+        self.ocr_scale_factor = ocr_scale_factor
+        self.skip_ocr = skip_ocr
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+        self.latest_result: Optional[Dict] = None
+        self.latest_timestamp: Optional[float] = None
+        self.samples = 0
+        self.changed_samples = 0
+        self.last_sample_seconds = 0.0
+
+    def start(self, clients):
+        if self.running:
+            return
+        self.running = True
+        self.task = asyncio.create_task(self._run(clients))
+        logger.info(f"Vision watcher started on monitor {self.monitor_index}, every {self.interval}s")
+
+    def stop(self):
+        self.running = False
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        logger.info("Vision watcher stopped")
+
+    def configure(self, interval: Optional[float] = None, monitor_index: Optional[int] = None,
+                  ocr_scale_factor: Optional[float] = None, skip_ocr: Optional[bool] = None):
+        if interval is not None:
+            self.interval = max(0.1, interval)
+        if monitor_index is not None and monitor_index != self.monitor_index:
+            self.monitor_index = monitor_index
+            self.latest_result = None
+        if ocr_scale_factor is not None:
+            self.ocr_scale_factor = ocr_scale_factor
+        if skip_ocr is not None:
+            self.skip_ocr = skip_ocr
+
+    async def _run(self, clients):
+        loop = asyncio.get_running_loop()
+        while self.running:
+            started = time.time()
+            try:
+                result = await loop.run_in_executor(None, lambda: self.vision_input.process_screen(
+                    monitor_index=self.monitor_index,
+                    confidence_threshold=0.5,
+                    ocr_scale_factor=self.ocr_scale_factor,
+                    skip_ocr=self.skip_ocr
+                ))
+                self.samples += 1
+                self.last_sample_seconds = time.time() - started
+                if result['success']:
+                    self.changed_samples += result['changed']
+                    previous = self.latest_result
+                    self.latest_result = result
+                    self.latest_timestamp = time.time()
+                    delta = self._delta(previous, result)
+                    if delta is not None:
+                        await self._broadcast(delta, clients)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Vision watcher sample failed: {e}", exc_info=True)
+            await asyncio.sleep(max(0.0, self.interval - (time.time() - started)))
+
+    def _delta(self, previous: Optional[Dict], current: Dict) -> Optional[Dict]:
+        """The changes between two samples as a client message, None if nothing changed."""
+        previous_lines = [r['text'] for r in previous['ocr_results']] if previous else []
+        current_lines = [r['text'] for r in current['ocr_results']]
+        previous_caption = previous['caption'] if previous else None
+        previous_set, current_set = set(previous_lines), set(current_lines)
+        added = [line for line in current_lines if line not in previous_set]
+        removed = [line for line in previous_lines if line not in current_set]
+        if previous is not None and not added and not removed and current['caption'] == previous_caption:
+            return None
+        return {
+            "type": "vision",
+            "timestamp": self.latest_timestamp,
+            "monitor_index": self.monitor_index,
+            "caption": current['caption'] or "",
+            "caption_changed": current['caption'] != previous_caption,
+            "added_text": added,
+            "removed_text": removed,
+            "extracted_text": self.vision_input.get_detected_text(current['ocr_results']),
+        }
+
+    async def _broadcast(self, message: Dict, clients):
+        results = await asyncio.gather(*[client.send_json(message) for client in list(clients)], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.debug(f"Failed to send vision update: {result}")
+
+    def get_latest(self, monitor_index: Optional[int] = None, max_age: Optional[float] = None) -> Optional[Dict]:
+        """
+        The most recent process_screen result.
+
+        Args:
+            monitor_index: Only return a result of this monitor
+            max_age: Only return a result at most this many seconds old
+
+        Returns:
+            The result dictionary, or None if there is no matching result
+        """
+        if self.latest_result is None:
+            return None
+        if monitor_index is not None and monitor_index != self.monitor_index:
+            return None
+        if max_age is not None and time.time() - self.latest_timestamp > max_age:
+            return None
+        return self.latest_result
+
+    def get_latest_image(self) -> Optional[Image.Image]:
+        result = self.get_latest(max_age=self.interval * 3) if self.running else None
+        return result['screenshot'] if result else None
+
+    def get_status(self) -> Dict:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "monitor_index": self.monitor_index,
+            "ocr_scale_factor": self.ocr_scale_factor,
+            "skip_ocr": self.skip_ocr,
+            "samples": self.samples,
+            "changed_samples": self.changed_samples,
+            "last_sample_seconds": self.last_sample_seconds,
+            "latest_timestamp": self.latest_timestamp,
+        }
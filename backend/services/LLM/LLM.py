@@ -16,6 +16,8 @@ class LLM:
         self.llm: BaseLLM | None = None
         self.all_model_data = None
         self.keep_model_loaded = False
+        # Optional callable returning a recent PIL screenshot for vision models
+        self.screenshot_provider = None
         
         # Default sampling parameters
         self.sampling_params = {
@@ -197,6 +199,7 @@ class LLM:
                     full_mmproj_path = os.path.join(model_folder, mmproj_path)
                     if os.path.exists(full_mmproj_path):
                         self.llm = VisionLLM(model_path=model_path, mmproj_path=full_mmproj_path, n_ctx=4096, n_gpu_layers=gpu_layers, seed=-1)
+                        self.llm.screenshot_provider = self.screenshot_provider
                     else:
                         logger.error(f"Vision model mmproj file not found: {full_mmproj_path}")
                         return
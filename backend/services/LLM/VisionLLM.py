@@ -19,6 +19,8 @@ class VisionLLM(BaseLLM):
         self.current_module_directory = os.path.dirname(__file__)
 
         self.screenshot_path = os.path.join(self.current_module_directory, "screen.png")
+        # Optional callable returning a recent PIL screenshot, e.g. from the vision watcher
+        self.screenshot_provider = None
         self.test_path = os.path.join(self.current_module_directory, "test.png")
 
         self.chat_handler = Llava16ChatHandler(clip_model_path=mmproj_path, verbose=False)
@@ -42,7 +44,9 @@ class VisionLLM(BaseLLM):
             messages.append(entry)
 
         if screenshot:
-            image = pyautogui.screenshot()
+            image = self.screenshot_provider() if self.screenshot_provider else None
+            if image is None:
+                image = pyautogui.screenshot()
             image.save(self.screenshot_path)
             data_uri = image_to_base64_data_uri(self.screenshot_path)
 
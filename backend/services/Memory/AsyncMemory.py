@@ -0,0 +1,133 @@
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from ..lib.LAV_logger import logger
+
+
+class AsyncMemory:
+    """
+    Coroutine front end for Memory, for use from FastAPI handlers.
+
+    Embedding and Qdrant calls run on a small dedicated thread pool, so they neither block the
+    event loop nor queue behind unrelated work in the default executor. Context lookups give up
+    after query_timeout and return no context, so a slow lookup never holds back an LLM request.
+    A lookup that timed out still finishes in the background and fills the cache for the next
+    identical request.
+
+    Query results are cached for cache_ttl seconds per (text, limit, session). Entries are tied to the
+    memory's write generation, so any insert or delete, including ones made by the indexer
+    directly on Memory, invalidates them.
+    """
+
+    def __init__(self, memory, max_workers: int = 2, query_timeout: float = 1.5, cache_ttl: float = 30.0,
+                 cache_size: int = 128):
+        """
+        Args:
+            memory: Memory service (or its LazyService proxy)
+            max_workers: Threads embedding and searching at the same time
+            query_timeout: Seconds to wait for a context lookup, None waits indefinitely
+            cache_ttl: Seconds a query result stays valid
+            cache_size: Maximum number of cached query results
+        """
+        self.memory = memory
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="memory")
+        self.query_timeout = query_timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        # (text, limit, session id) -> (stored at, write generation, result)
+        self.cache: "OrderedDict[Tuple[str, int, Optional[str]], Tuple[float, int, List]]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.timeouts = 0
+
+    def _call(self, method: str, *args, **kwargs) -> asyncio.Future:
+        # The attribute is looked up on the worker thread, a LazyService may still have to load
+        return asyncio.get_running_loop().run_in_executor(
+            self.executor, lambda: getattr(self.memory, method)(*args, **kwargs))
+
+    def _generation(self) -> Optional[int]:
+        if not getattr(self.memory, "loaded", True):
+            return None
+        return self.memory.write_generation
+
+    def _cached(self, key: Tuple) -> Optional[List]:
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        stored_at, generation, result = entry
+        if time.time() - stored_at > self.cache_ttl or generation != self._generation():
+            del self.cache[key]
+            return None
+        self.cache.move_to_end(key)
+        return result
+
+    def _store(self, key: Tuple, generation: Optional[int], future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None or generation is None:
+            return
+        # A write that landed while the lookup ran may not be reflected in the result
+        if generation != self._generation():
+            return
+        self.cache[key] = (time.time(), generation, future.result())
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def query(self, text: str, limit: int = 3, session_id: Optional[str] = None,
+                    timeout: Optional[float] = -1) -> List[Dict[str, Any]]:
+        """
+        Memories most similar to text.
+
+        Args:
+            text: Query text
+            limit: Maximum number of results
+            session_id: Session of the conversation the lookup is for
+            timeout: Seconds to wait, -1 uses query_timeout, None waits indefinitely
+
+        Returns:
+            The results of Memory.query, an empty list if the lookup timed out
+        """
+        key = (text, limit, session_id)
+        cached = self._cached(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return list(cached)
+        self.cache_misses += 1
+
+        generation = self._generation()
+        future = self._call("query", text, limit, session_id)
+        future.add_done_callback(lambda f: self._store(key, generation, f))
+        timeout = self.query_timeout if timeout == -1 else timeout
+        try:
+            # Shielded so a timeout leaves the lookup running to fill the cache
+            result = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Memory query timed out after {timeout}s, continuing without context")
+            return []
+        return list(result)
+
+    async def insert_history(self, *args, **kwargs):
+        return await self._call("insert_history", *args, **kwargs)
+
+    async def query_by_session(self, session_id: str, limit: Optional[int] = 10) -> List[Dict]:
+        return await self._call("query_by_session", session_id, limit)
+
+    async def delete_session_messages(self, session_id: str) -> bool:
+        return await self._call("delete_session_messages", session_id)
+
+    async def delete_all_messages(self) -> bool:
+        return await self._call("delete_all_messages")
+
+    def clear_cache(self):
+        self.cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "query_timeout": self.query_timeout,
+            "cache_entries": len(self.cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "timeouts": self.timeouts,
+        }
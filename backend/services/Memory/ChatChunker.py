@@ -101,7 +101,8 @@ class ChatChunker:
     def chunk_history(self, history: List[Dict[str, str]], 
                      session_id: str = "",
                      format_style: str = "simple",
-                     include_metadata: bool = True) -> List[Dict[str, Any]]:
+                     include_metadata: bool = True,
+                     start_message: int = 0) -> List[Dict[str, Any]]:
         """
         Create chunks from chat history ready for insertion into memory.
         
@@ -110,6 +111,9 @@ class ChatChunker:
             session_id: Session identifier for the chunks
             format_style: How to format the messages
             include_metadata: Whether to include additional metadata
+            start_message: Only create the windows that end after this many messages, i.e. the
+                windows that changed since history[:start_message] was chunked. Window indexes
+                stay the same as for the full history.
             
         Returns:
             List of chunk dictionaries with 'text' and optional 'metadata' keys
@@ -118,6 +122,8 @@ class ChatChunker:
         chunks = []
         
         for i, window in enumerate(windows):
+            if min(i * self.stride + self.window_size, len(history)) <= start_message:
+                continue
             chunk_text = self.format_window_as_text(window, format_style)
             
             chunk_data = {
@@ -127,6 +133,7 @@ class ChatChunker:
             if include_metadata:
                 chunk_data["metadata"] = {
                     "window_index": i,
+                    "start_message": i * self.stride,
                     "window_size": len(window),
                     "message_count": len(window),
                     "first_message_role": window[0].get('role') if window else None,
@@ -1,9 +1,20 @@
+import functools
 import json
 import os
+import threading
 import uuid
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 
+def _synchronized(method):
+    """Serialize read-modify-write cycles on session files, indexing runs on background threads."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class HistoryStore:
     def __init__(self, sessions_dir_name: str = "chat_sessions"):
         """
@@ -13,6 +24,7 @@ class HistoryStore:
             sessions_dir (str): Directory where chat session files will be stored
         """
         self.sessions_dir = os.path.join(os.path.dirname(__file__), sessions_dir_name)
+        self.lock = threading.RLock()
         self._ensure_sessions_dir()
 
     def _ensure_sessions_dir(self) -> None:
@@ -41,7 +53,12 @@ class HistoryStore:
             "created_at": datetime.now().isoformat(),
             "history": [],
             "indexed": False,
-            "indexed_at": None
+            "indexed_at": None,
+            "indexed_message_count": 0,
+            "indexed_prefix_hash": None,
+            "indexed_window_hashes": None,
+            "index_params": None,
+            "index_disabled": False
         }
         
         session_path = self._get_session_path(session_id)
@@ -50,6 +67,7 @@ class HistoryStore:
             
         return session_data
 
+    @_synchronized
     def update_session(self, session_id: str, history: List[Dict[str, str]]) -> bool:
         """
         Update an existing chat session with new history.
@@ -77,6 +95,7 @@ class HistoryStore:
         except (json.JSONDecodeError, IOError):
             return False
 
+    @_synchronized
     def update_session_title(self, session_id: str, title: str) -> bool:
         """
         Update the title of an existing chat session.
@@ -104,13 +123,21 @@ class HistoryStore:
         except (json.JSONDecodeError, IOError):
             return False
 
-    def mark_session_indexed(self, session_id: str, indexed: bool = True) -> bool:
+    @_synchronized
+    def mark_session_indexed(self, session_id: str, indexed: bool = True, message_count: Optional[int] = None,
+                             prefix_hash: Optional[str] = None, index_params: Optional[Dict[str, Any]] = None,
+                             window_hashes: Optional[List[Optional[str]]] = None) -> bool:
         """
         Mark a session as indexed or not indexed.
         
         Args:
             session_id (str): ID of the session to update
             indexed (bool): Whether the session is indexed
+            message_count (Optional[int]): Number of leading messages that are in memory
+            prefix_hash (Optional[str]): Hash of those messages, to notice edits of already indexed history
+            index_params (Optional[Dict[str, Any]]): Chunking parameters the session was indexed with
+            window_hashes (Optional[List[Optional[str]]]): Text hash of every indexed window by window index,
+                None for windows without text
             
         Returns:
             bool: True if update was successful, False if session doesn't exist
@@ -125,6 +152,38 @@ class HistoryStore:
             
             session_data["indexed"] = indexed
             session_data["indexed_at"] = datetime.now().isoformat() if indexed else None
+            session_data["indexed_message_count"] = message_count if indexed and message_count is not None else 0
+            session_data["indexed_prefix_hash"] = prefix_hash if indexed else None
+            session_data["index_params"] = index_params if indexed else None
+            session_data["indexed_window_hashes"] = window_hashes if indexed else None
+            
+            with open(session_path, 'w', encoding='utf-8') as f:
+                json.dump(session_data, f, ensure_ascii=False, indent=2)
+            return True
+        except (json.JSONDecodeError, IOError):
+            return False
+
+    @_synchronized
+    def set_index_disabled(self, session_id: str, disabled: bool = True) -> bool:
+        """
+        Opt a session out of automatic indexing, or back in.
+        
+        Args:
+            session_id (str): ID of the session to update
+            disabled (bool): Whether background indexing has to leave the session alone
+            
+        Returns:
+            bool: True if update was successful, False if session doesn't exist
+        """
+        session_path = self._get_session_path(session_id)
+        if not os.path.exists(session_path):
+            return False
+            
+        try:
+            with open(session_path, 'r', encoding='utf-8') as f:
+                session_data = json.load(f)
+            
+            session_data["index_disabled"] = disabled
             
             with open(session_path, 'w', encoding='utf-8') as f:
                 json.dump(session_data, f, ensure_ascii=False, indent=2)
@@ -178,6 +237,7 @@ class HistoryStore:
         except (json.JSONDecodeError, IOError):
             return None
 
+    @_synchronized
     def delete_session(self, session_id: str) -> bool:
         """
         Delete a chat session.
@@ -3,12 +3,13 @@ import os
 import re
 import uuid
 from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue, Distance, VectorParams
+from qdrant_client.models import Filter, FieldCondition, FilterSelector, MatchValue, PayloadSchemaType, PointIdsList, Distance, VectorParams
 import time
 from ..lib.LAV_logger import logger
 import datetime
 from typing import List, Dict, Any, Optional
 from .ChatChunker import ChatChunker
+from .RetrievalEngine import RetrievalEngine
 
 class Memory:
     MESSAGE_COLLECTION_NAME = "memory_collection"
@@ -22,6 +23,12 @@ class Memory:
             self.client = QdrantClient(path=self.data_path)
         
         self.client.set_model("sentence-transformers/all-MiniLM-L6-v2")
+        # Bumped on every write, lets query caches notice that results may have changed
+        self.write_generation = 0
+        self.session_index_ready = False
+        self.retrieval = RetrievalEngine()
+        if self.client.collection_exists(self.MESSAGE_COLLECTION_NAME):
+            self.ensure_session_index()
     
     def check_collection_exists(self):
         if not self.client.collection_exists(self.MESSAGE_COLLECTION_NAME):
@@ -30,8 +37,116 @@ class Memory:
         return True
 
 
+    SCROLL_PAGE_SIZE = 256
+
+    def ensure_session_index(self):
+        """Create the keyword payload index on session_id that session scoped filters use."""
+        if self.session_index_ready:
+            return
+        try:
+            self.client.create_payload_index(
+                collection_name=self.MESSAGE_COLLECTION_NAME,
+                field_name="session_id",
+                field_schema=PayloadSchemaType.KEYWORD
+            )
+            self.session_index_ready = True
+        except Exception as e:
+            logger.warning(f"Failed to create session_id payload index: {e}")
+
+    @staticmethod
+    def session_filter(session_id: str) -> Filter:
+        return Filter(
+            must=[
+                FieldCondition(
+                    key="session_id",
+                    match=MatchValue(value=session_id)
+                )
+            ]
+        )
+
+    # Namespace of the deterministic chunk ids, uuid5(namespace, "<session_id>:<window_index>")
+    CHUNK_ID_NAMESPACE = uuid.UUID("6f1c1d0e-8a53-4c1b-9d8e-2f7a6b3e5c41")
+
+    @classmethod
+    def chunk_id(cls, session_id: str, window_index: int) -> str:
+        """Point id of a session window, the same on every indexing run so writes are idempotent upserts."""
+        return str(uuid.uuid5(cls.CHUNK_ID_NAMESPACE, f"{session_id}:{window_index}"))
+
+    def build_chunks(self, history: List[Dict[str, str]], session_id: str = "", window_size: int = 3,
+                     stride: int = 1, format_style: str = "simple", start_message: int = 0):
+        """
+        Chunk history into documents, metadata and ids ready for upsert_chunks.
+        
+        Args:
+            history: List of message dictionaries with 'role' and 'content' keys
+            session_id: Session identifier for the chunks
+            window_size: Number of messages per chunk
+            stride: Number of messages to move forward for each new chunk
+            format_style: How to format the messages ("simple", "detailed", "markdown")
+            start_message: Only build the windows that end after this many messages
+            
+        Returns:
+            Tuple of (documents, metadata list, ids)
+        """
+        chunker = ChatChunker(window_size=window_size, stride=stride)
+        chunks = chunker.chunk_history(history, session_id, format_style, include_metadata=True,
+                                       start_message=start_message)
+        total_chunks = len(chunker.create_sliding_windows(history))
+
+        documents = []
+        metadata_list = []
+        ids = []
+        time_str = '{:%Y-%m-%d %H:%M:%S.%f}'.format(datetime.datetime.now())
+
+        for chunk in chunks:
+            # Extract text from chunk
+            chunk_text = chunk.get("text", "")
+            if not chunk_text.strip():
+                continue
+            window_index = chunk["metadata"]["window_index"]
+
+            # Create metadata for this chunk
+            chunk_metadata = {
+                "session_id": session_id,
+                "time": time_str,
+                "chunk_index": window_index,
+                "total_chunks": total_chunks
+            }
+            chunk_metadata.update(chunk["metadata"])
+
+            documents.append(chunk_text)
+            metadata_list.append(chunk_metadata)
+            ids.append(self.chunk_id(session_id, window_index))
+        return documents, metadata_list, ids
+
+    def upsert_chunks(self, documents: List[str], metadata_list: List[Dict[str, Any]], ids: List[str],
+                      parallel: Optional[int] = None):
+        """
+        Embed and upsert chunks, points with an existing id are replaced.
+        
+        Args:
+            parallel: fastembed data parallel workers for large batches, 0 uses all cores, None embeds in this thread
+        """
+        if not documents:
+            return []
+        response = self.client.add(
+            collection_name=self.MESSAGE_COLLECTION_NAME,
+            documents=documents,
+            metadata=metadata_list,
+            ids=ids,
+            parallel=parallel
+        )
+        self.write_generation += 1
+        # Stored payloads are the metadata plus the text under "document"
+        self.retrieval.add(ids, [dict(metadata, document=document)
+                                 for document, metadata in zip(documents, metadata_list)])
+        # add() creates the collection on first use
+        self.ensure_session_index()
+        return response
+
     def insert_history(self, history: List[Dict[str, str]], session_id: str = "", 
-                      window_size: int = 3, stride: int = 1, format_style: str = "simple"):
+                      window_size: int = 3, stride: int = 1, format_style: str = "simple",
+                      start_message: int = 0):
         """
         Insert chat history into memory by chunking it first.
         
@@ -41,59 +156,22 @@ class Memory:
             window_size: Number of messages per chunk
             stride: Number of messages to move forward for each new chunk
             format_style: How to format the messages ("simple", "detailed", "markdown")
+            start_message: Only insert the windows that end after this many messages,
+                for indexing the new tail of an already indexed session
         """
         if not history:
             logger.warning("Empty history provided, nothing to insert")
             return None
             
         try:
-            # Create chunks from the history
-            chunker = ChatChunker(window_size=window_size, stride=stride)
-            chunks = chunker.chunk_history(history, session_id, format_style, include_metadata=True)
-            
-            if not chunks:
-                logger.warning("No chunks created from history")
-                return None
-                
-            # Prepare data for insertion
-            documents = []
-            metadata_list = []
-            ids = []
-            time_str = '{:%Y-%m-%d %H:%M:%S.%f}'.format(datetime.datetime.now())
-            
-            for i, chunk in enumerate(chunks):
-                # Extract text from chunk
-                chunk_text = chunk.get("text", "")
-                if not chunk_text.strip():
-                    continue
-                    
-                # Create metadata for this chunk
-                chunk_metadata = {
-                    "session_id": session_id,
-                    "time": time_str,
-                    "chunk_index": i,
-                    "total_chunks": len(chunks)
-                }
-                
-                # Add chunk-specific metadata if available
-                if "metadata" in chunk:
-                    chunk_metadata.update(chunk["metadata"])
-                
-                documents.append(chunk_text)
-                metadata_list.append(chunk_metadata)
-                ids.append(str(uuid.uuid4()))
-            
+            documents, metadata_list, ids = self.build_chunks(history, session_id, window_size, stride,
+                                                              format_style, start_message)
             if not documents:
                 logger.warning("No valid documents to insert after chunking")
                 return None
                 
-            # Insert all chunks into the vector database
-            response = self.client.add(
-                collection_name=self.MESSAGE_COLLECTION_NAME,
-                documents=documents,
-                metadata=metadata_list,
-                ids=ids
-            )
+            # Upsert all chunks into the vector database
+            response = self.upsert_chunks(documents, metadata_list, ids)
             
             logger.info(f"Inserted {len(documents)} chunks from {len(history)} messages for session {session_id}")
             logger.debug(f"Chunks inserted with metadata: {metadata_list}")
@@ -104,18 +182,44 @@ class Memory:
             logger.error(f"Error inserting history for session {session_id}: {e}")
             return None
 
-    def query(self, text, limit = 3)  -> list:
+    def query(self, text, limit = 3, session_id: Optional[str] = None)  -> list:
+        """
+        Chunks relevant to text, ranked by RetrievalEngine: dense and BM25 fused, weighted by
+        recency and with overlapping windows thinned out.
+        
+        Args:
+            text: Query text
+            limit: Maximum number of results
+            session_id: Session whose chunks are weighted by the engine's session_weight
+            
+        Returns:
+            Chunk payloads (metadata and "document") with a relevance "score", best first
+        """
         if not self.check_collection_exists(): return []
+        self.retrieval.ensure_built(self._scroll_all)
         search_result = self.client.query(
             collection_name=self.MESSAGE_COLLECTION_NAME,
             query_text = text,
-            limit = limit
+            limit = self.retrieval.candidate_count(limit)
         )
         # logger.debug(f"Search result: {search_result}")
-        result = []
-        for s in search_result:
-            result.append(s.metadata)
-        return result
+        dense = [(s.id, s.score, s.metadata) for s in search_result]
+        return self.retrieval.rank(text, dense, limit, session_id)
+
+    def _scroll_all(self):
+        """(id, payload) of every point in the collection, page by page."""
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.MESSAGE_COLLECTION_NAME,
+                limit=self.SCROLL_PAGE_SIZE,
+                offset=offset,
+                with_vectors=False
+            )
+            for point in points:
+                yield point.id, point.payload if isinstance(point.payload, dict) else {}
+            if offset is None:
+                break
 
     def get(self, limit = 50, offset = 0):
         if not self.check_collection_exists(): return None
@@ -123,34 +227,38 @@ class Memory:
                            limit=limit, 
                            offset=offset)[0]
 
-    def query_by_session(self, session_id: str, limit: int = 10) -> List[Dict]:
-        """Query memory for messages from a specific session."""
+    def query_by_session(self, session_id: str, limit: Optional[int] = 10) -> List[Dict]:
+        """
+        Query memory for messages from a specific session.
+        
+        Args:
+            session_id: Session to list
+            limit: Maximum number of messages, None lists the whole session
+        """
         if not self.check_collection_exists():
             return []
         
         try:
-            search_result = self.client.scroll(
-                collection_name=self.MESSAGE_COLLECTION_NAME,
-                scroll_filter=Filter(
-                    must=[
-                        FieldCondition(
-                            key="session_id",
-                            match=MatchValue(value=session_id)
-                        )
-                    ]
-                ),
-                limit=limit
-            )[0]
-            
             result = []
-            for item in search_result:
-                doc = ""
-                if isinstance(item.payload, dict):
-                    doc = item.payload.get("document", "")
-                result.append({
-                    "text": doc,
-                    "metadata": item.payload if isinstance(item.payload, dict) else {}
-                })
+            offset = None
+            # Page through the session, cost grows with its size rather than the collection's
+            while limit is None or len(result) < limit:
+                page_size = self.SCROLL_PAGE_SIZE if limit is None else min(self.SCROLL_PAGE_SIZE, limit - len(result))
+                points, offset = self.client.scroll(
+                    collection_name=self.MESSAGE_COLLECTION_NAME,
+                    scroll_filter=self.session_filter(session_id),
+                    limit=page_size,
+                    offset=offset,
+                    with_vectors=False
+                )
+                for item in points:
+                    payload = item.payload if isinstance(item.payload, dict) else {}
+                    result.append({
+                        "text": payload.get("document", ""),
+                        "metadata": payload
+                    })
+                if offset is None:
+                    break
             return result
         except Exception as e:
             logger.error(f"Error querying session {session_id}: {e}")
@@ -162,33 +270,37 @@ class Memory:
             return False
         
         try:
-            # Get all points for the session
-            points = self.client.scroll(
+            # Delete by filter, every point of the session goes regardless of how many there are
+            self.client.delete(
                 collection_name=self.MESSAGE_COLLECTION_NAME,
-                scroll_filter=Filter(
-                    must=[
-                        FieldCondition(
-                            key="session_id",
-                            match=MatchValue(value=session_id)
-                        )
-                    ]
-                ),
-                limit=1000  # Adjust as needed
-            )[0]
-            
-            if points:
-                point_ids = [point.id for point in points]
-                self.client.delete(
-                    collection_name=self.MESSAGE_COLLECTION_NAME,
-                    points_selector=point_ids
-                )
-                logger.info(f"Deleted {len(point_ids)} messages for session {session_id}")
+                points_selector=FilterSelector(filter=self.session_filter(session_id))
+            )
+            logger.info(f"Deleted messages for session {session_id}")
             
+            self.retrieval.remove_session(session_id)
+            self.write_generation += 1
             return True
         except Exception as e:
             logger.error(f"Error deleting session {session_id}: {e}")
             return False
 
+    def delete_chunks(self, ids: List[str]) -> bool:
+        """Delete chunks by point id, e.g. windows that no longer exist after a session was shortened."""
+        if not ids or not self.check_collection_exists():
+            return True
+
+        try:
+            self.client.delete(
+                collection_name=self.MESSAGE_COLLECTION_NAME,
+                points_selector=PointIdsList(points=ids)
+            )
+            self.retrieval.remove(ids)
+            self.write_generation += 1
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting {len(ids)} chunks: {e}")
+            return False
+
     def delete_all_messages(self) -> bool:
         """Delete all messages from the memory collection."""
         if not self.check_collection_exists():
@@ -198,6 +310,9 @@ class Memory:
             # Delete the entire collection and recreate it
             self.client.delete_collection(self.MESSAGE_COLLECTION_NAME)
             logger.info(f"Deleted entire collection: {self.MESSAGE_COLLECTION_NAME}")
+            self.retrieval.clear()
+            self.write_generation += 1
+            self.session_index_ready = False
             return True
         except Exception as e:
             logger.error(f"Error deleting all messages: {e}")
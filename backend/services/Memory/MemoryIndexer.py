@@ -0,0 +1,358 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from ..lib.LAV_logger import logger
+from .ChatChunker import ChatChunker
+from .HistoryStore import HistoryStore
+
+
+class MemoryIndexer:
+    """
+    Keeps chat sessions in memory up to date without re-embedding what is already there.
+
+    Each session remembers a hash of every indexed window's text and the chunking parameters
+    used. Indexing again builds the window texts, which is cheap, and only embeds the windows
+    whose hash changed or that are new, so regenerating or editing a reply re-embeds just the
+    few windows containing it. Chunk ids are derived from (session_id, window_index), so a
+    changed window replaces itself, and windows past the end of a shortened history are
+    deleted. When the parameters changed the session is indexed from scratch.
+
+    With auto_index on, sessions handed to enqueue_session are indexed by a worker thread.
+    It waits flush_interval for more sessions to arrive, then embeds the new windows of all of
+    them together, one fastembed call per batch_size windows. Window hashes are only stored once
+    a batch is written, so turns that are still queued at shutdown get indexed next time. Sessions whose
+    index was removed (remove_session) are skipped by the queue and by reindex-all until they
+    are indexed manually again.
+    """
+
+    def __init__(self, memory, history_store: HistoryStore, window_size: int = 3, stride: int = 1,
+                 format_style: str = "simple", auto_index: bool = True, batch_size: int = 32,
+                 flush_interval: float = 2.0):
+        """
+        Args:
+            memory: Memory service (or its LazyService proxy)
+            history_store: Store the sessions are read from and their index state is written to
+            window_size: Default number of messages per chunk
+            stride: Default number of messages between the starts of two chunks
+            format_style: Default message format ("simple", "detailed", "markdown")
+            auto_index: Whether enqueue_session queues sessions for indexing
+            batch_size: Maximum number of windows the queue embeds per call
+            flush_interval: Seconds the queue collects sessions before embedding their windows
+        """
+        self.memory = memory
+        self.history_store = history_store
+        self.window_size = window_size
+        self.stride = stride
+        self.format_style = format_style
+        # Held while a session's windows are built and written, so a reset never races an upsert
+        self.write_lock = threading.RLock()
+        self.reindex_lock = threading.Lock()
+        self.progress: Dict[str, Any] = {"running": False}
+
+        self.auto_index = auto_index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending: Dict[str, float] = {}  # session id -> time it was first queued
+        self.queue_condition = threading.Condition()
+        self.queue_thread: Optional[threading.Thread] = None
+        self.queue_batches = 0
+        self.queue_chunks_written = 0
+        self.queue_failures = 0
+        self.last_flush_seconds = 0.0
+
+    @staticmethod
+    def history_hash(history: List[Dict[str, str]]) -> str:
+        return hashlib.sha1(json.dumps(history, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def window_hash(document: str) -> str:
+        return hashlib.sha1(document.encode("utf-8")).hexdigest()
+
+    def _params(self, window_size: Optional[int], stride: Optional[int], format_style: Optional[str]) -> Dict[str, Any]:
+        return {
+            "window_size": window_size or self.window_size,
+            "stride": stride or self.stride,
+            "format_style": format_style or self.format_style,
+        }
+
+    def _indexed_hashes(self, session: Dict[str, Any], params: Dict[str, Any], force: bool,
+                        window_hashes: List[Optional[str]]) -> Tuple[List[Optional[str]], bool]:
+        """Hashes of the windows that are in memory and whether the session's points have to be dropped first."""
+        if not session.get("indexed"):
+            return [], False
+        if force or session.get("index_params") != params:
+            return [], True
+        stored = session.get("indexed_window_hashes")
+        if stored is not None:
+            return stored, False
+
+        # Indexed before window hashes were stored, the windows inside an unedited indexed prefix are current
+        history = session.get("history", [])
+        count = session.get("indexed_message_count") or 0
+        if count > len(history) or session.get("indexed_prefix_hash") != self.history_hash(history[:count]):
+            return [], True
+        return [window_hash if min(i * params["stride"] + params["window_size"], len(history)) <= count else None
+                for i, window_hash in enumerate(window_hashes)], False
+
+    def _prepare(self, session: Dict[str, Any], params: Dict[str, Any], force: bool):
+        history = session.get("history", [])
+        documents, metadata_list, ids = self.memory.build_chunks(history, session["id"], **params)
+        window_count = len(ChatChunker(params["window_size"], params["stride"]).create_sliding_windows(history))
+        window_hashes: List[Optional[str]] = [None] * window_count
+        for document, metadata in zip(documents, metadata_list):
+            window_hashes[metadata["window_index"]] = self.window_hash(document)
+
+        indexed_hashes, reset = self._indexed_hashes(session, params, force, window_hashes)
+        if reset:
+            self.memory.delete_session_messages(session["id"])
+        changed = [i for i, metadata in enumerate(metadata_list)
+                   if metadata["window_index"] >= len(indexed_hashes)
+                   or indexed_hashes[metadata["window_index"]] != window_hashes[metadata["window_index"]]]
+        # Windows that are in memory but no longer exist or lost their text
+        stale_ids = [self.memory.chunk_id(session["id"], i) for i, indexed_hash in enumerate(indexed_hashes)
+                     if indexed_hash is not None and (i >= window_count or window_hashes[i] is None)]
+
+        start_message = min((metadata_list[i]["start_message"] for i in changed), default=len(history))
+        state = (session["id"], len(history), self.history_hash(history), params, window_hashes, stale_ids)
+        return ([documents[i] for i in changed], [metadata_list[i] for i in changed], [ids[i] for i in changed],
+                start_message, state)
+
+    def _write(self, documents: List[str], metadata_list: List[Dict[str, Any]], ids: List[str], states: List,
+               parallel: Optional[int] = None):
+        stale_ids = [chunk_id for state in states for chunk_id in state[5]]
+        if stale_ids and not self.memory.delete_chunks(stale_ids):
+            raise RuntimeError(f"Failed to delete {len(stale_ids)} stale chunks")
+        self.memory.upsert_chunks(documents, metadata_list, ids, parallel=parallel)
+        for session_id, message_count, prefix_hash, params, window_hashes, _ in states:
+            self.history_store.mark_session_indexed(session_id, True, message_count, prefix_hash, params, window_hashes)
+
+    def index_session(self, session_id: str, window_size: Optional[int] = None, stride: Optional[int] = None,
+                      format_style: Optional[str] = None, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Index the messages of a session that are not in memory yet. Blocks while embedding.
+
+        Args:
+            session_id: Session to index
+            window_size: Number of messages per chunk
+            stride: Number of messages to move forward for each new chunk
+            format_style: How to format the messages
+            force: Drop the session's points and index it from scratch
+
+        Returns:
+            Dictionary with chunks_written, start_message and message_count, None if the session doesn't exist
+        """
+        session = self.history_store.get_session_history(session_id)
+        if session is None:
+            return None
+        params = self._params(window_size, stride, format_style)
+        with self.write_lock:
+            if session.get("index_disabled"):
+                # Indexing by hand opts the session back into automatic indexing
+                self.history_store.set_index_disabled(session_id, False)
+            documents, metadata_list, ids, start_message, state = self._prepare(session, params, force)
+            self._write(documents, metadata_list, ids, [state])
+        logger.info(f"Indexed session {session_id}: {len(documents)} chunks from message {start_message} "
+                    f"of {state[1]}")
+        return {
+            "session_id": session_id,
+            "chunks_written": len(documents),
+            "start_message": start_message,
+            "message_count": state[1],
+        }
+
+    def start_reindex_all(self, rebuild: bool = False, batch_size: int = 16, parallel: Optional[int] = 0,
+                          window_size: Optional[int] = None, stride: Optional[int] = None,
+                          format_style: Optional[str] = None) -> bool:
+        """
+        Bring every session with history up to date on a background thread, progress is in get_progress().
+
+        Windows of batch_size sessions are embedded together in one upsert, which lets fastembed
+        spread large batches over several worker processes.
+
+        Args:
+            rebuild: Drop the whole collection first and index every session from scratch
+            batch_size: Number of sessions embedded per upsert
+            parallel: fastembed data parallel workers, 0 uses all cores, None embeds in this thread
+            window_size: Number of messages per chunk
+            stride: Number of messages to move forward for each new chunk
+            format_style: How to format the messages
+
+        Returns:
+            False if a reindex is already running
+        """
+        if not self.reindex_lock.acquire(blocking=False):
+            return False
+        self.progress = {
+            "running": True,
+            "rebuild": rebuild,
+            "total_sessions": 0,
+            "processed_sessions": 0,
+            "reindexed_count": 0,
+            "chunks_written": 0,
+            "failed_sessions": [],
+            "started_at": time.time(),
+            "finished_at": None,
+        }
+        params = self._params(window_size, stride, format_style)
+        threading.Thread(target=self._reindex_all, args=(rebuild, batch_size, parallel, params), daemon=True).start()
+        return True
+
+    def _reindex_all(self, rebuild: bool, batch_size: int, parallel: Optional[int], params: Dict[str, Any]):
+        try:
+            if rebuild:
+                self.memory.delete_all_messages()
+                for session in self.history_store.get_session_list():
+                    self.history_store.mark_session_indexed(session["id"], False)
+            sessions = [s for s in self.history_store.get_session_list() if s.get("history")]
+            self.progress["total_sessions"] = len(sessions)
+
+            for start in range(0, len(sessions), batch_size):
+                self._reindex_batch(sessions[start:start + batch_size], params, parallel)
+            logger.info(f"Reindexed {self.progress['reindexed_count']} of {len(sessions)} sessions, "
+                        f"{self.progress['chunks_written']} chunks in "
+                        f"{time.time() - self.progress['started_at']:.1f}s")
+        except Exception as e:
+            logger.error(f"Error reindexing all sessions: {e}", exc_info=True)
+            self.progress["error"] = str(e)
+        finally:
+            self.progress["finished_at"] = time.time()
+            self.progress["running"] = False
+            self.reindex_lock.release()
+
+    def _reindex_batch(self, sessions: List[Dict[str, Any]], params: Dict[str, Any], parallel: Optional[int]):
+        with self.write_lock:
+            self._reindex_batch_locked(sessions, params, parallel)
+
+    def _reindex_batch_locked(self, sessions: List[Dict[str, Any]], params: Dict[str, Any], parallel: Optional[int]):
+        documents, metadata_list, ids, states = [], [], [], []
+        for listed in sessions:
+            try:
+                # The listing may be stale by now, read the session again
+                session = self.history_store.get_session_history(listed["id"])
+                if not session or not session.get("history") or session.get("index_disabled"):
+                    continue
+                session_documents, session_metadata, session_ids, _, state = self._prepare(session, params, False)
+                documents.extend(session_documents)
+                metadata_list.extend(session_metadata)
+                ids.extend(session_ids)
+                states.append(state)
+            except Exception as e:
+                logger.error(f"Error reindexing session {listed['id']}: {e}")
+                self.progress["failed_sessions"].append(listed["id"])
+
+        try:
+            self._write(documents, metadata_list, ids, states, parallel)
+            self.progress["reindexed_count"] += len(states)
+            self.progress["chunks_written"] += len(documents)
+        except Exception as e:
+            logger.error(f"Error embedding a reindex batch: {e}")
+            self.progress["failed_sessions"].extend(state[0] for state in states)
+        self.progress["processed_sessions"] += len(sessions)
+
+    def get_progress(self) -> Dict[str, Any]:
+        progress = dict(self.progress)
+        progress["failed_sessions"] = list(progress.get("failed_sessions", []))
+        return progress
+
+    def enqueue_session(self, session_id: str):
+        """Queue a session whose history grew for background indexing. Returns immediately."""
+        if not self.auto_index:
+            return
+        with self.queue_condition:
+            self.pending.setdefault(session_id, time.time())
+            if self.queue_thread is None:
+                self.queue_thread = threading.Thread(target=self._run_queue, daemon=True)
+                self.queue_thread.start()
+            self.queue_condition.notify()
+
+    def configure_queue(self, auto_index: Optional[bool] = None, batch_size: Optional[int] = None,
+                        flush_interval: Optional[float] = None):
+        if auto_index is not None:
+            self.auto_index = auto_index
+        if batch_size is not None:
+            self.batch_size = max(1, batch_size)
+        if flush_interval is not None:
+            self.flush_interval = max(0.0, flush_interval)
+
+    def _run_queue(self):
+        while True:
+            with self.queue_condition:
+                while not self.pending:
+                    self.queue_condition.wait()
+                # Give other sessions' turns a chance to share the batch
+                while True:
+                    remaining = min(self.pending.values()) + self.flush_interval - time.time()
+                    if remaining <= 0:
+                        break
+                    self.queue_condition.wait(remaining)
+                session_ids = list(self.pending)
+                self.pending.clear()
+            try:
+                self._flush(session_ids)
+            except Exception as e:
+                logger.error(f"Error auto-indexing sessions: {e}", exc_info=True)
+                self.queue_failures += 1
+
+    def _flush(self, session_ids: List[str]):
+        start = time.time()
+        with self.write_lock:
+            documents, metadata_list, ids, states = [], [], [], []
+            for session_id in session_ids:
+                session = self.history_store.get_session_history(session_id)
+                if not session or not session.get("history") or session.get("index_disabled"):
+                    continue
+                # Keep the chunking a session was indexed with, a change would re-embed all of it
+                params = session.get("index_params") or self._params(None, None, None)
+                new_documents, new_metadata, new_ids, _, state = self._prepare(session, params, False)
+                documents.extend(new_documents)
+                metadata_list.extend(new_metadata)
+                ids.extend(new_ids)
+                states.append(state)
+                if len(documents) >= self.batch_size:
+                    self._write_queue_batch(documents, metadata_list, ids, states)
+                    documents, metadata_list, ids, states = [], [], [], []
+            if states:
+                self._write_queue_batch(documents, metadata_list, ids, states)
+        self.last_flush_seconds = time.time() - start
+
+    def _write_queue_batch(self, documents, metadata_list, ids, states):
+        try:
+            self._write(documents, metadata_list, ids, states)
+            self.queue_batches += 1
+            self.queue_chunks_written += len(documents)
+        except Exception as e:
+            # Window hashes weren't stored, the windows are retried with the session's next update
+            logger.error(f"Error writing auto-index batch of {len(documents)} chunks: {e}")
+            self.queue_failures += 1
+
+    def remove_session(self, session_id: str) -> bool:
+        """
+        Delete a session's points and opt it out of automatic indexing.
+
+        Runs under write_lock, so a flush that already read the session can't write its points back.
+
+        Returns:
+            False if the points couldn't be deleted
+        """
+        with self.queue_condition:
+            self.pending.pop(session_id, None)
+        with self.write_lock:
+            self.history_store.set_index_disabled(session_id, True)
+            if not self.memory.delete_session_messages(session_id):
+                return False
+            self.history_store.mark_session_indexed(session_id, False)
+        return True
+
+    def get_queue_status(self) -> Dict[str, Any]:
+        return {
+            "auto_index": self.auto_index,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "pending_sessions": len(self.pending),
+            "batches": self.queue_batches,
+            "chunks_written": self.queue_chunks_written,
+            "failures": self.queue_failures,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
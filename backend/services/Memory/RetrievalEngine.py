@@ -0,0 +1,252 @@
+import datetime
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from ..lib.LAV_logger import logger
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class RetrievalEngine:
+    """
+    Hybrid ranking over the memory collection.
+
+    Candidates come from the dense search and from a BM25 index over the stored chunk texts,
+    so exact names and rare words are found even when the embedding misses them. The two
+    rankings are fused with reciprocal rank fusion, scaled by recency (exponential decay on
+    the chunk's "time" payload) and optionally by session. Selection is greedy MMR: a candidate
+    loses score for the share of messages it has in common with an already selected window of
+    the same session, or for its word overlap with a selected window, whichever is larger, so
+    stride=1 neighbors of one good hit don't fill the whole context.
+
+    The BM25 index mirrors the collection in memory. It is built by scrolling the collection
+    on first use and kept current by add(), remove(), remove_session() and clear(), which Memory calls
+    on every write.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, rrf_k: int = 60, dense_weight: float = 0.6,
+                 half_life_days: float = 30.0, recency_weight: float = 0.3, mmr_lambda: float = 0.7,
+                 candidate_factor: int = 8, session_weight: float = 1.0):
+        """
+        Args:
+            k1: BM25 term frequency saturation
+            b: BM25 length normalization
+            rrf_k: Reciprocal rank fusion constant, larger values flatten the rank curve
+            dense_weight: Share of the fused score from the dense ranking, the rest comes from BM25
+            half_life_days: Age at which the recency factor has decayed by half
+            recency_weight: How much recency scales scores, 0 ignores time, 1 lets old chunks decay to nothing
+            mmr_lambda: Relevance versus diversity trade-off of the selection, 1 disables diversity
+            candidate_factor: Candidates taken from each ranking per requested result
+            session_weight: Score factor for chunks of the session passed to rank, 0 leaves them out
+        """
+        self.k1 = k1
+        self.b = b
+        self.rrf_k = rrf_k
+        self.dense_weight = dense_weight
+        self.half_life_days = half_life_days
+        self.recency_weight = recency_weight
+        self.mmr_lambda = mmr_lambda
+        self.candidate_factor = candidate_factor
+        self.session_weight = session_weight
+
+        self.lock = threading.RLock()
+        self.built = False
+        # point id -> (term counts, length, payload, timestamp)
+        self.documents: Dict[Any, Tuple[Counter, int, Dict[str, Any], Optional[float]]] = {}
+        self.postings: Dict[str, Set[Any]] = defaultdict(set)
+        self.session_points: Dict[str, Set[Any]] = defaultdict(set)
+        self.total_length = 0
+
+    def candidate_count(self, limit: int) -> int:
+        return max(limit * self.candidate_factor, 20)
+
+    # Index maintenance
+
+    def build(self, points: Iterable[Tuple[Any, Dict[str, Any]]]):
+        """Replace the index with (point id, payload) pairs, e.g. a scroll over the whole collection."""
+        with self.lock:
+            self.clear()
+            for point_id, payload in points:
+                self._add(point_id, payload)
+            self.built = True
+            logger.info(f"Built BM25 index over {len(self.documents)} memory chunks")
+
+    def ensure_built(self, load_points: Callable[[], Iterable[Tuple[Any, Dict[str, Any]]]]):
+        if self.built:
+            return
+        with self.lock:
+            if not self.built:
+                self.build(load_points())
+
+    def add(self, ids: List[Any], payloads: List[Dict[str, Any]]):
+        with self.lock:
+            if not self.built:
+                return  # Picked up when the index is built
+            for point_id, payload in zip(ids, payloads):
+                self._remove(point_id)
+                self._add(point_id, payload)
+
+    def remove(self, ids: List[Any]):
+        with self.lock:
+            for point_id in ids:
+                self._remove(point_id)
+
+    def remove_session(self, session_id: str):
+        with self.lock:
+            for point_id in list(self.session_points.get(session_id, ())):
+                self._remove(point_id)
+            self.session_points.pop(session_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+            self.postings.clear()
+            self.session_points.clear()
+            self.total_length = 0
+
+    def _add(self, point_id, payload: Dict[str, Any]):
+        terms = Counter(tokenize(payload.get("document", "")))
+        length = sum(terms.values())
+        self.documents[point_id] = (terms, length, payload, self._timestamp(payload))
+        self.total_length += length
+        for term in terms:
+            self.postings[term].add(point_id)
+        self.session_points[payload.get("session_id", "")].add(point_id)
+
+    def _remove(self, point_id):
+        entry = self.documents.pop(point_id, None)
+        if entry is None:
+            return
+        terms, length, payload, _ = entry
+        self.total_length -= length
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.discard(point_id)
+                if not postings:
+                    del self.postings[term]
+        self.session_points.get(payload.get("session_id", ""), set()).discard(point_id)
+
+    @staticmethod
+    def _timestamp(payload: Dict[str, Any]) -> Optional[float]:
+        value = payload.get("time")
+        if not value:
+            return None
+        try:
+            return datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f").timestamp()
+        except (ValueError, TypeError):
+            return None
+
+    # Ranking
+
+    def bm25(self, query_terms: List[str], limit: int) -> List[Tuple[Any, float]]:
+        """The limit best (point id, BM25 score) pairs for the query terms."""
+        with self.lock:
+            count = len(self.documents)
+            if count == 0 or not query_terms:
+                return []
+            average_length = self.total_length / count
+            scores: Dict[Any, float] = defaultdict(float)
+            for term in set(query_terms):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for point_id in postings:
+                    terms, length, _, _ = self.documents[point_id]
+                    frequency = terms[term]
+                    scores[point_id] += idf * frequency * (self.k1 + 1) / (
+                        frequency + self.k1 * (1 - self.b + self.b * length / average_length))
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def rank(self, text: str, dense: List[Tuple[Any, float, Dict[str, Any]]], limit: int,
+             session_id: Optional[str] = None, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Fuse a dense result list with BM25 and pick a diverse top-k.
+
+        Args:
+            text: Query text
+            dense: (point id, similarity, payload) of the dense search, best first
+            limit: Number of results
+            session_id: Session whose chunks are scaled by session_weight
+            now: Reference time for recency, defaults to the current time
+
+        Returns:
+            Payloads of the selected chunks, best first, each with an added "score"
+        """
+        now = now if now is not None else datetime.datetime.now().timestamp()
+        candidate_count = self.candidate_count(limit)
+        sparse = self.bm25(tokenize(text), candidate_count)
+
+        fused: Dict[Any, float] = defaultdict(float)
+        payloads: Dict[Any, Dict[str, Any]] = {}
+        for rank, (point_id, _, payload) in enumerate(dense[:candidate_count]):
+            fused[point_id] += self.dense_weight / (self.rrf_k + rank + 1)
+            payloads[point_id] = payload
+        with self.lock:
+            for rank, (point_id, _) in enumerate(sparse):
+                fused[point_id] += (1 - self.dense_weight) / (self.rrf_k + rank + 1)
+                if point_id not in payloads and point_id in self.documents:
+                    payloads[point_id] = self.documents[point_id][2]
+            timestamps = {point_id: self.documents[point_id][3] if point_id in self.documents
+                          else self._timestamp(payloads.get(point_id, {})) for point_id in fused}
+
+        candidates = []
+        for point_id, score in fused.items():
+            payload = payloads.get(point_id)
+            if payload is None:
+                continue
+            timestamp = timestamps[point_id]
+            if timestamp is not None and self.recency_weight > 0:
+                age_days = max(0.0, now - timestamp) / 86400
+                decay = 0.5 ** (age_days / self.half_life_days)
+                score *= 1 - self.recency_weight + self.recency_weight * decay
+            if session_id and payload.get("session_id") == session_id:
+                score *= self.session_weight
+            if score <= 0:
+                continue  # session_weight 0 excludes the requesting session
+            candidates.append((score, point_id, payload))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return self._select(candidates, limit)
+
+    def _select(self, candidates: List[Tuple[float, Any, Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+        if not candidates or candidates[0][0] <= 0:
+            return []
+        top_score = candidates[0][0]
+        remaining = [(score / top_score, payload, self._span(payload), set(tokenize(payload.get("document", ""))))
+                     for score, _, payload in candidates]
+        selected = []
+        while remaining and len(selected) < limit:
+            best_index, best_value = 0, -math.inf
+            for index, (relevance, payload, span, terms) in enumerate(remaining):
+                redundancy = max((self._similarity(payload, span, terms, other) for other in selected), default=0.0)
+                value = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+                if value > best_value:
+                    best_index, best_value = index, value
+            selected.append(remaining.pop(best_index))
+        return [dict(payload, score=relevance) for relevance, payload, _, _ in selected]
+
+    @staticmethod
+    def _span(payload: Dict[str, Any]) -> Tuple[int, int]:
+        """Range of message indexes a window covers. Older chunks lack start_message, they were indexed with stride 1."""
+        start = payload.get("start_message", payload.get("window_index", payload.get("chunk_index", 0)))
+        return start, start + payload.get("message_count", 1)
+
+    @staticmethod
+    def _similarity(payload, span, terms, other) -> float:
+        _, other_payload, other_span, other_terms = other
+        overlap = 0.0
+        if payload.get("session_id") == other_payload.get("session_id"):
+            shared = min(span[1], other_span[1]) - max(span[0], other_span[0])
+            if shared > 0:
+                overlap = shared / min(span[1] - span[0], other_span[1] - other_span[0])
+        if not terms or not other_terms:
+            return overlap
+        return max(overlap, len(terms & other_terms) / len(terms | other_terms))
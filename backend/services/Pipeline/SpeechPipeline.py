@@ -0,0 +1,125 @@
+import asyncio
+import base64
+import uuid
+from collections import deque
+from typing import Any, AsyncGenerator, Dict, Optional
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from services.lib.LAV_logger import logger
+from services.TTS.StreamSegmenter import StreamSegmenter
+from services.TTS.TTSWorker import TTSWorker, PRIORITY_HIGH
+
+
+class SpeechPipeline:
+    """
+    Server-side LLM -> TTS pipeline.
+
+    Tokens from LLM.get_completion are segmented into sentences as they stream in, and finished
+    sentences are handed to the TTS worker while the LLM keeps generating, so synthesis of sentence N
+    overlaps with generation of sentence N+1. Text deltas and audio are returned as one event stream.
+    """
+
+    def __init__(self, llm, tts, tts_worker: TTSWorker, max_in_flight: int = 2):
+        """
+        Args:
+            llm: LLM service
+            tts: TTS service
+            tts_worker: Worker that runs the TTS synthesis
+            max_in_flight: Sentences of one reply that may be queued on the TTS worker at once
+        """
+        self.llm = llm
+        self.tts = tts
+        self.tts_worker = tts_worker
+        self.max_in_flight = max_in_flight
+
+    async def run(self, text: str, history: Optional[list], system_prompt: str = "",
+                  screenshot: bool = False, text_split_method: str = "cut5") -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Run a completion and synthesize it sentence by sentence.
+
+        Yields events in the order they become available:
+            {"type": "text", "delta": str}
+            {"type": "sentence", "index": int, "text": str}
+            {"type": "audio", "index": int, "text": str, "audio": base64 wav}
+            {"type": "error", "index": int | None, "error": str}
+            {"type": "done", "sentences": int}
+        """
+        segmenter = StreamSegmenter(text_split_method)
+        channel = f"pipeline-{uuid.uuid4()}"
+        events: asyncio.Queue = asyncio.Queue()
+        sentences: asyncio.Queue = asyncio.Queue()
+        sentence_count = 0
+
+        async def schedule(sentence: str):
+            nonlocal sentence_count
+            index = sentence_count
+            sentence_count += 1
+            await events.put({"type": "sentence", "index": index, "text": sentence})
+            await sentences.put((index, sentence))
+
+        async def produce_text():
+            try:
+                completion = await run_in_threadpool(self.llm.get_completion, text, history, system_prompt, screenshot)
+                if completion is None:
+                    raise RuntimeError("No response from LLM service")
+                async for token in iterate_in_threadpool(completion):
+                    await events.put({"type": "text", "delta": token})
+                    for sentence in segmenter.feed(token):
+                        await schedule(sentence)
+                for sentence in segmenter.flush():
+                    await schedule(sentence)
+            except Exception as e:
+                logger.error(f"Error during pipeline completion: {e}", exc_info=True)
+                await events.put({"type": "error", "index": None, "error": str(e)})
+            finally:
+                await sentences.put(None)
+
+        async def emit_audio(index: int, sentence: str, task: asyncio.Task):
+            try:
+                audio = await task
+                if not isinstance(audio, (bytes, bytearray)):
+                    raise RuntimeError(f"TTS failed: {audio}")
+                await events.put({
+                    "type": "audio",
+                    "index": index,
+                    "text": sentence,
+                    "audio": base64.b64encode(audio).decode("utf-8")
+                })
+            except Exception as e:
+                logger.error(f"Error synthesizing pipeline sentence {index}: {e}")
+                await events.put({"type": "error", "index": index, "error": str(e)})
+
+        async def produce_audio():
+            # Keep a few sentences queued on the worker so it never idles between sentences,
+            # without flooding its bounded queue on long replies. Audio is emitted in sentence order.
+            in_flight = deque()
+            while True:
+                entry = await sentences.get()
+                if entry is None:
+                    break
+                index, sentence = entry
+                task = asyncio.create_task(
+                    self.tts_worker.synthesize(self.tts, sentence, priority=PRIORITY_HIGH, channel=channel)
+                )
+                in_flight.append((index, sentence, task))
+                if len(in_flight) >= self.max_in_flight:
+                    await emit_audio(*in_flight.popleft())
+            while in_flight:
+                await emit_audio(*in_flight.popleft())
+
+        async def run_producers():
+            await asyncio.gather(produce_text(), produce_audio())
+            await events.put(None)
+
+        producers = asyncio.create_task(run_producers())
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            yield {"type": "done", "sentences": sentence_count}
+        finally:
+            if not producers.done():
+                # Client went away, drop the remaining sentences
+                producers.cancel()
+                self.tts_worker.cancel_channel(channel)
@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+import numpy as np
+import soundfile as sf
+from services.lib.DiskCache import DiskCache
+
+
+class AudioCache:
+    """
+    Cache of whole synthesized utterances.
+
+    Keeps (sample_rate, int16 PCM) in a memory LRU bounded by total size and, if cache_dir is set,
+    as FLAC files on disk (see DiskCache) so results survive restarts at a fraction of the raw PCM size.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_memory_bytes: int = 64 * 1024 * 1024,
+                 max_disk_bytes: int = 512 * 1024 * 1024):
+        """
+        Args:
+            cache_dir: Directory of the disk tier, None keeps results in memory only
+            max_memory_bytes: PCM bytes kept in memory before the least recently used entries are dropped
+            max_disk_bytes: FLAC bytes kept on disk before the least recently used files are deleted
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.entries: OrderedDict = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk = DiskCache(cache_dir, ".flac", max_disk_bytes, "audio cache") if cache_dir else None
+
+    def get(self, key: str) -> Optional[Tuple[int, np.ndarray]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+
+        entry = self.disk.read(key, self._read_file) if self.disk is not None else None
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, entry)
+        return entry
+
+    def put(self, key: str, sample_rate: int, audio: np.ndarray):
+        audio = np.ascontiguousarray(audio, dtype=np.int16)
+        with self.lock:
+            self._insert(key, (sample_rate, audio))
+        if self.disk is not None:
+            self.disk.write(key, lambda path: sf.write(path, audio, sample_rate, format="FLAC", subtype="PCM_16"))
+
+    def _insert(self, key: str, entry: Tuple[int, np.ndarray]):
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.memory_bytes -= previous[1].nbytes
+        self.entries[key] = entry
+        self.memory_bytes += entry[1].nbytes
+        while self.memory_bytes > self.max_memory_bytes and len(self.entries) > 1:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.memory_bytes -= evicted.nbytes
+
+    @staticmethod
+    def _read_file(path: str) -> Tuple[int, np.ndarray]:
+        audio, sample_rate = sf.read(path, dtype="int16")
+        return sample_rate, audio
+
+    def contains(self, key: str) -> bool:
+        with self.lock:
+            if key in self.entries:
+                return True
+        return self.disk is not None and self.disk.contains(key)
+
+    def clear(self, remove_files: bool = False):
+        with self.lock:
+            self.entries.clear()
+            self.memory_bytes = 0
+        if remove_files and self.disk is not None:
+            self.disk.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "memory_bytes": self.memory_bytes,
+            "max_memory_bytes": self.max_memory_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            **(self.disk.get_stats() if self.disk is not None else {}),
+        }
@@ -200,6 +200,85 @@ class T2SBlock:
         )
         return x, k_cache, v_cache
 
+    def decode_next_token_static(self, x:torch.Tensor, k_cache:torch.Tensor, v_cache:torch.Tensor, pos:int, attn_mask:Optional[torch.Tensor]=None, torch_sdpa:bool=True):
+        # k_cache / v_cache are preallocated [batch, capacity, hidden] buffers, the new key/value
+        # is written in place at pos and attention only looks at the filled part of the buffer
+        q, k, v = F.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+
+        k_cache.narrow(1, pos, 1).copy_(k)
+        v_cache.narrow(1, pos, 1).copy_(v)
+
+        batch_size = q.shape[0]
+        q_len = q.shape[1]
+        kv_len = pos + 1
+
+        q = q.view(batch_size, q_len, self.num_heads, -1).transpose(1, 2)
+        k = k_cache.narrow(1, 0, kv_len).view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+        v = v_cache.narrow(1, 0, kv_len).view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+
+        if attn_mask is not None:
+            attn_mask = attn_mask.narrow(-1, 0, kv_len)
+
+        if torch_sdpa:
+            attn = F.scaled_dot_product_attention(q, k, v, (~attn_mask) if attn_mask is not None else None)
+        else:
+            attn = scaled_dot_product_attention(q, k, v, attn_mask)
+
+        attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
+        attn = F.linear(attn, self.out_w, self.out_b)
+
+        x = x + attn
+        x = F.layer_norm(
+            x, [self.hidden_dim], self.norm_w1, self.norm_b1, self.norm_eps1
+        )
+        x = x + self.mlp.forward(x)
+        x = F.layer_norm(
+            x,
+            [self.hidden_dim],
+            self.norm_w2,
+            self.norm_b2,
+            self.norm_eps2,
+        )
+        return x
+
+    def decode_next_token_ragged(self, x:torch.Tensor, k_cache:torch.Tensor, v_cache:torch.Tensor, flat_index:torch.Tensor, kv_len:int, attn_mask:torch.Tensor, torch_sdpa:bool=True):
+        # Like decode_next_token_static, but every row writes at its own position:
+        # flat_index = row * capacity + position into the contiguous [batch, capacity, hidden] buffers,
+        # attn_mask hides the positions each row hasn't filled yet
+        q, k, v = F.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+
+        k_cache.view(-1, k_cache.shape[2]).index_copy_(0, flat_index, k.squeeze(1))
+        v_cache.view(-1, v_cache.shape[2]).index_copy_(0, flat_index, v.squeeze(1))
+
+        batch_size = q.shape[0]
+        q_len = q.shape[1]
+
+        q = q.view(batch_size, q_len, self.num_heads, -1).transpose(1, 2)
+        k = k_cache.narrow(1, 0, kv_len).view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+        v = v_cache.narrow(1, 0, kv_len).view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+
+        if torch_sdpa:
+            attn = F.scaled_dot_product_attention(q, k, v, ~attn_mask)
+        else:
+            attn = scaled_dot_product_attention(q, k, v, attn_mask)
+
+        attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
+        attn = F.linear(attn, self.out_w, self.out_b)
+
+        x = x + attn
+        x = F.layer_norm(
+            x, [self.hidden_dim], self.norm_w1, self.norm_b1, self.norm_eps1
+        )
+        x = x + self.mlp.forward(x)
+        x = F.layer_norm(
+            x,
+            [self.hidden_dim],
+            self.norm_w2,
+            self.norm_b2,
+            self.norm_eps2,
+        )
+        return x
+
 
 @torch.jit.script
 class T2STransformer:
@@ -231,6 +310,31 @@ class T2STransformer:
             x, k_cache[i], v_cache[i] = self.blocks[i].decode_next_token(x, k_cache[i], v_cache[i], attn_mask, torch_sdpa)
         return x, k_cache, v_cache
 
+    def decode_next_token_static(
+        self, x:torch.Tensor,
+        k_cache: List[torch.Tensor],
+        v_cache: List[torch.Tensor],
+        pos: int,
+        attn_mask : Optional[torch.Tensor]=None,
+        torch_sdpa:bool=True
+    ):
+        for i in range(self.num_blocks):
+            x = self.blocks[i].decode_next_token_static(x, k_cache[i], v_cache[i], pos, attn_mask, torch_sdpa)
+        return x
+
+    def decode_next_token_ragged(
+        self, x:torch.Tensor,
+        k_cache: List[torch.Tensor],
+        v_cache: List[torch.Tensor],
+        flat_index: torch.Tensor,
+        kv_len: int,
+        attn_mask: torch.Tensor,
+        torch_sdpa:bool=True
+    ):
+        for i in range(self.num_blocks):
+            x = self.blocks[i].decode_next_token_ragged(x, k_cache[i], v_cache[i], flat_index, kv_len, attn_mask, torch_sdpa)
+        return x
+
 
 class Text2SemanticDecoder(nn.Module):
     def __init__(self, config, norm_first=False, top_k=3):
@@ -542,6 +646,34 @@ class Text2SemanticDecoder(nn.Module):
             y = torch.concat([y, samples], dim=1)
         return y
 
+    def init_static_kv_cache(self, k_cache:List[torch.Tensor], v_cache:List[torch.Tensor], capacity:int):
+        """
+        Copy the prompt KV cache into preallocated buffers for static-cache decoding.
+
+        Args:
+            k_cache: Per layer keys returned by process_prompt, [batch, prompt_len, hidden]
+            v_cache: Per layer values returned by process_prompt, [batch, prompt_len, hidden]
+            capacity: Number of positions to allocate (prompt + tokens that may still be generated)
+
+        Returns:
+            Tuple of per layer key and value buffers, [batch, capacity, hidden]
+        """
+        k_buffers : List[torch.Tensor] = []
+        v_buffers : List[torch.Tensor] = []
+        for k, v in zip(k_cache, v_cache):
+            k_buffer = k.new_zeros((k.shape[0], capacity, k.shape[2]))
+            v_buffer = v.new_zeros((v.shape[0], capacity, v.shape[2]))
+            k_buffer[:, :k.shape[1]] = k
+            v_buffer[:, :v.shape[1]] = v
+            k_buffers.append(k_buffer)
+            v_buffers.append(v_buffer)
+        return k_buffers, v_buffers
+
+    def static_cache_capacity(self, prompt_len:int, early_stop_num:int, max_steps:int=1500):
+        """Prompt length plus the most tokens the decode loop can still append"""
+        max_new = max_steps if early_stop_num == -1 else min(early_stop_num + 1, max_steps)
+        return prompt_len + max_new
+
     def pad_y_eos(self, y, y_mask_int, eos_id):
         targets = F.pad(y, (0, 1), value=0) + eos_id * F.pad(
             y_mask_int, (0, 1), value=1
@@ -568,6 +700,7 @@ class Text2SemanticDecoder(nn.Module):
 
 
         max_len = kwargs.get("max_len",x_lens.max())
+        static_kv_cache = kwargs.get("static_kv_cache", False)
         x_list = []
         for x_item, bert_item in zip(x, bert_feature):
             # max_len = max(max_len, x_item.shape[0], bert_item.shape[1])
@@ -664,6 +797,8 @@ class Text2SemanticDecoder(nn.Module):
         for idx in tqdm(range(1500)):
             if idx == 0:
                 xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, attn_mask, None)
+            elif static_kv_cache:
+                xy_dec = self.t2s_transformer.decode_next_token_static(xy_pos, k_cache, v_cache, src_len + idx - 1, attn_mask)
             else:
                 xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache, attn_mask)
             logits = self.ar_predict_layer(
@@ -671,9 +806,16 @@ class Text2SemanticDecoder(nn.Module):
             )
 
             if idx == 0:
-                attn_mask = F.pad(attn_mask[:,:,-1].unsqueeze(-2),(0,1),value=False)
+                if static_kv_cache:
+                    # Preallocate K/V and the mask once instead of growing them every step,
+                    # positions past the current length are never attended to
+                    capacity = self.static_cache_capacity(src_len, early_stop_num)
+                    k_cache, v_cache = self.init_static_kv_cache(k_cache, v_cache, capacity)
+                    attn_mask = F.pad(attn_mask[:,:,-1].unsqueeze(-2),(0,capacity-src_len),value=False)
+                else:
+                    attn_mask = F.pad(attn_mask[:,:,-1].unsqueeze(-2),(0,1),value=False)
                 logits = logits[:, :-1]
-            else:
+            elif not static_kv_cache:
                 attn_mask = F.pad(attn_mask,(0,1),value=False)
 
             samples = sample(
@@ -835,9 +977,12 @@ class Text2SemanticDecoder(nn.Module):
                                                 .view(bsz, self.num_head, src_len, src_len)\
                                                 .to(device=x.device, dtype=torch.bool)
 
+        static_kv_cache = kwargs.get("static_kv_cache", False)
         for idx in tqdm(range(1500)):
             if xy_attn_mask is not None:
                 xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, xy_attn_mask, None)
+            elif static_kv_cache:
+                xy_dec = self.t2s_transformer.decode_next_token_static(xy_pos, k_cache, v_cache, src_len + idx - 1)
             else:
                 xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache)
 
@@ -847,6 +992,9 @@ class Text2SemanticDecoder(nn.Module):
 
             if idx == 0:
                 xy_attn_mask = None
+                if static_kv_cache:
+                    capacity = self.static_cache_capacity(src_len, early_stop_num)
+                    k_cache, v_cache = self.init_static_kv_cache(k_cache, v_cache, capacity)
             if(idx<11):###至少预测出10个token不然不给停止（0.4s）
                 logits = logits[:, :-1]
 
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import torch
+from services.lib.DiskCache import DiskCache
+
+_file_hash_memo: Dict[str, tuple] = {}
+
+
+def file_sha256(path: str) -> str:
+    """Content hash of a file, memoized on (size, mtime) so unchanged files are only read once."""
+    stat = os.stat(path)
+    memo = _file_hash_memo.get(path)
+    if memo is not None and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+        return memo[2]
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    digest = sha.hexdigest()
+    _file_hash_memo[path] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+
+def hash_key(*parts) -> str:
+    return hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:32]
+
+
+class PromptCache:
+    '''
+    Multi-entry LRU cache for reference-voice prompt artifacts
+    (prompt_semantic, refer_spec, phones, bert_features, ...).
+
+    Entries live in memory and, if cache_dir is set, are persisted with torch.save (see DiskCache)
+    so switching voices or restarting the server doesn't re-run CNHubert / BERT.
+    Tensors are stored on the CPU; callers move them to their device.
+    TextPreprocessor uses a second instance for per-sentence phones / BERT features.
+    Both tiers are bounded: max_entries in memory, max_disk_bytes of files on disk,
+    where the least recently used files are deleted first.
+    '''
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 16,
+                 max_disk_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk = DiskCache(cache_dir, ".pt", max_disk_bytes, "prompt cache") if cache_dir else None
+
+    def get(self, key: str) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self.disk.read(key, lambda path: torch.load(path, map_location="cpu", weights_only=True)) \
+            if self.disk is not None else None
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(key, entry)
+        return entry
+
+    def put(self, key: str, entry: dict):
+        entry = {k: (v.detach().cpu() if isinstance(v, torch.Tensor) else v) for k, v in entry.items()}
+        with self.lock:
+            self._insert(key, entry)
+        if self.disk is not None:
+            self.disk.write(key, lambda path: torch.save(entry, path))
+
+    def _insert(self, key: str, entry: dict):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self, remove_files: bool = False):
+        with self.lock:
+            self.entries.clear()
+        if remove_files and self.disk is not None:
+            self.disk.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            **(self.disk.get_stats() if self.disk is not None else {}),
+        }
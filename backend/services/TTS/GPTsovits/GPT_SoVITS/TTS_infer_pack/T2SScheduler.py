@@ -0,0 +1,362 @@
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import torch
+import torch.nn.functional as F
+from AR.models.t2s_model import Text2SemanticDecoder
+from AR.models.utils import logits_to_probs
+from services.lib.LAV_logger import logger
+
+MAX_DECODE_STEPS = 1500  # Same limit as Text2SemanticDecoder.infer_panel_*
+
+
+def sample_rows(logits:torch.Tensor, previous_tokens:torch.Tensor, generators:List[Optional[torch.Generator]], **sampling_kwargs) -> torch.Tensor:
+    '''
+    Same as AR.models.utils.sample, but every row draws its noise from its own generator, so a
+    row's tokens don't depend on which other rows share the batch. A None generator uses the global RNG.
+    '''
+    probs = logits_to_probs(logits=logits, previous_tokens=previous_tokens, **sampling_kwargs)
+    q = torch.stack([torch.empty_like(row).exponential_(1, generator=generator) for row, generator in zip(probs, generators)])
+    return torch.argmax(probs / q, dim=-1, keepdim=True).to(dtype=torch.int)
+
+
+class T2SSequence:
+    '''One sentence waiting for / being decoded by the scheduler.'''
+
+    def __init__(self, x:torch.Tensor, bert_feature:torch.Tensor, prompt:torch.Tensor,
+                 top_k:int, top_p:float, temperature:float, repetition_penalty:float, early_stop_num:int,
+                 generator:Optional[torch.Generator]=None, stop_event:Optional[threading.Event]=None):
+        self.x = x
+        self.bert_feature = bert_feature
+        self.prompt = prompt
+        self.sampling = (top_k, top_p, temperature, repetition_penalty)
+        self.early_stop_num = early_stop_num
+        self.generator = generator
+        self.stop_event = stop_event
+        self.prefix_len = prompt.shape[0]
+        self.done = threading.Event()
+        self.y:Optional[torch.Tensor] = None
+        self.idx:int = 0
+        self.error:Optional[Exception] = None
+
+    def finish(self, y:torch.Tensor=None, idx:int=0, error:Exception=None):
+        self.y = y
+        self.idx = idx
+        self.error = error
+        self.done.set()
+
+
+class T2SBatchScheduler:
+    '''
+    Continuous batching for the T2S autoregressive decoder.
+
+    Sentences from any number of concurrent TTS.run calls are decoded together in one batch on a
+    dedicated thread. New sentences are prefilled and join the running batch at the next step
+    boundary, finished ones leave it right away, so a request doesn't wait for another request's
+    whole reply before it starts decoding.
+
+    Every row has its own length in preallocated K/V buffers, see T2SBlock.decode_next_token_ragged.
+    infer_panel has the same signature and return value as Text2SemanticDecoder.infer_panel_batch_infer.
+
+    Concurrent runs can't share torch's global RNG and stay reproducible, so infer_panel takes the
+    run's seeded generator and every sentence samples from its own generator seeded from it.
+    Likewise TTS.stop_flag would stop every run, so a run's stop_event retires only its own rows.
+    '''
+
+    def __init__(self, get_model:Callable[[], Text2SemanticDecoder], max_batch_size:int=8):
+        '''
+        Args:
+            get_model: Returns the current decoder, the weights can be swapped at runtime
+            max_batch_size: Maximum number of sentences decoded together
+        '''
+        self.get_model = get_model
+        self.max_batch_size = max_batch_size
+        self.pending:deque = deque()
+        self.condition = threading.Condition()
+        self.thread:Optional[threading.Thread] = None
+        self.running = False
+        self._reset_batch()
+
+        # Metrics
+        self.steps = 0
+        self.batched_rows = 0
+        self.admitted = 0
+        self.max_active = 0
+
+    def _reset_batch(self):
+        self.model:Optional[Text2SemanticDecoder] = None
+        self.rows:List[T2SSequence] = []
+        self.k_cache:List[torch.Tensor] = []
+        self.v_cache:List[torch.Tensor] = []
+        self.kv_lens:Optional[torch.Tensor] = None    # filled K/V positions per row
+        self.y:Optional[torch.Tensor] = None          # prompt + generated tokens per row
+        self.y_lens:Optional[torch.Tensor] = None
+        self.xy_pos:Optional[torch.Tensor] = None     # input of the next decode step
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="T2SBatchScheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def infer_panel(
+        self,
+        x:List[torch.LongTensor],
+        x_lens:torch.LongTensor,
+        prompts:torch.LongTensor,
+        bert_feature:List[torch.LongTensor],
+        top_k:int = -100,
+        top_p:int = 100,
+        early_stop_num:int = -1,
+        temperature:float = 1.0,
+        repetition_penalty:float = 1.35,
+        generator:Optional[torch.Generator] = None,
+        stop_event:Optional[threading.Event] = None,
+        **kwargs,
+    ):
+        if prompts is None or not self.running:
+            # Prompt free decoding isn't batched anyway, see infer_panel_batch_infer
+            return self.get_model().infer_panel_naive_batched(x, x_lens, prompts, bert_feature, top_k=top_k, top_p=top_p,
+                                                               early_stop_num=early_stop_num, temperature=temperature,
+                                                               repetition_penalty=repetition_penalty, **kwargs)
+
+        sequences = [
+            T2SSequence(x[i], bert_feature[i], prompts[i], top_k, top_p, temperature, repetition_penalty, early_stop_num,
+                        self._sentence_generator(generator, x[i].device), stop_event)
+            for i in range(len(x))
+        ]
+        with self.condition:
+            self.pending.extend(sequences)
+            self.condition.notify()
+
+        for sequence in sequences:
+            sequence.done.wait()
+            if sequence.error is not None:
+                raise sequence.error
+        return [sequence.y for sequence in sequences], [sequence.idx for sequence in sequences]
+
+    @staticmethod
+    def _sentence_generator(generator:Optional[torch.Generator], device:torch.device) -> Optional[torch.Generator]:
+        if generator is None:
+            return None
+        seed = int(torch.randint(0, 2**63 - 1, (1,), generator=generator).item())
+        return torch.Generator(device=device).manual_seed(seed)
+
+    def _next_admissions(self) -> List[T2SSequence]:
+        with self.condition:
+            while self.running and not self.pending and not self.rows:
+                self.condition.wait()
+            if not self.running:
+                return []
+            if self.rows and self.get_model() is not self.model:
+                # Weights changed, let the running batch finish on the old model first
+                return []
+            admissions = []
+            while self.pending and len(self.rows) + len(admissions) < self.max_batch_size:
+                admissions.append(self.pending.popleft())
+            return admissions
+
+    def _run(self):
+        while True:
+            admissions = self._next_admissions()
+            if not self.running:
+                break
+            try:
+                with torch.no_grad():
+                    for sequence in admissions:
+                        self._admit(sequence)
+                    if self.rows:
+                        self._step()
+            except Exception as e:
+                logger.error(f"T2S batch decoding failed: {e}", exc_info=True)
+                for sequence in self.rows + [s for s in admissions if not s.done.is_set()]:
+                    if not sequence.done.is_set():
+                        sequence.finish(error=e)
+                self._reset_batch()
+
+        with self.condition:
+            pending = list(self.pending)
+            self.pending.clear()
+        for sequence in self.rows + pending:
+            sequence.finish(error=RuntimeError("T2S scheduler stopped"))
+        self._reset_batch()
+
+    def _capacity(self, sequence:T2SSequence) -> int:
+        max_new = MAX_DECODE_STEPS if sequence.early_stop_num == -1 else min(sequence.early_stop_num + 1, MAX_DECODE_STEPS)
+        return max_new + 1
+
+    def _admit(self, sequence:T2SSequence):
+        '''Prefill one sentence and append it to the running batch.'''
+        if not self.rows:
+            self.model = self.get_model()
+        model = self.model
+        self.admitted += 1
+
+        x = model.ar_text_embedding(sequence.x.unsqueeze(0))
+        x = x + model.bert_proj(sequence.bert_feature.transpose(0, 1).unsqueeze(0))
+        x = model.ar_text_position(x)
+        y = sequence.prompt.unsqueeze(0)
+        y_pos = model.ar_audio_position(model.ar_audio_embedding(y))
+        xy_pos = torch.concat([x, y_pos], dim=1)
+
+        x_len = x.shape[1]
+        y_len = y.shape[1]
+        src_len = x_len + y_len
+        x_attn_mask = F.pad(
+            torch.zeros((x_len, x_len), dtype=torch.bool, device=x.device),
+            (0, y_len),
+            value=True,
+        )
+        y_attn_mask = F.pad(
+            torch.triu(torch.ones(y_len, y_len, dtype=torch.bool, device=x.device), diagonal=1),
+            (x_len, 0),
+            value=False,
+        )
+        xy_attn_mask = torch.concat([x_attn_mask, y_attn_mask], dim=0).view(1, 1, src_len, src_len)\
+                                                                    .expand(-1, model.num_head, -1, -1)
+
+        xy_dec, k_cache, v_cache = model.t2s_transformer.process_prompt(xy_pos, xy_attn_mask, None)
+        # No EOS on the first step, same as infer_panel_batch_infer
+        logits = model.ar_predict_layer(xy_dec[:, -1])[:, :-1]
+        top_k, top_p, temperature, repetition_penalty = sequence.sampling
+        samples = sample_rows(logits, y, [sequence.generator], top_k=top_k, top_p=top_p,
+                              repetition_penalty=repetition_penalty, temperature=temperature)
+        y = torch.concat([y, samples], dim=1)
+
+        max_new = self._capacity(sequence)
+        kv_capacity = src_len + max_new
+        y_capacity = y_len + max_new + 1
+        if self.rows:
+            kv_capacity = max(kv_capacity, self.k_cache[0].shape[1])
+            y_capacity = max(y_capacity, self.y.shape[1])
+
+        def fit(tensor:torch.Tensor, capacity:int, fill):
+            # Grow a [batch, length, ...] tensor to capacity along dim 1
+            if tensor.shape[1] >= capacity:
+                return tensor
+            if tensor.dim() == 3:
+                return F.pad(tensor, (0, 0, 0, capacity - tensor.shape[1]), value=fill)
+            return F.pad(tensor, (0, capacity - tensor.shape[1]), value=fill)
+
+        # Unused y positions repeat the first prompt token, so the repetition penalty over the
+        # padded rows is the same as over each row's real tokens
+        new_y = fit(y, y_capacity, 0)
+        new_y[:, y.shape[1]:] = y[:, :1]
+        pe_idx = y.shape[1] - 1
+        new_xy_pos = model.ar_audio_embedding(samples) * model.ar_audio_position.x_scale + \
+                     model.ar_audio_position.alpha * model.ar_audio_position.pe[:, pe_idx].to(dtype=x.dtype, device=x.device)
+
+        if not self.rows:
+            self.k_cache = [fit(k, kv_capacity, 0) for k in k_cache]
+            self.v_cache = [fit(v, kv_capacity, 0) for v in v_cache]
+            self.kv_lens = torch.tensor([src_len], dtype=torch.long, device=x.device)
+            self.y = new_y
+            self.y_lens = torch.tensor([y.shape[1]], dtype=torch.long, device=x.device)
+            self.xy_pos = new_xy_pos
+        else:
+            # Joining is a one-off copy per sentence, decode steps never reallocate
+            self.k_cache = [torch.cat([fit(k_batch, kv_capacity, 0), fit(k, kv_capacity, 0)], dim=0) for k_batch, k in zip(self.k_cache, k_cache)]
+            self.v_cache = [torch.cat([fit(v_batch, kv_capacity, 0), fit(v, kv_capacity, 0)], dim=0) for v_batch, v in zip(self.v_cache, v_cache)]
+            self.kv_lens = torch.cat([self.kv_lens, self.kv_lens.new_tensor([src_len])])
+            batch_y = fit(self.y, y_capacity, 0)
+            if batch_y.shape[1] > self.y.shape[1]:
+                batch_y[:, self.y.shape[1]:] = self.y[:, :1]
+            self.y = torch.cat([batch_y, new_y], dim=0)
+            self.y_lens = torch.cat([self.y_lens, self.y_lens.new_tensor([y.shape[1]])])
+            self.xy_pos = torch.cat([self.xy_pos, new_xy_pos], dim=0)
+        self.rows.append(sequence)
+        self.max_active = max(self.max_active, len(self.rows))
+
+        # A sentence can already be over after its first token when early_stop_num is tiny
+        self._retire(torch.tensor([False] * (len(self.rows) - 1) + [sequence.early_stop_num != -1 and 1 > sequence.early_stop_num], device=x.device))
+
+    def _step(self):
+        '''Decode one token for every row of the batch.'''
+        model = self.model
+        batch_size = len(self.rows)
+        capacity = self.k_cache[0].shape[1]
+        device = self.xy_pos.device
+
+        batch_index = torch.arange(batch_size, device=device)
+        flat_index = batch_index * capacity + self.kv_lens
+        kv_len = int(self.kv_lens.max().item()) + 1
+        attn_mask = (torch.arange(kv_len, device=device).unsqueeze(0) > self.kv_lens.unsqueeze(1)).view(batch_size, 1, 1, kv_len)
+
+        xy_dec = model.t2s_transformer.decode_next_token_ragged(self.xy_pos, self.k_cache, self.v_cache, flat_index, kv_len, attn_mask)
+        self.kv_lens += 1
+        logits = model.ar_predict_layer(xy_dec[:, -1])
+
+        # Sample each group of rows that share sampling parameters together
+        samples = torch.empty((batch_size, 1), dtype=self.y.dtype, device=device)
+        tokens = torch.empty((batch_size,), dtype=torch.long, device=device)
+        groups:Dict[tuple, List[int]] = {}
+        for i, sequence in enumerate(self.rows):
+            groups.setdefault(sequence.sampling, []).append(i)
+        for (top_k, top_p, temperature, repetition_penalty), indices in groups.items():
+            index = torch.tensor(indices, device=device)
+            group_logits = logits.index_select(0, index)
+            previous_tokens = self.y.index_select(0, index).narrow(1, 0, int(self.y_lens.index_select(0, index).max().item()))
+            group_samples = sample_rows(group_logits, previous_tokens, [self.rows[i].generator for i in indices],
+                                        top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature)
+            samples.index_copy_(0, index, group_samples.to(samples.dtype))
+            tokens.index_copy_(0, index, torch.argmax(group_logits, dim=-1))
+
+        self.y.view(-1).index_copy_(0, batch_index * self.y.shape[1] + self.y_lens, samples.view(-1))
+        self.y_lens += 1
+        self.steps += 1
+        self.batched_rows += batch_size
+
+        generated = self.y_lens - self.y_lens.new_tensor([sequence.prefix_len for sequence in self.rows])
+        early_stop = self.y_lens.new_tensor([sequence.early_stop_num for sequence in self.rows])
+        stopped = torch.tensor([sequence.stop_event is not None and sequence.stop_event.is_set() for sequence in self.rows], device=device)
+        finished = (samples[:, 0] == model.EOS) | (tokens == model.EOS) | (generated >= MAX_DECODE_STEPS) | \
+                   ((early_stop != -1) & (generated > early_stop)) | stopped
+
+        pe_idx = (self.y_lens - 1).clamp(max=model.ar_audio_position.pe.shape[1] - 1)
+        y_emb = model.ar_audio_embedding(samples)
+        self.xy_pos = y_emb * model.ar_audio_position.x_scale + model.ar_audio_position.alpha * \
+                      model.ar_audio_position.pe[0].index_select(0, pe_idx).unsqueeze(1).to(dtype=y_emb.dtype, device=device)
+
+        self._retire(finished)
+
+    def _retire(self, finished:torch.Tensor):
+        '''Hand finished rows back to their callers and drop them from the batch.'''
+        if not bool(finished.any()):
+            return
+        finished_rows = torch.where(finished)[0].tolist()
+        for i in finished_rows:
+            sequence = self.rows[i]
+            y_len = int(self.y_lens[i].item())
+            # Same result as infer_panel_batch_infer: tokens without the last one, idx = generated - 1
+            sequence.finish(y=self.y[i, :y_len - 1].clone(), idx=y_len - sequence.prefix_len - 1)
+
+        if len(finished_rows) == len(self.rows):
+            self._reset_batch()
+            return
+
+        keep = torch.where(~finished)[0]
+        self.rows = [self.rows[i] for i in keep.tolist()]
+        self.k_cache = [k.index_select(0, keep) for k in self.k_cache]
+        self.v_cache = [v.index_select(0, keep) for v in self.v_cache]
+        self.kv_lens = self.kv_lens.index_select(0, keep)
+        self.y = self.y.index_select(0, keep)
+        self.y_lens = self.y_lens.index_select(0, keep)
+        self.xy_pos = self.xy_pos.index_select(0, keep)
+
+    def get_stats(self) -> dict:
+        return {
+            "active": len(self.rows),
+            "pending": len(self.pending),
+            "max_batch_size": self.max_batch_size,
+            "max_active": self.max_active,
+            "admitted": self.admitted,
+            "steps": self.steps,
+            "avg_batch_size": self.batched_rows / self.steps if self.steps else 0.0,
+        }
@@ -2,6 +2,7 @@ from copy import deepcopy
 import math
 import os, sys, gc
 import random
+import threading
 import traceback
 
 import torchaudio
@@ -28,6 +29,8 @@ from tools.my_utils import load_audio
 from module.mel_processing import spectrogram_torch
 from TTS_infer_pack.text_segmentation_method import splits
 from TTS_infer_pack.TextPreprocessor import TextPreprocessor
+from TTS_infer_pack.PromptCache import PromptCache, file_sha256, hash_key
+from TTS_infer_pack.T2SScheduler import T2SBatchScheduler
 from BigVGAN.bigvgan import BigVGAN
 from module.mel_processing import spectrogram_torch,mel_spectrogram_torch
 from process_ckpt import get_sovits_version_from_path_fast, load_sovits_new
@@ -352,7 +355,7 @@ class TTS_Config:
 
 
 class TTS:
-    def __init__(self, configs: Union[dict, str, TTS_Config]):
+    def __init__(self, configs: Union[dict, str, TTS_Config], prompt_cache_dir:str=None, feature_cache_dir:str=None):
         if isinstance(configs, TTS_Config):
             self.configs = configs
         else:
@@ -372,7 +375,9 @@ class TTS:
         self.text_preprocessor:TextPreprocessor = \
                             TextPreprocessor(self.bert_model,
                                             self.bert_tokenizer,
-                                            self.configs.device)
+                                            self.configs.device,
+                                            cache_dir=feature_cache_dir,
+                                            cache_namespace=self.configs.bert_base_path)
 
 
         self.prompt_cache:dict = {
@@ -386,6 +391,14 @@ class TTS:
             "norm_text"      : None,
             "aux_ref_audio_paths": [],
         }
+        # Prompt artifacts of every voice used so far, keyed by content hash (see PromptCache)
+        self.prompt_cache_store:PromptCache = PromptCache(prompt_cache_dir)
+        # Guards prompt_cache while a run switches the reference audio / prompt text
+        self.prompt_lock = threading.RLock()
+        # Serializes VITS decoding of concurrent runs, each reseeds the global RNG for its noise
+        self.synthesis_lock = threading.Lock()
+        # Continuous batching of T2S decoding across concurrent runs, see enable_t2s_scheduler
+        self.t2s_scheduler:T2SBatchScheduler = None
 
 
         self.stop_flag:bool = False
@@ -608,11 +621,32 @@ class TTS:
         '''
             To set the reference audio for the TTS model,
                 including the prompt_semantic and refer_spepc.
+                Results are cached by the content hash of the reference audio.
             Args:
                 ref_audio_path: str, the path of the reference audio.
         '''
-        self._set_prompt_semantic(ref_audio_path)
-        self._set_ref_spec(ref_audio_path)
+        cache_key = "ref-" + hash_key(file_sha256(ref_audio_path),
+                                      self.configs.vits_weights_path,
+                                      self.configs.cnhuhbert_base_path)
+        cached = self.prompt_cache_store.get(cache_key)
+        if cached is not None:
+            logger.debug(f"Reference audio features loaded from cache: {ref_audio_path}")
+            self.prompt_cache["prompt_semantic"] = cached["prompt_semantic"].to(self.configs.device)
+            self.prompt_cache["raw_audio"] = cached["raw_audio"].to(self.configs.device)
+            self.prompt_cache["raw_sr"] = cached["raw_sr"]
+            spec = cached["refer_spec"].to(self.configs.device)
+            if self.configs.is_half:
+                spec = spec.half()
+            self._set_ref_spec_tensor(spec)
+        else:
+            self._set_prompt_semantic(ref_audio_path)
+            self._set_ref_spec(ref_audio_path)
+            self.prompt_cache_store.put(cache_key, {
+                "prompt_semantic": self.prompt_cache["prompt_semantic"],
+                "refer_spec": self.prompt_cache["refer_spec"][0].float(),
+                "raw_audio": self.prompt_cache["raw_audio"],
+                "raw_sr": self.prompt_cache["raw_sr"],
+            })
         self._set_ref_audio_path(ref_audio_path)
 
     def _set_ref_audio_path(self, ref_audio_path):
@@ -620,6 +654,9 @@ class TTS:
 
     def _set_ref_spec(self, ref_audio_path):
         spec = self._get_ref_spec(ref_audio_path)
+        self._set_ref_spec_tensor(spec)
+
+    def _set_ref_spec_tensor(self, spec):
         if self.prompt_cache["refer_spec"] in [[],None]:
             self.prompt_cache["refer_spec"]=[spec]
         else:
@@ -834,10 +871,21 @@ class TTS:
 
     def stop(self,):
         '''
-        Stop the inference process.
+        Stop the inference process of every running run, set a run's "stop_event" to stop only that one.
         '''
         self.stop_flag = True
 
+    def enable_t2s_scheduler(self, max_batch_size:int=8):
+        '''
+        Decode the sentences of concurrent run() calls in one shared, continuously batched T2S batch.
+        Only used in parallel_infer mode.
+            Args:
+                max_batch_size: int, maximum number of sentences decoded together.
+        '''
+        if self.t2s_scheduler is None:
+            self.t2s_scheduler = T2SBatchScheduler(lambda: self.t2s_model.model, max_batch_size)
+            self.t2s_scheduler.start()
+
     @torch.no_grad()
     def run(self, inputs:dict):
         """
@@ -867,6 +915,8 @@ class TTS:
                     "repetition_penalty": 1.35    # float. repetition penalty for T2S model.
                     "sample_steps": 32,           # int. number of sampling steps for VITS model V3.
                     "super_sampling": False,       # bool. whether to use super-sampling for audio when using VITS model V3.
+                    "static_kv_cache": False,      # bool. decode T2S with preallocated, in-place KV cache buffers.
+                    "stop_event": None,           # threading.Event.(optional) stops only this run when set, see stop().
                 }
         returns:
             Tuple[int, np.ndarray]: sampling rate and audio data.
@@ -892,17 +942,24 @@ class TTS:
         seed = inputs.get("seed", -1)
         seed = -1 if seed in ["", None] else seed
         actual_seed = set_seed(seed)
+        # Concurrent runs interleave on the global RNG, so sampling draws from this run's own generator
+        generator = torch.Generator().manual_seed(actual_seed)
         parallel_infer = inputs.get("parallel_infer", True)
         repetition_penalty = inputs.get("repetition_penalty", 1.35)
         sample_steps = inputs.get("sample_steps", 32)
         super_sampling = inputs.get("super_sampling", False)
+        static_kv_cache = inputs.get("static_kv_cache", False)
+        stop_event:threading.Event = inputs.get("stop_event")
+        stopped = lambda: self.stop_flag or (stop_event is not None and stop_event.is_set())
 
         if parallel_infer:
             logger.debug(i18n("并行推理模式已开启"))
-            self.t2s_model.model.infer_panel = self.t2s_model.model.infer_panel_batch_infer
+            infer_panel = self.t2s_model.model.infer_panel_batch_infer
+            if self.t2s_scheduler is not None:
+                infer_panel = self.t2s_scheduler.infer_panel
         else:
             logger.debug(i18n("并行推理模式已关闭"))
-            self.t2s_model.model.infer_panel = self.t2s_model.model.infer_panel_naive_batched
+            infer_panel = self.t2s_model.model.infer_panel_naive_batched
 
         if return_fragment:
             logger.debug(i18n("分段返回模式已开启"))
@@ -933,47 +990,62 @@ class TTS:
         if no_prompt_text and self.configs.is_v3_synthesizer:
             raise NO_PROMPT_ERROR("prompt_text cannot be empty when using SoVITS_V3")
 
-        if ref_audio_path in [None, ""] and \
-            ((self.prompt_cache["prompt_semantic"] is None) or (self.prompt_cache["refer_spec"] in [None, []])):
-            raise ValueError("ref_audio_path cannot be empty, when the reference audio is not set using set_ref_audio()")
-
-        ###### setting reference audio and prompt text preprocessing ########
-        t0 = ttime()
-        if (ref_audio_path is not None) and (ref_audio_path != self.prompt_cache["ref_audio_path"]):
-            if not os.path.exists(ref_audio_path):
-                raise ValueError(f"{ref_audio_path} not exists")
-            self.set_ref_audio(ref_audio_path)
-
-        aux_ref_audio_paths = aux_ref_audio_paths if aux_ref_audio_paths is not None else []
-        paths = set(aux_ref_audio_paths)&set(self.prompt_cache["aux_ref_audio_paths"])
-        if not (len(list(paths)) == len(aux_ref_audio_paths) == len(self.prompt_cache["aux_ref_audio_paths"])):
-            self.prompt_cache["aux_ref_audio_paths"] = aux_ref_audio_paths
-            self.prompt_cache["refer_spec"] = [self.prompt_cache["refer_spec"][0]]
-            for path in aux_ref_audio_paths:
-                if path in [None, ""]:
-                    continue
-                if not os.path.exists(path):
-                    print(i18n("音频文件不存在，跳过："), path)
-                    continue
-                self.prompt_cache["refer_spec"].append(self._get_ref_spec(path))
-
-        if not no_prompt_text:
-            prompt_text = prompt_text.strip("\n")
-            if (prompt_text[-1] not in splits): prompt_text += "。" if prompt_lang != "en" else "."
-            logger.debug(i18n("实际输入的参考文本:"), prompt_text)
-            if self.prompt_cache["prompt_text"] != prompt_text:
-                phones, bert_features, norm_text = \
-                    self.text_preprocessor.segment_and_extract_feature_for_text(
-                                                                        prompt_text,
-                                                                        prompt_lang,
-                                                                        self.configs.version)
-                self.prompt_cache["prompt_text"] = prompt_text
-                self.prompt_cache["prompt_lang"] = prompt_lang
-                self.prompt_cache["phones"] = phones
-                self.prompt_cache["bert_features"] = bert_features
-                self.prompt_cache["norm_text"] = norm_text
-
-
+        with self.prompt_lock:
+            if ref_audio_path in [None, ""] and \
+                ((self.prompt_cache["prompt_semantic"] is None) or (self.prompt_cache["refer_spec"] in [None, []])):
+                raise ValueError("ref_audio_path cannot be empty, when the reference audio is not set using set_ref_audio()")
+
+            ###### setting reference audio and prompt text preprocessing ########
+            t0 = ttime()
+            if (ref_audio_path is not None) and (ref_audio_path != self.prompt_cache["ref_audio_path"]):
+                if not os.path.exists(ref_audio_path):
+                    raise ValueError(f"{ref_audio_path} not exists")
+                self.set_ref_audio(ref_audio_path)
+
+            aux_ref_audio_paths = aux_ref_audio_paths if aux_ref_audio_paths is not None else []
+            paths = set(aux_ref_audio_paths)&set(self.prompt_cache["aux_ref_audio_paths"])
+            if not (len(list(paths)) == len(aux_ref_audio_paths) == len(self.prompt_cache["aux_ref_audio_paths"])):
+                self.prompt_cache["aux_ref_audio_paths"] = aux_ref_audio_paths
+                self.prompt_cache["refer_spec"] = [self.prompt_cache["refer_spec"][0]]
+                for path in aux_ref_audio_paths:
+                    if path in [None, ""]:
+                        continue
+                    if not os.path.exists(path):
+                        print(i18n("音频文件不存在，跳过："), path)
+                        continue
+                    self.prompt_cache["refer_spec"].append(self._get_ref_spec(path))
+
+            if not no_prompt_text:
+                prompt_text = prompt_text.strip("\n")
+                if (prompt_text[-1] not in splits): prompt_text += "。" if prompt_lang != "en" else "."
+                logger.debug(i18n("实际输入的参考文本:"), prompt_text)
+                if self.prompt_cache["prompt_text"] != prompt_text or self.prompt_cache["prompt_lang"] != prompt_lang:
+                    cache_key = "text-" + hash_key(prompt_text, prompt_lang, self.configs.version, self.configs.bert_base_path)
+                    cached = self.prompt_cache_store.get(cache_key)
+                    if cached is not None:
+                        phones = cached["phones"]
+                        bert_features = cached["bert_features"].to(self.configs.device)
+                        norm_text = cached["norm_text"]
+                    else:
+                        phones, bert_features, norm_text = \
+                            self.text_preprocessor.segment_and_extract_feature_for_text(
+                                                                                prompt_text,
+                                                                                prompt_lang,
+                                                                                self.configs.version)
+                        self.prompt_cache_store.put(cache_key, {
+                            "phones": phones,
+                            "bert_features": bert_features,
+                            "norm_text": norm_text,
+                        })
+                    self.prompt_cache["prompt_text"] = prompt_text
+                    self.prompt_cache["prompt_lang"] = prompt_lang
+                    self.prompt_cache["phones"] = phones
+                    self.prompt_cache["bert_features"] = bert_features
+                    self.prompt_cache["norm_text"] = norm_text
+
+            # Concurrent runs may switch the voice, keep using the prompt this run was set up with
+            prompt_cache = dict(self.prompt_cache)
+            prompt_cache["refer_spec"] = list(self.prompt_cache["refer_spec"])
 
 
         ###### text preprocessing ########
@@ -987,7 +1059,7 @@ class TTS:
 
             batch_index_list:list = None
             data, batch_index_list = self.to_batch(data,
-                                prompt_data=self.prompt_cache if not no_prompt_text else None,
+                                prompt_data=prompt_cache if not no_prompt_text else None,
                                 batch_size=batch_size,
                                 threshold=batch_threshold,
                                 split_bucket=split_bucket,
@@ -1019,7 +1091,7 @@ class TTS:
                 if len(batch_data) == 0:
                     return None
                 batch, _ = self.to_batch(batch_data,
-                            prompt_data=self.prompt_cache if not no_prompt_text else None,
+                            prompt_data=prompt_cache if not no_prompt_text else None,
                             batch_size=batch_size,
                             threshold=batch_threshold,
                             split_bucket=False,
@@ -1057,10 +1129,10 @@ class TTS:
                 if no_prompt_text :
                     prompt = None
                 else:
-                    prompt = self.prompt_cache["prompt_semantic"].expand(len(all_phoneme_ids), -1).to(self.configs.device)
+                    prompt = prompt_cache["prompt_semantic"].expand(len(all_phoneme_ids), -1).to(self.configs.device)
 
                 logger.debug(f"############ {i18n('预测语义Token')} ############")
-                pred_semantic_list, idx_list = self.t2s_model.model.infer_panel(
+                pred_semantic_list, idx_list = infer_panel(
                     all_phoneme_ids,
                     all_phoneme_lens,
                     prompt,
@@ -1072,11 +1144,18 @@ class TTS:
                     early_stop_num=self.configs.hz * self.configs.max_sec,
                     max_len=max_len,
                     repetition_penalty=repetition_penalty,
+                    static_kv_cache=static_kv_cache,
+                    generator=generator,
+                    stop_event=stop_event,
                 )
                 t4 = ttime()
                 t_34 += t4 - t3
+                if stopped():
+                    # Decoding may have ended early, don't vocode the partial tokens
+                    yield 16000, np.zeros(int(16000), dtype=np.int16)
+                    return
 
-                refer_audio_spec:torch.Tensor = [item.to(dtype=self.precision, device=self.configs.device) for item in self.prompt_cache["refer_spec"]]
+                refer_audio_spec:torch.Tensor = [item.to(dtype=self.precision, device=self.configs.device) for item in prompt_cache["refer_spec"]]
 
 
                 batch_audio_fragment = []
@@ -1094,41 +1173,44 @@ class TTS:
                 #         pred_semantic, pred_semantic_len, batch_phones, batch_phones_len,refer_audio_spec
                 #     ))
                 logger.debug(f"############ {i18n('合成音频')} ############")
-                if not self.configs.is_v3_synthesizer:
-                    if speed_factor == 1.0:
-                        # ## vits并行推理 method 2
-                        pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
-                        upsample_rate = math.prod(self.vits_model.upsample_rates)
-                        audio_frag_idx = [pred_semantic_list[i].shape[0]*2*upsample_rate for i in range(0, len(pred_semantic_list))]
-                        audio_frag_end_idx = [ sum(audio_frag_idx[:i+1]) for i in range(0, len(audio_frag_idx))]
-                        all_pred_semantic = torch.cat(pred_semantic_list).unsqueeze(0).unsqueeze(0).to(self.configs.device)
-                        _batch_phones = torch.cat(batch_phones).unsqueeze(0).to(self.configs.device)
-                        _batch_audio_fragment = (self.vits_model.decode(
-                                all_pred_semantic, _batch_phones, refer_audio_spec, speed=speed_factor
-                            ).detach()[0, 0, :])
-                        audio_frag_end_idx.insert(0, 0)
-                        batch_audio_fragment= [_batch_audio_fragment[audio_frag_end_idx[i-1]:audio_frag_end_idx[i]] for i in range(1, len(audio_frag_end_idx))]
+                # VITS noise comes from the global RNG, reseed it from this run's generator while no other run decodes
+                with self.synthesis_lock:
+                    torch.manual_seed(int(torch.randint(0, 2**63 - 1, (1,), generator=generator).item()))
+                    if not self.configs.is_v3_synthesizer:
+                        if speed_factor == 1.0:
+                            # ## vits并行推理 method 2
+                            pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
+                            upsample_rate = math.prod(self.vits_model.upsample_rates)
+                            audio_frag_idx = [pred_semantic_list[i].shape[0]*2*upsample_rate for i in range(0, len(pred_semantic_list))]
+                            audio_frag_end_idx = [ sum(audio_frag_idx[:i+1]) for i in range(0, len(audio_frag_idx))]
+                            all_pred_semantic = torch.cat(pred_semantic_list).unsqueeze(0).unsqueeze(0).to(self.configs.device)
+                            _batch_phones = torch.cat(batch_phones).unsqueeze(0).to(self.configs.device)
+                            _batch_audio_fragment = (self.vits_model.decode(
+                                    all_pred_semantic, _batch_phones, refer_audio_spec, speed=speed_factor
+                                ).detach()[0, 0, :])
+                            audio_frag_end_idx.insert(0, 0)
+                            batch_audio_fragment= [_batch_audio_fragment[audio_frag_end_idx[i-1]:audio_frag_end_idx[i]] for i in range(1, len(audio_frag_end_idx))]
+                        else:
+                        # ## vits串行推理
+                            for i, idx in enumerate(tqdm(idx_list)):
+                                phones = batch_phones[i].unsqueeze(0).to(self.configs.device)
+                                _pred_semantic = (pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0))   # .unsqueeze(0)#mq要多unsqueeze一次
+                                audio_fragment =(self.vits_model.decode(
+                                        _pred_semantic, phones, refer_audio_spec, speed=speed_factor
+                                    ).detach()[0, 0, :])
+                                batch_audio_fragment.append(
+                                    audio_fragment
+                                )  ###试试重建不带上prompt部分
                     else:
-                    # ## vits串行推理
                         for i, idx in enumerate(tqdm(idx_list)):
                             phones = batch_phones[i].unsqueeze(0).to(self.configs.device)
                             _pred_semantic = (pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0))   # .unsqueeze(0)#mq要多unsqueeze一次
-                            audio_fragment =(self.vits_model.decode(
-                                    _pred_semantic, phones, refer_audio_spec, speed=speed_factor
-                                ).detach()[0, 0, :])
+                            audio_fragment = self.v3_synthesis(
+                                    _pred_semantic, phones, speed=speed_factor, sample_steps=sample_steps
+                                )
                             batch_audio_fragment.append(
                                 audio_fragment
-                            )  ###试试重建不带上prompt部分
-                else:
-                    for i, idx in enumerate(tqdm(idx_list)):
-                        phones = batch_phones[i].unsqueeze(0).to(self.configs.device)
-                        _pred_semantic = (pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0))   # .unsqueeze(0)#mq要多unsqueeze一次
-                        audio_fragment = self.v3_synthesis(
-                                _pred_semantic, phones, speed=speed_factor, sample_steps=sample_steps
                             )
-                        batch_audio_fragment.append(
-                            audio_fragment
-                        ) 
 
                 t5 = ttime()
                 t_45 += t5 - t4
@@ -1145,7 +1227,7 @@ class TTS:
                 else:
                     audio.append(batch_audio_fragment)
 
-                if self.stop_flag:
+                if stopped():
                     yield 16000, np.zeros(int(16000), dtype=np.int16)
                     return
 
@@ -15,6 +15,7 @@ from text.cleaner import clean_text
 from text import cleaned_text_to_sequence
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 from TTS_infer_pack.text_segmentation_method import split_big_text, splits, get_method as get_seg_method
+from TTS_infer_pack.PromptCache import PromptCache, hash_key
 
 from tools.i18n.i18n import I18nAuto, scan_language_list
 from services.lib.LAV_logger import logger
@@ -52,11 +53,24 @@ def merge_short_text_in_array(texts:str, threshold:int) -> list:
 
 class TextPreprocessor:
     def __init__(self, bert_model:AutoModelForMaskedLM,
-                 tokenizer:AutoTokenizer, device:torch.device):
+                 tokenizer:AutoTokenizer, device:torch.device,
+                 cache_dir:str=None, cache_size:int=256, cache_namespace:str="",
+                 cache_disk_bytes:int=128 * 1024 * 1024):
+        '''
+            Args:
+                cache_dir: str, directory for the on-disk tier of the feature cache, None keeps it in memory only.
+                cache_size: int, number of sentences kept in memory, 0 disables the feature cache.
+                cache_namespace: str, identifies the BERT model so features of different models never mix.
+                cache_disk_bytes: int, size of the on-disk tier before the least recently used sentences are deleted.
+        '''
         self.bert_model = bert_model
         self.tokenizer = tokenizer
         self.device = device
         self.bert_lock = threading.RLock()
+        # phones / bert features / norm_text per (text, language, version), see get_phones_and_bert
+        self.feature_cache:PromptCache = PromptCache(cache_dir, max_entries=cache_size,
+                                                          max_disk_bytes=cache_disk_bytes) if cache_size > 0 else None
+        self.cache_namespace = cache_namespace
 
     def preprocess(self, text:str, lang:str, text_split_method:str, version:str="v2")->List[Dict]:
         logger.debug(f'############ {i18n("切分文本")} ############')
@@ -120,6 +134,28 @@ class TextPreprocessor:
         return self.get_phones_and_bert(text, language, version)
 
     def get_phones_and_bert(self, text:str, language:str, version:str, final:bool=False):
+        '''
+            G2P + BERT features of a sentence. Results are cached by content, so repeated sentences
+            skip language segmentation, clean_text and the BERT forward entirely.
+        '''
+        if self.feature_cache is None:
+            return self._get_phones_and_bert(text, language, version, final)
+
+        text = re.sub(" {2,}", " ", text.strip())
+        cache_key = "features-" + hash_key(text, language, version, final, self.cache_namespace)
+        cached = self.feature_cache.get(cache_key)
+        if cached is not None:
+            return list(cached["phones"]), cached["bert_features"].to(self.device), cached["norm_text"]
+
+        phones, bert, norm_text = self._get_phones_and_bert(text, language, version, final)
+        self.feature_cache.put(cache_key, {
+            "phones": list(phones),
+            "bert_features": bert,
+            "norm_text": norm_text,
+        })
+        return phones, bert, norm_text
+
+    def _get_phones_and_bert(self, text:str, language:str, version:str, final:bool=False):
         with self.bert_lock:
           if language in {"en", "all_zh", "all_ja", "all_ko", "all_yue"}:
               # language = language.replace("all_","")
@@ -0,0 +1,80 @@
+from typing import List
+from .GPTsovits.GPT_SoVITS.TTS_infer_pack.text_segmentation_method import get_method
+
+
+class StreamSegmenter:
+    """
+    Incrementally splits streamed LLM tokens into sentences using the GPT-SoVITS cut methods.
+
+    The cut method is re-applied to the pending buffer on every token; every piece except the
+    last one is complete, the last one stays buffered until more text (or flush) arrives.
+    Emitted sentences are stripped, but whitespace between tokens is kept while buffering.
+    """
+
+    def __init__(self, text_split_method: str = "cut5", min_length: int = 8):
+        """
+        Args:
+            text_split_method: Name of a method registered in text_segmentation_method
+            min_length: Sentences shorter than this are merged with the next one
+        """
+        self.cut_method = get_method(text_split_method)
+        self.min_length = min_length
+        self.buffer = ""
+        self.pending = ""
+
+    def _split(self, text: str) -> List[str]:
+        """
+        Cut text into pieces that keep every character of it.
+
+        Cut methods drop whitespace and punctuation-only pieces ("...") and may strip pieces, so
+        the pieces they return are only used to locate sentence starts in the raw text. Each
+        returned piece runs from one start to the next, including the whitespace and
+        punctuation in between.
+        """
+        if not text.strip():
+            return []
+        starts = []
+        cursor = 0
+        for piece in self.cut_method(text).split("\n"):
+            core = piece.strip()
+            if not core:
+                continue
+            start = text.find(core, cursor)
+            if start < 0:
+                return [text]  # The method rewrote the text, treat it as one piece until flush
+            starts.append(start)
+            cursor = start + len(core)
+        if not starts:
+            return [text]
+        starts[0] = 0
+        return [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)])]
+
+    def feed(self, token: str) -> List[str]:
+        """Add a token and return the sentences it completed."""
+        self.buffer += token
+        pieces = self._split(self.buffer)
+        if len(pieces) < 2:
+            return []
+
+        # The last piece may still grow, it stays buffered with any trailing whitespace
+        self.buffer = pieces[-1]
+        return self._merge_short(pieces[:-1])
+
+    def flush(self) -> List[str]:
+        """Return everything still buffered once the token stream has ended."""
+        pieces = self._split(self.buffer)
+        self.buffer = ""
+        sentences = self._merge_short(pieces)
+        if self.pending.strip():
+            sentences.append(self.pending.strip())
+        self.pending = ""
+        return sentences
+
+    def _merge_short(self, pieces: List[str]) -> List[str]:
+        sentences = []
+        for piece in pieces:
+            self.pending += piece
+            if len(self.pending.strip()) >= self.min_length:
+                sentences.append(self.pending.strip())
+                self.pending = ""
+        return sentences
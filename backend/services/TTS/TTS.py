@@ -1,12 +1,15 @@
 from io import BytesIO
+import json
 import os
 import subprocess
 import sys
-from typing import Generator
+from typing import Generator, Tuple
 import wave
 import numpy as np
 import soundfile as sf
 from services.lib.LAV_logger import logger
+from .VoiceRegistry import VoiceRegistry
+from .AudioCache import AudioCache
 
 base_dir = os.path.dirname(__file__)
 
@@ -18,6 +21,7 @@ sys.path.insert(0, gpt_sovits_root)  # Must come before importing
 
 from .GPTsovits.GPT_SoVITS.TTS_infer_pack.TTS import TTS as TTS_gptsovits, TTS_Config
 from .GPTsovits.GPT_SoVITS.TTS_infer_pack.text_segmentation_method import get_method_names as get_cut_method_names
+from .GPTsovits.GPT_SoVITS.TTS_infer_pack.PromptCache import file_sha256, hash_key
 
 
 
@@ -28,102 +32,114 @@ ref_audio_path = os.path.join(current_module_directory,"models","leaf","The birc
 prompt_text = "The birch canoe slid on the smooth planks.golden sheep to the dark blue background."
 
 class TTS:
-    def __init__(self):
+    def __init__(self, max_concurrent_requests=1, max_batch_size=8):
+        """
+        Args:
+            max_concurrent_requests: Requests that may synthesize at the same time. Above 1 their
+                T2S decoding is continuously batched on one shared model, every run samples from
+                its own seeded generator so a fixed seed stays deterministic
+            max_batch_size: Maximum number of sentences decoded together when batching
+        """
         config_path = os.path.join(gpt_sovits_root,"GPT_SoVITS","configs","tts_infer.yaml")
         self.tts_config = TTS_Config(config_path)
-        self.tts_pipeline = TTS_gptsovits(self.tts_config)
+        self.tts_pipeline = TTS_gptsovits(self.tts_config,
+                                          prompt_cache_dir=os.path.join(current_module_directory, "cache", "prompts"),
+                                          feature_cache_dir=os.path.join(current_module_directory, "cache", "features"))
+        self.max_batch_size = max_batch_size
+        self.set_max_concurrent_requests(max_concurrent_requests)
+        self.static_kv_cache = False  # Decode with preallocated KV buffers instead of growing them every step
+        # Random by default. A fixed seed (tts.seed setting) makes synthesis deterministic, which
+        # also enables the audio cache since a cached take is then what a fresh synthesis would give
+        self.seed = -1
+        self.audio_cache = AudioCache(os.path.join(current_module_directory, "cache", "audio"))
         self.current_voice = "leaf"  # Default voice
         self.voice_files = {}
         self.prompt_texts = {}
         self.prompt_langs = {}
+        self.voice_registry = VoiceRegistry(os.path.join(current_module_directory, "models"))
+        self._registry_version = None
         self._update_voice_files()
-        self.ref_audio_path = os.path.join(current_module_directory, "models", self.current_voice, self.voice_files[self.current_voice])
-        self.prompt_text = self.prompt_texts[self.current_voice]
-        self.prompt_lang = self.prompt_langs[self.current_voice]
-
-    def _parse_filename(self, filename):
-        """Parse filename to extract language marker and prompt text"""
-        # Remove .wav extension
-        name = os.path.splitext(filename)[0]
-        
-        # Check for language marker at the start
-        lang = 'en'  # default language
-        prompt_text = name
-        
-        # Look for language markers like [ja], [en], etc.
-        if name.startswith('['):
-            end_bracket = name.find(']')
-            if end_bracket != -1:
-                lang = name[1:end_bracket].lower()
-                prompt_text = name[end_bracket + 1:].strip()
-        
-        return lang, prompt_text
+        self.voice_registry.start_watching()
+
+    def set_max_concurrent_requests(self, max_concurrent_requests):
+        """Match the number of requests the TTS worker runs at once, see __init__"""
+        self.max_concurrent_requests = max_concurrent_requests
+        if max_concurrent_requests > 1:
+            # Stays enabled when lowered again, with a single run it decodes like infer_panel_batch_infer
+            self.tts_pipeline.enable_t2s_scheduler(self.max_batch_size)
+
+    def _update_voice_files(self, rescan=False):
+        """
+        Update voice files and prompt texts from the voice registry.
 
-    def _update_voice_files(self):
-        """Update voice files and prompt texts from the models directory"""
-        models_dir = os.path.join(current_module_directory, "models")
-        if not os.path.exists(models_dir):
+        The registry is kept up to date by its watcher, rescan=True forces a stat check right away.
+        """
+        if rescan:
+            self.voice_registry.refresh()
+        if self._registry_version == self.voice_registry.version:
             return
+        self._registry_version = self.voice_registry.version
 
-        # Rebuild state from filesystem
-        new_voice_files = {}
-        new_prompt_texts = {}
-        new_prompt_langs = {}
-
-        for voice_dir in os.listdir(models_dir):
-            voice_path = os.path.join(models_dir, voice_dir)
-            if os.path.isdir(voice_path):
-                # Find the first .wav file in the directory
-                for file in os.listdir(voice_path):
-                    if file.endswith('.wav'):
-                        new_voice_files[voice_dir] = file
-                        # Parse filename for language and prompt text
-                        lang, prompt = self._parse_filename(file)
-                        new_prompt_texts[voice_dir] = prompt
-                        new_prompt_langs[voice_dir] = lang
-                        break
-
-        # Update state
-        self.voice_files = new_voice_files
-        self.prompt_texts = new_prompt_texts
-        self.prompt_langs = new_prompt_langs
+        voices = self.voice_registry.get_voices()
+        self.voice_files = {name: voice["file"] for name, voice in voices.items()}
+        self.prompt_texts = {name: voice["prompt_text"] for name, voice in voices.items()}
+        self.prompt_langs = {name: voice["language"] for name, voice in voices.items()}
 
         # Update current voice if needed
         if self.current_voice not in self.voice_files:
             # Try to use leaf, otherwise use first available voice
             self.current_voice = "leaf" if "leaf" in self.voice_files else next(iter(self.voice_files), None)
-            if self.current_voice:
-                self.ref_audio_path = os.path.join(models_dir, self.current_voice, self.voice_files[self.current_voice])
-                self.prompt_text = self.prompt_texts[self.current_voice]
-                self.prompt_lang = self.prompt_langs[self.current_voice]
-            else:
-                self.ref_audio_path = None
-                self.prompt_text = None
-                self.prompt_lang = None
+        if self.current_voice:
+            self._apply_voice(self.current_voice)
+        else:
+            self.ref_audio_path = None
+            self.prompt_text = None
+            self.prompt_lang = None
+
+    def _apply_voice(self, voice_name):
+        voice = self.voice_registry.get(voice_name)
+        self.ref_audio_path = voice["path"]
+        self.prompt_text = voice["prompt_text"]
+        self.prompt_lang = voice["language"]
+
+    def rescan_voices(self):
+        """Re-read the models directory, e.g. after voices were added without the watcher noticing yet"""
+        self.voice_registry.refresh(force=True)
+        self._update_voice_files()
+        return self.get_voice_details()
 
     def get_available_voices(self):
         """Get list of available voices from the models directory"""
-        self._update_voice_files()  # Always get the latest voice files
+        self._update_voice_files()
         return list(self.voice_files.keys())
 
+    def get_voice_details(self):
+        """Get metadata (duration, sample rate, language, hash) of every available voice"""
+        self._update_voice_files()
+        return list(self.voice_registry.get_voices().values())
+
     def change_voice(self, voice_name):
         """Change the current voice to the specified one"""
-        self._update_voice_files()  # Update voice files before checking
+        # A voice that was just copied in may not have been picked up by the watcher yet
+        self._update_voice_files(rescan=voice_name not in self.voice_files)
         if voice_name not in self.voice_files:
             raise ValueError(f"Voice '{voice_name}' not found")
             
         self.current_voice = voice_name
-        self.ref_audio_path = os.path.join(current_module_directory, "models", voice_name, self.voice_files[voice_name])
-        self.prompt_text = self.prompt_texts[voice_name]
-        self.prompt_lang = self.prompt_langs[voice_name]
+        self._apply_voice(voice_name)
         return {"message": f"Voice changed to {voice_name}"}
 
-    def syntheize(self, text):
-        self._update_voice_files()  # Update voice files before synthesis
+    def _check_ref_audio(self):
+        self._update_voice_files()
+        if not self.ref_audio_path or not os.path.exists(self.ref_audio_path):
+            # Reference audio disappeared since the last scan
+            self._update_voice_files(rescan=True)
         if not self.ref_audio_path or not os.path.exists(self.ref_audio_path):
             raise ValueError("No valid reference audio file available")
-        
-        req = {
+
+    def _build_request(self, text, streaming_mode=False):
+        """Build the GPT-SoVITS request for the current voice"""
+        return {
             "text": text,
             "text_lang": 'auto',
             "ref_audio_path": self.ref_audio_path,
@@ -133,20 +149,56 @@ class TTS:
             "top_k": 5,
             "top_p": 1,
             "temperature": 1,
-            "text_split_method": "cut0",
+            # Streaming splits on punctuation so every sentence becomes its own fragment
+            "text_split_method": "cut5" if streaming_mode else "cut0",
             "batch_size":int(1),
             "batch_threshold":float(0.75),
             "speed_factor":float(1.0),
             "split_bucket":True,
             "fragment_interval":0.3,
-            "seed":-1,
+            "seed":self.seed,
             "media_type":"wav",
-            "streaming_mode": False,
+            "streaming_mode": streaming_mode,
             "parallel_infer": True,
             "repetition_penalty":float(1.35),
             "sample_steps":int(32),
-            "super_sampling":False
+            "super_sampling":False,
+            "static_kv_cache": self.static_kv_cache
         }
+
+    def _weights_fingerprint(self):
+        """Content hash of the loaded T2S / VITS weights, part of every audio cache key"""
+        parts = [self.tts_config.version]
+        for path in (self.tts_config.t2s_weights_path, self.tts_config.vits_weights_path):
+            parts.append(file_sha256(path) if path and os.path.exists(path) else path)
+        return hash_key(*parts)
+
+    def _audio_cache_key(self, req):
+        """Key over every synthesis parameter, the reference audio content and the model weights"""
+        if req.get("seed", -1) in [-1, None, ""]:
+            return None  # Random seed, the result isn't reproducible
+        params = {k: v for k, v in req.items() if k not in ("ref_audio_path", "media_type")}
+        return hash_key(json.dumps(params, sort_keys=True, ensure_ascii=False),
+                        file_sha256(req["ref_audio_path"]),
+                        self._weights_fingerprint())
+
+    def is_cached(self, text, streaming_mode=False):
+        self._check_ref_audio()
+        cache_key = self._audio_cache_key(self._build_request(text, streaming_mode))
+        return cache_key is not None and self.audio_cache.contains(cache_key)
+
+    def syntheize(self, text, use_cache=True, stop_event=None):
+        """
+        Synthesize text into a complete audio file.
+
+        Args:
+            text: Text to speak
+            use_cache: Whether to answer from and fill the audio cache
+            stop_event: Optional threading.Event, setting it stops this synthesis at the next step
+        """
+        self._check_ref_audio()
+        
+        req = self._build_request(text)
         
         streaming_mode = req.get("streaming_mode", False)
         return_fragment = req.get("return_fragment", False)
@@ -156,8 +208,16 @@ class TTS:
         if check_res is not None:
             return check_res
 
+        cache_key = self._audio_cache_key(req) if use_cache and not streaming_mode else None
+        if cache_key is not None:
+            cached = self.audio_cache.get(cache_key)
+            if cached is not None:
+                sr, audio_data = cached
+                return pack_audio(BytesIO(), audio_data, sr, media_type).getvalue()
+
         if streaming_mode or return_fragment:
             req["return_fragment"] = True
+        req["stop_event"] = stop_event  # Not part of the cache key
             
         try:
             tts_generator=self.tts_pipeline.run(req)
@@ -175,13 +235,81 @@ class TTS:
         
             else:
                 sr, audio_data = next(tts_generator)
+                if cache_key is not None and not self._stopped(stop_event):
+                    self.audio_cache.put(cache_key, sr, audio_data)
                 audio_data = pack_audio(BytesIO(), audio_data, sr, media_type).getvalue()
                 return audio_data
         except Exception as e:
             logger.error(f"Error during completion: {e}", exc_info=True)
             return {"message": f"tts failed", "Exception": str(e)}
-        
-    
+
+    def _stopped(self, stop_event):
+        return self.tts_pipeline.stop_flag or (stop_event is not None and stop_event.is_set())
+
+    def synthesize_fragments(self, text, stop_event=None) -> Generator[Tuple[int, np.ndarray], None, None]:
+        """
+        Synthesize text sentence by sentence.
+
+        Yields (sample_rate, int16 PCM) as soon as each sentence fragment has been vocoded,
+        so playback can start before the whole reply is synthesized. Setting stop_event
+        (a threading.Event) stops the synthesis at the next step.
+        """
+        self._check_ref_audio()
+
+        req = self._build_request(text, streaming_mode=True)
+        self.check_params(req)
+
+        cache_key = self._audio_cache_key(req)
+        if cache_key is not None:
+            cached = self.audio_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        req["return_fragment"] = True
+        req["stop_event"] = stop_event
+        tts_generator = self.tts_pipeline.run(req)
+        chunks = []
+        try:
+            for sr, chunk in tts_generator:
+                chunks.append(chunk)
+                yield sr, chunk
+        finally:
+            # Consumer went away (client disconnected), skip the remaining fragments
+            tts_generator.close()
+
+        # Only reached when every fragment was produced
+        if cache_key is not None and chunks and not self._stopped(stop_event):
+            self.audio_cache.put(cache_key, sr, np.concatenate(chunks))
+
+    def synthesize_stream(self, text, media_type="wav", stop_event=None) -> Generator[bytes, None, None]:
+        """
+        Streaming variant of syntheize.
+
+        For wav the first chunk is a WAV header followed by raw PCM fragments, every other
+        media type is packed per fragment.
+        """
+        first_chunk = True
+        for sr, chunk in self.synthesize_fragments(text, stop_event):
+            if first_chunk and media_type == "wav":
+                yield wave_header_chunk(sample_rate=sr)
+                media_type = "raw"
+            first_chunk = False
+            yield pack_audio(BytesIO(), chunk, sr, media_type).getvalue()
+
+    def get_cache_stats(self):
+        """Hit/miss statistics of the TTS caches"""
+        feature_cache = self.tts_pipeline.text_preprocessor.feature_cache
+        return {
+            "prompt_cache": self.tts_pipeline.prompt_cache_store.get_stats(),
+            "feature_cache": feature_cache.get_stats() if feature_cache is not None else None,
+            "audio_cache": self.audio_cache.get_stats(),
+        }
+
+    def get_scheduler_stats(self):
+        """Batch statistics of the T2S continuous batching scheduler, if enabled"""
+        scheduler = self.tts_pipeline.t2s_scheduler
+        return {"t2s_scheduler": scheduler.get_stats() if scheduler is not None else None}
 
     def check_params(self, req:dict):
         text:str = req.get("text", "")
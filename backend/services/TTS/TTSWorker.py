@@ -0,0 +1,363 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+from services.lib.LAV_logger import logger
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+_END_OF_STREAM = object()
+
+
+class TTSQueueFullError(Exception):
+    pass
+
+
+class TTSJobCancelledError(Exception):
+    pass
+
+
+class TTSJob:
+    """A unit of work for the TTS worker thread."""
+
+    def __init__(self, func: Callable[[], Any], priority: int, channel: Optional[str],
+                 loop: asyncio.AbstractEventLoop, streaming: bool = False, stop: Optional[Callable[[], None]] = None):
+        self.func = func
+        self.stop = stop
+        self.priority = priority
+        self.channel = channel
+        self.loop = loop
+        self.streaming = streaming
+        self.cancelled = False
+        self.enqueued_at = time.time()
+        self.started_at = None
+        # Non-streaming jobs resolve a future, streaming jobs feed a queue item by item
+        self.future: asyncio.Future = loop.create_future()
+        self.items: asyncio.Queue = asyncio.Queue()
+
+    def abandon(self):
+        """Mark the job cancelled and stop its synthesis if it is already running."""
+        self.cancelled = True
+        if self.stop is not None:
+            self.stop()
+
+    def cancel(self):
+        self.abandon()
+        self.loop.call_soon_threadsafe(self._set_exception, TTSJobCancelledError("TTS request was cancelled"))
+
+    def _set_result(self, result):
+        if not self.future.done():
+            self.future.set_result(result)
+
+    def _set_exception(self, exception):
+        if not self.future.done():
+            self.future.set_exception(exception)
+            # Retrieve it right away so cancelled jobs nobody awaits don't log "exception never retrieved"
+            self.future.exception()
+        if self.streaming:
+            self.items.put_nowait(exception)
+
+
+class TTSWorker:
+    """
+    Runs every TTS synthesis on dedicated inference threads.
+
+    Requests wait in a bounded priority queue so synthesis never blocks the event loop,
+    callers get a TTSQueueFullError instead of piling up work when the queue is full,
+    and queued or running requests can be cancelled per channel once they are superseded.
+
+    With concurrency > 1 several requests run at once, which only pays off when the TTS
+    batches their decoding (see TTS_infer_pack.T2SScheduler).
+    """
+
+    def __init__(self, max_queue_size: int = 8, metrics_window: int = 200, concurrency: int = 1):
+        self.max_queue_size = max_queue_size
+        self.concurrency = concurrency
+        self._queue: List[tuple] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._threads: Dict[int, threading.Thread] = {}
+        self._running = False
+        self.running_jobs: List[TTSJob] = []
+
+        # Metrics
+        self._wait_times = deque(maxlen=metrics_window)
+        self._run_times = deque(maxlen=metrics_window)
+        self.completed_count = 0
+        self.cancelled_count = 0
+        self.rejected_count = 0
+        self.failed_count = 0
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        with self._condition:
+            self._start_threads()
+        logger.info(f"TTS worker started ({self.concurrency} thread(s))")
+
+    def set_concurrency(self, concurrency: int):
+        """Change the number of inference threads, surplus threads exit after their current job."""
+        with self._condition:
+            self.concurrency = max(1, concurrency)
+            if self._running:
+                self._start_threads()
+            self._condition.notify_all()
+        logger.info(f"TTS worker concurrency set to {self.concurrency}")
+
+    def _start_threads(self):
+        for index in range(self.concurrency):
+            if index not in self._threads:
+                thread = threading.Thread(target=self._run, args=(index,), name=f"TTSWorker-{index}", daemon=True)
+                self._threads[index] = thread
+                thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            for _, _, job in self._queue:
+                job.cancel()
+            self._queue.clear()
+            self._condition.notify_all()
+
+    def _submit(self, func: Callable[[], Any], priority: int, channel: Optional[str],
+                replace: bool, streaming: bool, stop: Optional[Callable[[], None]]) -> TTSJob:
+        if replace and channel is not None:
+            self.cancel_channel(channel)
+
+        job = TTSJob(func, priority, channel, asyncio.get_running_loop(), streaming, stop)
+        with self._condition:
+            if len(self._queue) >= self.max_queue_size:
+                self.rejected_count += 1
+                raise TTSQueueFullError(f"TTS queue is full ({self.max_queue_size} pending requests)")
+            heapq.heappush(self._queue, (priority, next(self._counter), job))
+            self._condition.notify()
+        return job
+
+    async def submit(self, func: Callable[[], Any], priority: int = PRIORITY_NORMAL,
+                     channel: Optional[str] = None, replace: bool = False,
+                     stop: Optional[Callable[[], None]] = None) -> Any:
+        """
+        Run func on the worker thread and return its result.
+
+        Args:
+            func: Blocking callable to run
+            priority: PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW
+            channel: Optional channel name used for cancellation
+            replace: Cancel everything queued or running on the same channel first
+            stop: Called from any thread when the job is cancelled, should make a running func return early
+        """
+        job = self._submit(func, priority, channel, replace, streaming=False, stop=stop)
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            # The caller went away (e.g. HTTP client disconnected), don't synthesize for nobody
+            job.abandon()
+            raise
+
+    def submit_stream(self, func: Callable[[], Any], priority: int = PRIORITY_NORMAL,
+                      channel: Optional[str] = None, replace: bool = False,
+                      stop: Optional[Callable[[], None]] = None) -> AsyncGenerator[Any, None]:
+        """
+        Run a generator function on the worker thread and yield its items as they are produced.
+
+        The job is queued immediately, so TTSQueueFullError is raised here rather than on first iteration.
+        """
+        job = self._submit(func, priority, channel, replace, streaming=True, stop=stop)
+        return self._iterate_stream(job)
+
+    async def _iterate_stream(self, job: TTSJob) -> AsyncGenerator[Any, None]:
+        try:
+            while True:
+                item = await job.items.get()
+                if item is _END_OF_STREAM:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Stops the generator if the consumer stopped early, a finished job has nothing left to stop
+            job.abandon()
+
+    async def synthesize(self, tts, text: str, priority: int = PRIORITY_NORMAL,
+                         channel: Optional[str] = None, replace: bool = False) -> bytes:
+        stop_event = threading.Event()
+        return await self.submit(lambda: tts.syntheize(text, stop_event=stop_event), priority, channel, replace,
+                                 stop=stop_event.set)
+
+    def stream(self, tts, text: str, priority: int = PRIORITY_NORMAL,
+               channel: Optional[str] = None, replace: bool = False) -> AsyncGenerator[bytes, None]:
+        stop_event = threading.Event()
+        return self.submit_stream(lambda: tts.synthesize_stream(text, stop_event=stop_event), priority, channel, replace,
+                                  stop=stop_event.set)
+
+    def stream_fragments(self, tts, text: str, priority: int = PRIORITY_NORMAL,
+                         channel: Optional[str] = None, replace: bool = False) -> AsyncGenerator[tuple, None]:
+        stop_event = threading.Event()
+        return self.submit_stream(lambda: tts.synthesize_fragments(text, stop_event=stop_event), priority, channel, replace,
+                                  stop=stop_event.set)
+
+    def cancel_channel(self, channel: str) -> int:
+        """Cancel all queued and running jobs of a channel, running ones through their stop hook. Returns the number of cancelled jobs."""
+        cancelled = 0
+        with self._condition:
+            remaining = []
+            for entry in self._queue:
+                job = entry[2]
+                if job.channel == channel:
+                    job.cancel()
+                    cancelled += 1
+                else:
+                    remaining.append(entry)
+            if cancelled:
+                heapq.heapify(remaining)
+                self._queue = remaining
+                self.cancelled_count += cancelled
+
+            for running_job in self.running_jobs:
+                if running_job.channel == channel and not running_job.cancelled:
+                    running_job.cancel()
+                    cancelled += 1
+        return cancelled
+
+    def _next_job(self, index: int) -> Optional[TTSJob]:
+        with self._condition:
+            while self._running and index < self.concurrency:
+                while self._queue:
+                    _, _, job = heapq.heappop(self._queue)
+                    if not job.cancelled:
+                        self.running_jobs.append(job)
+                        return job
+                    self.cancelled_count += 1
+                self._condition.wait()
+            del self._threads[index]
+            return None
+
+    def _run(self, index: int):
+        while True:
+            job = self._next_job(index)
+            if job is None:
+                break
+
+            job.started_at = time.time()
+            self._wait_times.append(job.started_at - job.enqueued_at)
+            try:
+                if job.streaming:
+                    self._run_streaming(job)
+                else:
+                    result = job.func()
+                    if not job.cancelled:
+                        job.loop.call_soon_threadsafe(job._set_result, result)
+                if job.cancelled:
+                    self.cancelled_count += 1
+                else:
+                    self.completed_count += 1
+            except Exception as e:
+                self.failed_count += 1
+                logger.error(f"TTS job failed: {e}", exc_info=True)
+                job.loop.call_soon_threadsafe(job._set_exception, e)
+            finally:
+                self._run_times.append(time.time() - job.started_at)
+                with self._condition:
+                    self.running_jobs.remove(job)
+
+    def _run_streaming(self, job: TTSJob):
+        generator = job.func()
+        try:
+            for item in generator:
+                if job.cancelled:
+                    break
+                job.loop.call_soon_threadsafe(job.items.put_nowait, item)
+        finally:
+            generator.close()
+        # Only a clean finish ends the stream, a failure reaches the consumer through _run's _set_exception
+        job.loop.call_soon_threadsafe(job.items.put_nowait, _END_OF_STREAM)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        def summarize(values):
+            if not values:
+                return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+            ordered = sorted(values)
+            return {
+                "avg": sum(ordered) / len(ordered),
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max": ordered[-1],
+            }
+
+        with self._condition:
+            queue_depth = len(self._queue)
+            running = len(self.running_jobs)
+            oldest_wait = time.time() - min(job.enqueued_at for _, _, job in self._queue) if self._queue else 0.0
+
+        return {
+            "queue_depth": queue_depth,
+            "max_queue_size": self.max_queue_size,
+            "busy": running > 0,
+            "running": running,
+            "concurrency": self.concurrency,
+            "oldest_wait_seconds": oldest_wait,
+            "wait_time_seconds": summarize(list(self._wait_times)),
+            "run_time_seconds": summarize(list(self._run_times)),
+            "completed": self.completed_count,
+            "cancelled": self.cancelled_count,
+            "rejected": self.rejected_count,
+            "failed": self.failed_count,
+        }
+
+
+if __name__ == "__main__":
+    # Check that a failing streaming job raises in the consumer instead of ending quietly
+    async def check_stream_error():
+        def failing():
+            yield b"first"
+            raise ValueError("No valid reference audio file available")
+
+        worker = TTSWorker()
+        worker.start()
+        received = []
+        try:
+            async for item in worker.submit_stream(failing):
+                received.append(item)
+        except ValueError as e:
+            assert received == [b"first"], received
+            logger.info(f"Stream error reached the consumer: {e}")
+        else:
+            raise AssertionError("Stream ended without raising the generator's exception")
+        finally:
+            worker.stop()
+
+    # Check that cancelling a running job stops its work instead of letting it run to the end
+    async def check_cancel_running():
+        stop_event = threading.Event()
+        finished = threading.Event()
+
+        def long_synthesis():
+            stop_event.wait(timeout=10)
+            finished.set()
+            return b"audio"
+
+        worker = TTSWorker()
+        worker.start()
+        try:
+            task = asyncio.create_task(worker.submit(long_synthesis, channel="speech", stop=stop_event.set))
+            while not worker.running_jobs:
+                await asyncio.sleep(0.01)
+            assert worker.cancel_channel("speech") == 1
+            try:
+                await task
+            except TTSJobCancelledError:
+                pass
+            else:
+                raise AssertionError("Cancelled job returned a result")
+            assert await asyncio.get_running_loop().run_in_executor(None, finished.wait, 1), "Running job was not stopped"
+            logger.info("Cancelling a running job stopped it")
+        finally:
+            worker.stop()
+
+    asyncio.run(check_stream_error())
+    asyncio.run(check_cancel_running())
@@ -0,0 +1,159 @@
+import os
+import threading
+from typing import Dict, Optional
+import soundfile as sf
+from services.lib.LAV_logger import logger
+from .GPTsovits.GPT_SoVITS.TTS_infer_pack.PromptCache import file_sha256
+
+
+class VoiceRegistry:
+    """
+    In-memory index of the voices in the TTS models directory.
+
+    Each voice is a sub folder holding a reference .wav named after its prompt text,
+    optionally prefixed with a language marker such as "[ja]". The index is built once and
+    only the voice folders whose stat signature changed are re-read on refresh, either from
+    the background watcher or an explicit rescan.
+    """
+
+    def __init__(self, models_dir: str, watch_interval: float = 2.0):
+        self.models_dir = models_dir
+        self.watch_interval = watch_interval
+        self.voices: Dict[str, dict] = {}
+        self._signatures: Dict[str, tuple] = {}
+        self._models_dir_mtime = None
+        self._lock = threading.RLock()
+        self._watch_thread: Optional[threading.Thread] = None
+        self._watch_stop = threading.Event()
+        self.version = 0  # Incremented whenever the index changes
+        self.refresh(force=True)
+
+    @staticmethod
+    def parse_filename(filename):
+        """Parse filename to extract language marker and prompt text"""
+        # Remove .wav extension
+        name = os.path.splitext(filename)[0]
+
+        # Check for language marker at the start
+        lang = 'en'  # default language
+        prompt_text = name
+
+        # Look for language markers like [ja], [en], etc.
+        if name.startswith('['):
+            end_bracket = name.find(']')
+            if end_bracket != -1:
+                lang = name[1:end_bracket].lower()
+                prompt_text = name[end_bracket + 1:].strip()
+
+        return lang, prompt_text
+
+    def _voice_signature(self, voice_path: str) -> Optional[tuple]:
+        """(dir mtime, wav name, wav size, wav mtime) - changes whenever the voice needs re-reading"""
+        try:
+            dir_mtime = os.stat(voice_path).st_mtime_ns
+            wav_file = next((f for f in sorted(os.listdir(voice_path)) if f.endswith('.wav')), None)
+            if wav_file is None:
+                return (dir_mtime, None, 0, 0)
+            wav_stat = os.stat(os.path.join(voice_path, wav_file))
+            return (dir_mtime, wav_file, wav_stat.st_size, wav_stat.st_mtime_ns)
+        except OSError:
+            return None
+
+    def _read_voice(self, voice_name: str, voice_path: str, wav_file: str) -> dict:
+        wav_path = os.path.join(voice_path, wav_file)
+        lang, prompt_text = self.parse_filename(wav_file)
+        voice = {
+            "name": voice_name,
+            "file": wav_file,
+            "path": wav_path,
+            "prompt_text": prompt_text,
+            "language": lang,
+            "duration": None,
+            "sample_rate": None,
+            "hash": None,
+        }
+        try:
+            info = sf.info(wav_path)
+            voice["duration"] = info.duration
+            voice["sample_rate"] = info.samplerate
+            voice["hash"] = file_sha256(wav_path)
+        except Exception as e:
+            logger.warning(f"Could not read metadata of voice '{voice_name}': {e}")
+        return voice
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Re-read voice folders whose stat signature changed.
+
+        Args:
+            force: Re-read every voice folder
+
+        Returns:
+            True if the index changed
+        """
+        with self._lock:
+            if not os.path.exists(self.models_dir):
+                changed = bool(self.voices)
+                self.voices, self._signatures = {}, {}
+                return changed
+
+            models_dir_mtime = os.stat(self.models_dir).st_mtime_ns
+            if force or models_dir_mtime != self._models_dir_mtime:
+                voice_names = [d for d in os.listdir(self.models_dir) if os.path.isdir(os.path.join(self.models_dir, d))]
+            else:
+                voice_names = list(self._signatures.keys())
+            self._models_dir_mtime = models_dir_mtime
+
+            changed = False
+            new_voices = {}
+            new_signatures = {}
+            for voice_name in voice_names:
+                voice_path = os.path.join(self.models_dir, voice_name)
+                signature = self._voice_signature(voice_path)
+                if signature is None:
+                    continue
+                new_signatures[voice_name] = signature
+                if signature[1] is None:
+                    continue  # Folder without reference audio
+
+                if not force and self._signatures.get(voice_name) == signature and voice_name in self.voices:
+                    new_voices[voice_name] = self.voices[voice_name]
+                else:
+                    new_voices[voice_name] = self._read_voice(voice_name, voice_path, signature[1])
+                    changed = True
+
+            if set(new_voices) != set(self.voices):
+                changed = True
+
+            self.voices = new_voices
+            self._signatures = new_signatures
+            if changed:
+                self.version += 1
+                logger.debug(f"Voice registry updated: {list(self.voices.keys())}")
+            return changed
+
+    def get(self, voice_name: str) -> Optional[dict]:
+        return self.voices.get(voice_name)
+
+    def get_voices(self) -> Dict[str, dict]:
+        return dict(self.voices)
+
+    def start_watching(self):
+        """Poll the models directory in the background and refresh when something changes."""
+        if self._watch_thread is not None:
+            return
+        self._watch_stop.clear()
+
+        def watch():
+            while not self._watch_stop.wait(self.watch_interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.warning(f"Voice registry refresh failed: {e}")
+
+        self._watch_thread = threading.Thread(target=watch, name="VoiceRegistryWatcher", daemon=True)
+        self._watch_thread.start()
+
+    def stop_watching(self):
+        self._watch_stop.set()
+        self._watch_thread = None
@@ -0,0 +1,142 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from .LAV_logger import logger
+
+
+class DiskCache:
+    """
+    Size-bounded directory of cache files, one file per key, shared by the TTS caches.
+
+    File sizes live in an in-memory index in least recently used order. The directory is only
+    listed once at startup, so writing and trimming never list or stat it again. Files are
+    written on a background thread, off the synthesis path, and the least recently used files
+    are deleted once the total exceeds max_bytes. Reads touch the file's mtime so the order
+    survives restarts.
+    """
+
+    def __init__(self, cache_dir: str, extension: str, max_bytes: int, name: str = "cache"):
+        """
+        Args:
+            cache_dir: Directory holding the files
+            extension: File extension including the dot, e.g. ".pt"
+            max_bytes: File bytes kept before the least recently used files are deleted
+            name: Used in log messages and the writer thread name
+        """
+        self.cache_dir = cache_dir
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.name = name
+        self.files: OrderedDict = OrderedDict()  # key -> file size, least recently used first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-writer")
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}{self.extension}")
+
+    def _scan(self):
+        files = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(self.extension):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, filename))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, filename[:-len(self.extension)], stat.st_size))
+        with self.lock:
+            for _, key, size in sorted(files):
+                self.files[key] = size
+                self.total_bytes += size
+        self.writer.submit(self._trim)  # The limit may have been lowered since the files were written
+
+    def contains(self, key: str) -> bool:
+        with self.lock:
+            return key in self.files
+
+    def read(self, key: str, reader: Callable[[str], Any]) -> Optional[Any]:
+        """reader(path) for the key's file, None if there is none or it can't be read."""
+        with self.lock:
+            if key not in self.files:
+                return None
+            self.files.move_to_end(key)
+        path = self._path(key)
+        try:
+            value = reader(path)
+            os.utime(path)
+            return value
+        except Exception as e:
+            logger.warning(f"Discarding unreadable {self.name} entry {path}: {e}")
+            self._remove(key)
+            return None
+
+    def write(self, key: str, writer: Callable[[str], None]):
+        """Persist an entry in the background, writer(path) writes the file and must not depend on mutable state."""
+        self.writer.submit(self._write, key, writer)
+
+    def _write(self, key: str, writer: Callable[[str], None]):
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        try:
+            writer(tmp_path)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Failed to persist {self.name} entry {key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self.lock:
+            self.total_bytes += size - self.files.pop(key, 0)
+            self.files[key] = size
+        self._trim()
+
+    def _trim(self):
+        evicted = []
+        with self.lock:
+            while self.total_bytes > self.max_bytes and len(self.files) > 1:
+                key, size = self.files.popitem(last=False)
+                self.total_bytes -= size
+                evicted.append(key)
+        for key in evicted:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _remove(self, key: str):
+        with self.lock:
+            self.total_bytes -= self.files.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def flush(self):
+        """Wait until every write submitted so far is on disk."""
+        self.writer.submit(lambda: None).result()
+
+    def clear(self):
+        self.flush()
+        with self.lock:
+            keys = list(self.files)
+            self.files.clear()
+            self.total_bytes = 0
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get_stats(self) -> dict:
+        return {
+            "disk_entries": len(self.files),
+            "disk_bytes": self.total_bytes,
+            "max_disk_bytes": self.max_bytes,
+        }
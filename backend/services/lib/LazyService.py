@@ -0,0 +1,127 @@
+import asyncio
+import inspect
+import threading
+import time
+import traceback
+from typing import Any, Callable, List, Optional
+from .LAV_logger import logger
+
+
+class LazyService:
+    """
+    Stand-in for a service whose models are slow to load.
+
+    The service is built by factory on first attribute access, or ahead of time by warm_up()
+    once the server is up. Attribute reads and writes are forwarded to the built instance, so
+    the proxy can be passed wherever the service itself was used.
+
+    Loading blocks the calling thread, so coroutines should await ready() instead of touching
+    an unloaded service directly from the event loop.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], warmup: Optional[Callable[[Any], None]] = None):
+        """
+        Args:
+            name: Component name reported by status()
+            factory: Builds the service
+            warmup: Optional call after building, e.g. a first inference so later requests are fast.
+                Runs on a worker thread, it may also return an awaitable that is awaited on the event loop
+        """
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_warmup", warmup)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.RLock())
+        object.__setattr__(self, "_callbacks", [])
+        object.__setattr__(self, "_state", "not_loaded")
+        object.__setattr__(self, "_error", None)
+        object.__setattr__(self, "_load_seconds", None)
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def load(self) -> Any:
+        """The service, built on the first call. Raises the factory's exception if building failed."""
+        instance = self._instance
+        if instance is not None:
+            return instance
+        with self._lock:
+            if self._instance is not None:
+                return self._instance
+            object.__setattr__(self, "_state", "loading")
+            start = time.time()
+            logger.info(f"Loading {self._name}...")
+            try:
+                instance = self._factory()
+            except Exception as e:
+                object.__setattr__(self, "_state", "failed")
+                object.__setattr__(self, "_error", str(e))
+                logger.error(f"Failed to load {self._name}: {e}\n{traceback.format_exc()}")
+                raise
+            callbacks: List[Callable] = list(self._callbacks)
+            self._callbacks.clear()
+            for callback in callbacks:
+                self._run_callback(instance, callback)
+            object.__setattr__(self, "_instance", instance)
+            object.__setattr__(self, "_state", "ready")
+            object.__setattr__(self, "_error", None)
+            object.__setattr__(self, "_load_seconds", time.time() - start)
+            logger.info(f"{self._name} loaded in {self._load_seconds:.2f}s")
+            return instance
+
+    async def ready(self) -> Any:
+        """The service, built on a worker thread if needed so the event loop keeps running."""
+        if self._instance is not None:
+            return self._instance
+        return await asyncio.get_running_loop().run_in_executor(None, self.load)
+
+    async def warm_up(self):
+        """
+        Build the service and run its warm-up call. Failures are logged, not raised.
+
+        The lock is only held while building, so when_loaded callbacks (e.g. settings changes)
+        don't wait for the warm-up inference.
+        """
+        try:
+            instance = await self.ready()
+        except Exception:
+            return
+        if self._warmup is None:
+            return
+        object.__setattr__(self, "_state", "warming_up")
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(None, self._warmup, instance)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.warning(f"{self._name} warm-up failed (non-critical): {e}")
+        object.__setattr__(self, "_state", "ready")
+
+    def when_loaded(self, callback: Callable[[Any], None]):
+        """Run callback with the service now if it is loaded, otherwise right after it is built."""
+        with self._lock:
+            if self._instance is None:
+                self._callbacks.append(callback)
+                return
+        self._run_callback(self._instance, callback)
+
+    def _run_callback(self, instance, callback):
+        try:
+            callback(instance)
+        except Exception as e:
+            logger.error(f"Failed to configure {self._name}: {e}", exc_info=True)
+
+    def status(self) -> dict:
+        return {
+            "state": self._state,
+            "ready": self._state == "ready",
+            "error": self._error,
+            "load_seconds": self._load_seconds,
+        }
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.load(), name, value)
@@ -123,7 +123,7 @@ export function LLMMonitor() {
               <h3 className="font-medium mb-2">Current Vision Input</h3>
               <div className="relative">
                 <img
-                  src={`data:image/png;base64,${currentImage}`}
+                  src={currentImage}
                   alt="Current vision input"
                   className="w-full max-w-full rounded-lg border shadow-sm"
                 />
@@ -24,6 +24,7 @@ interface MonitorInfo {
 interface ScreenshotResponse {
   success: boolean;
   image: string;
+  mime_type: string;
   caption: string;
   extracted_text: string;
   ocr_count: number;
@@ -132,7 +133,7 @@ export function VisionManager({ className }: VisionManagerProps) {
       if (data.success) {
         setResponse(data);
         chatManager.setVisionPrompt(data.caption);
-        chatManager.setCurrentImage(data.image);
+        chatManager.setCurrentImage(`data:${data.mime_type};base64,${data.image}`);
         if (!skipOcr) {
           chatManager.setOcrPrompt(data.extracted_text);
         } else {
@@ -353,7 +354,7 @@ export function VisionManager({ className }: VisionManagerProps) {
                 <CardContent>
                   <div className="relative">
                     <img
-                      src={`data:image/png;base64,${response.image}`}
+                      src={`data:${response.mime_type};base64,${response.image}`}
                       alt="Screenshot"
                       className="w-full max-w-full rounded-lg border shadow-sm"
                     />
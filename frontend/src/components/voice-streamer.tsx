@@ -18,6 +18,7 @@ export default function VoiceStreamer() {
   const [isRecording, setIsRecording] = useState(false);
   const [probability, setProbability] = useState<number | null>(null);
   const [transcriptions, setTranscriptions] = useState<string[]>([]);
+  const [partial, setPartial] = useState<string>("");
   const socketRef = useRef<WebSocket | null>(null);
 
   useEffect(() => {
@@ -51,7 +52,10 @@ export default function VoiceStreamer() {
           pipelineManager.interruptCurrentTask()
         }
         setProbability(data.probability);
+      } else if (data.type === "partial") {
+        setPartial(data.text);
       } else if (data.type === "transcription") {
+        setPartial("");
         pipelineManager.addInputTask(data.text);
         setTranscriptions((prev) => [...prev, data.text]);
       }
@@ -104,6 +108,11 @@ export default function VoiceStreamer() {
                 </TableRow>
               </TableHeader>
               <TableBody>
+                {partial && (
+                  <TableRow>
+                    <TableCell className="italic text-muted-foreground">{partial}</TableCell>
+                  </TableRow>
+                )}
                 {[...transcriptions].reverse().map((text, i) => (
                   <TableRow key={i}>
                     <TableCell className="font-medium">{text}</TableCell>
@@ -154,7 +154,7 @@ export class ChatManager {
                     const contextRes = await fetch('/api/memory/context', {
                         method: 'POST',
                         headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({ text: input, limit: 3 })
+                        body: JSON.stringify({ text: input, limit: 3, session_id: this.sessionId })
                     });
                     if (contextRes.ok) {
                         const contextData = await contextRes.json();
@@ -341,7 +341,7 @@ export class ChatManager {
                 const contextRes = await fetch('/api/memory/context', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ text: lastUserMessage.content, limit: 3 })
+                    body: JSON.stringify({ text: lastUserMessage.content, limit: 3, session_id: this.sessionId })
                 });
                 if (contextRes.ok) {
                     const contextData = await contextRes.json();
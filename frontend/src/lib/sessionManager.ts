@@ -173,10 +173,20 @@ export const reindexAllSessions = async (): Promise<{
             throw new Error('Failed to reindex all sessions');
         }
         
-        const data = await response.json();
+        // Reindexing runs in the background, poll until it finishes
+        let data = await response.json();
+        while (data.running) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const progress = await fetch('/api/chat/reindex-all/progress');
+            if (!progress.ok) {
+                throw new Error('Failed to get reindex progress');
+            }
+            data = await progress.json();
+        }
+        
         return {
-            success: true,
-            message: data.message,
+            success: !data.error,
+            message: data.error || 'Reindexing completed',
             reindexed_count: data.reindexed_count,
             failed_sessions: data.failed_sessions,
             total_sessions: data.total_sessions